@@ -1,17 +1,38 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+import logging
+import math
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import requests
+
+from flask import jsonify, render_template, request, redirect, url_for, flash, session
 from functools import wraps
+from sqlalchemy import func
 from config import (
     ADMIN_USERNAME, ADMIN_PASSWORD, SECRET_KEY,
-    FLASK_HOST, FLASK_PORT
+    FLASK_HOST, FLASK_PORT, ADMIN_PAGE_SIZE, TOP_DEPOSITORS,
+    MIN_GAMES_FOR_WITHDRAWAL, MIN_WINS_FOR_WITHDRAWAL, WITHDRAWAL_BATCH_LIMIT,
+    WEBAPP_URL, LIVE_GAMES_TIMEOUT, LIVE_GAMES_SECRET
 )
-from game_logic import BingoGame, Player
+from database import db, create_db_app
+from logging_setup import configure_logging
+
+configure_logging()
+logger = logging.getLogger(__name__)
 
-app = Flask(__name__)
+app = create_db_app(__name__, "admin")
 app.secret_key = SECRET_KEY
 
-# In-memory storage
-games = []
-players = {}
+from models import User, Transaction, TierRevenue, DepositorTotal, FraudFlag
+from replicas import replica_reads, start_lag_checks
+from summaries import start_summary_refresher
+from withdrawals import approve_withdrawals, reject_withdrawals
+
+# Rollups come from summary tables kept current in the background
+start_summary_refresher(app)
+# Listings read from the replica, if one is configured, while it keeps up
+start_lag_checks(app)
 
 def admin_required(f):
     @wraps(f)
@@ -21,58 +42,151 @@ def admin_required(f):
         return f(*args, **kwargs)
     return decorated_function
 
+def listing_reads():
+    """Read from the replica, unless this admin changed something in the last few seconds."""
+    return replica_reads(wrote_at=session.get('wrote_at'))
+
+def wrote():
+    """Keep this admin's next listings on the primary so they show what was just changed."""
+    session['wrote_at'] = time.time()
+
+def live_games(page: int):
+    """A page of open games from the web app's game store, which only the web process holds; None if unreachable."""
+    try:
+        response = requests.get(f"{WEBAPP_URL}/games/open", params={'page': page, 'per_page': ADMIN_PAGE_SIZE},
+                                headers={'X-Live-Games-Secret': LIVE_GAMES_SECRET or ''},
+                                timeout=LIVE_GAMES_TIMEOUT)
+        response.raise_for_status()
+        data = response.json()
+    except (requests.RequestException, ValueError) as e:
+        logger.warning("Live games unavailable: %s", e)
+        return None
+    pages = max(math.ceil(data['total'] / ADMIN_PAGE_SIZE), 1)
+    return SimpleNamespace(items=data['games'], total=data['total'], active=data['active'], page=page,
+                           pages=pages, has_prev=page > 1, prev_num=page - 1, has_next=page < pages,
+                           next_num=page + 1)
+
 @app.route('/admin/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form.get('username')
         password = request.form.get('password')
-        
+
         if username == ADMIN_USERNAME and password == ADMIN_PASSWORD:
             session['admin_logged_in'] = True
             return redirect(url_for('dashboard'))
         else:
             flash('Invalid credentials')
-            
+
     return render_template('admin/login.html')
 
 @app.route('/admin/dashboard')
 @admin_required
 def dashboard():
-    return render_template(
-        'admin/dashboard.html',
-        players=players,
-        games=games,
-        active_games=len([g for g in games if g.status == "active"]),
-        total_players=len(players)
-    )
-
-@app.route('/admin/game/start', methods=['POST'])
-@admin_required
-def start_game():
-    game_id = request.form.get('game_id')
-    if game_id and games[int(game_id)].start_game():
-        flash('Game started successfully')
-    else:
-        flash('Could not start game')
-    return redirect(url_for('dashboard'))
+    # Open games live only in the web app's game store; the game table holds finished ones
+    games = live_games(max(request.args.get('games_page', 1, type=int), 1))
+
+    with listing_reads():
+        # Pending withdrawals, oldest first
+        withdrawals = (
+            Transaction.query.join(User, Transaction.user_id == User.id).add_entity(User)
+            .filter(Transaction.type == 'withdraw', Transaction.status == 'pending')
+            .order_by(Transaction.created_at)
+            .paginate(page=request.args.get('withdrawals_page', 1, type=int), per_page=ADMIN_PAGE_SIZE,
+                      error_out=False)
+        )
+
+        return render_template(
+            'admin/dashboard.html',
+            games=games,
+            withdrawals=withdrawals,
+            tiers=TierRevenue.query.order_by(TierRevenue.entry_price).all(),
+            top_depositors=DepositorTotal.query.order_by(DepositorTotal.total.desc()).limit(TOP_DEPOSITORS).all(),
+            total_players=db.session.query(func.count(User.id)).scalar(),
+            active_games=games.active if games is not None else None,
+            open_flags=db.session.query(func.count(FraudFlag.id)).filter(FraudFlag.dismissed_at.is_(None)).scalar()
+        )
 
 @app.route('/admin/withdrawal/approve', methods=['POST'])
 @admin_required
 def approve_withdrawal():
-    user_id = request.form.get('user_id')
-    amount = float(request.form.get('amount'))
-    
-    if user_id in players:
-        player = players[user_id]
-        if player.balance >= amount:
-            player.balance -= amount
-            flash('Withdrawal approved')
-        else:
-            flash('Insufficient balance')
-    else:
-        flash('Player not found')
-        
+    result = approve_withdrawals(request.form.getlist('transaction_id', type=int))
+    wrote()
+    flash('Withdrawal approved' if result['approved'] else 'Withdrawal not approved: insufficient balance, '
+          'too few games or wins, or already processed')
     return redirect(url_for('dashboard'))
 
+@app.route('/admin/withdrawals', methods=['GET', 'POST'])
+@admin_required
+def withdrawal_queue():
+    if request.method == 'POST':
+        ids = request.form.getlist('transaction_id', type=int)
+        wrote()
+        try:
+            if request.form.get('action') == 'reject':
+                result = reject_withdrawals(ids, request.form.get('note') or None)
+                flash(f"Rejected {len(result['rejected'])} withdrawals")
+            else:
+                result = approve_withdrawals(ids)
+                flash(f"Approved {len(result['approved'])} withdrawals")
+            if result['skipped']:
+                flash(f"Skipped {len(result['skipped'])}: already processed or not eligible")
+        except ValueError as e:
+            flash(str(e))
+        return redirect(url_for('withdrawal_queue', page=request.args.get('page', 1, type=int)))
+
+    # Eligibility is shown for guidance; approve_withdrawals() enforces it
+    with listing_reads():
+        withdrawals = (
+            Transaction.query.join(User, Transaction.user_id == User.id).add_entity(User)
+            .filter(Transaction.type == 'withdraw', Transaction.status == 'pending')
+            .order_by(Transaction.created_at)
+            .paginate(page=request.args.get('page', 1, type=int), per_page=WITHDRAWAL_BATCH_LIMIT,
+                      error_out=False)
+        )
+        return render_template(
+            'admin/withdrawals.html',
+            withdrawals=withdrawals,
+            min_games=MIN_GAMES_FOR_WITHDRAWAL,
+            min_wins=MIN_WINS_FOR_WITHDRAWAL
+        )
+
+@app.route('/admin/fraud', methods=['GET', 'POST'])
+@admin_required
+def fraud_flags():
+    if request.method == 'POST':
+        ids = request.form.getlist('flag_id', type=int)
+        dismissed = FraudFlag.query.filter(FraudFlag.id.in_(ids), FraudFlag.dismissed_at.is_(None)) \
+            .update({FraudFlag.dismissed_at: datetime.utcnow()}, synchronize_session=False)
+        db.session.commit()
+        wrote()
+        flash(f"Dismissed {dismissed} flags")
+        return redirect(url_for('fraud_flags', page=request.args.get('page', 1, type=int)))
+
+    # Open flags raised by fraud.py, newest first
+    with listing_reads():
+        flags = FraudFlag.query.filter(FraudFlag.dismissed_at.is_(None)).order_by(FraudFlag.created_at.desc()) \
+            .paginate(page=request.args.get('page', 1, type=int), per_page=ADMIN_PAGE_SIZE, error_out=False)
+        return render_template('admin/fraud.html', flags=flags)
+
+@app.route('/admin/api/withdrawals/<action>', methods=['POST'])
+@admin_required
+def withdrawals_api(action):
+    """Approve or reject a batch: {"ids": [...], "note": "..."}."""
+    data = request.get_json(silent=True) or {}
+    ids = data.get('ids')
+    if action not in ('approve', 'reject') or not isinstance(ids, list):
+        return jsonify({'error': 'POST {"ids": [...]} to /approve or /reject'}), 400
+    note = data.get('note')
+    if note is not None and not isinstance(note, str):
+        return jsonify({'error': 'note must be a string'}), 400
+    wrote()
+    try:
+        if action == 'approve':
+            return jsonify(approve_withdrawals(ids))
+        return jsonify(reject_withdrawals(ids, note))
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+
 if __name__ == '__main__':
     app.run(host=FLASK_HOST, port=FLASK_PORT, debug=True)
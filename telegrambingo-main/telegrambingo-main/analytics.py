@@ -0,0 +1,240 @@
+import argparse
+import csv
+import gzip
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterator, Tuple
+
+from sqlalchemy import func, select
+
+from config import EXPORT_CHUNK, EXPORT_DIR, EXPORT_RESCAN_SECONDS
+from database import db
+from models import ArchivePart, Game, GameParticipant, Transaction
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+CHECKPOINT = "checkpoint.json"
+
+GAMES = Game.__table__
+PARTICIPANTS = GameParticipant.__table__
+TRANSACTIONS = Transaction.__table__
+LEDGER_TYPES = ('deposit', 'withdraw', 'game_entry', 'win')
+
+# Report -> (key columns, additive value columns), each as (name, parser)
+REPORTS = {
+    "tiers": ((("day", date.fromisoformat), ("entry_price", float)),
+              (("games", int), ("cartelas", int), ("stakes", float), ("pool", float), ("payout", float))),
+    "ledger": ((("day", date.fromisoformat), ("type", str)),
+               (("count", int), ("amount", float))),
+}
+
+
+def _stream(query, chunk: int) -> Iterator[list]:
+    """Yield a query's rows in lists of `chunk`, from a server-side cursor where the driver has one."""
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk).execute(query)
+        yield from result.partitions()
+
+
+def aggregate_games(since: datetime, upto: datetime, chunk: int = EXPORT_CHUNK) -> Tuple[Dict, int]:
+    """Per (day, tier) totals of games finished in [since, upto], and the number of games read.
+
+    Games are the rows app.record_game stores when a game is settled. A game's stakes
+    are its cartelas times the entry price; its pool is paid out when it has a winner,
+    and what isn't paid out is the house's.
+    """
+    cartelas = select(func.count()).where(PARTICIPANTS.c.game_id == GAMES.c.id).scalar_subquery()
+    query = select(GAMES.c.finished_at, GAMES.c.entry_price, GAMES.c.pool, GAMES.c.winner_id, cartelas).where(
+        GAMES.c.status == 'finished', GAMES.c.finished_at >= since, GAMES.c.finished_at <= upto)
+    totals = defaultdict(lambda: [0, 0, 0.0, 0.0, 0.0])
+    rows = 0
+    for part in _stream(query, chunk):
+        rows += len(part)
+        for finished_at, price, pool, winner_id, count in part:
+            total = totals[finished_at.date(), price]
+            total[0] += 1
+            total[1] += count
+            total[2] += count * price
+            total[3] += pool or 0.0
+            if winner_id is not None:
+                total[4] += pool or 0.0
+    return totals, rows
+
+
+def aggregate_ledger(since: datetime, upto: datetime, chunk: int = EXPORT_CHUNK) -> Tuple[Dict, int]:
+    """Per (day, type) count and amount of transactions completed in [since, upto], and the number read."""
+    query = select(TRANSACTIONS.c.completed_at, TRANSACTIONS.c.type, TRANSACTIONS.c.amount).where(
+        TRANSACTIONS.c.type.in_(LEDGER_TYPES), TRANSACTIONS.c.status == 'completed',
+        TRANSACTIONS.c.completed_at >= since, TRANSACTIONS.c.completed_at <= upto)
+    totals = defaultdict(lambda: [0, 0.0])
+    rows = 0
+    for part in _stream(query, chunk):
+        rows += len(part)
+        for completed_at, kind, amount in part:
+            total = totals[completed_at.date(), kind]
+            total[0] += 1
+            total[1] += amount
+    return totals, rows
+
+
+def _replace(path: str, write) -> None:
+    """Write a file through a temporary name so readers never see it half-written."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+def _months(start: date, end: date) -> Iterator[str]:
+    """Every month from start's to end's, as YYYY-MM."""
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        yield f"{year:04d}-{month:02d}"
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def _replace_days(report: str, month: str, first_day: date, totals: Dict[tuple, list]) -> None:
+    """Replace a report month's rows from first_day on with freshly counted totals, rewriting the file."""
+    keys, values = REPORTS[report]
+    path = os.path.join(EXPORT_DIR, report, f"{month}.csv.gz")
+    rows = {}
+    if os.path.exists(path):
+        with gzip.open(path, "rt", newline="") as f:
+            for row in csv.DictReader(f):
+                key = tuple(parse(row[name]) for name, parse in keys)
+                if key[0] < first_day:
+                    rows[key] = [parse(row[name]) for name, parse in values]
+    rows.update(totals)
+    if not rows and not os.path.exists(path):
+        return
+
+    def write(tmp):
+        with gzip.open(tmp, "wt", newline="") as f:
+            writer = csv.writer(f)
+            header = [name for name, _ in keys + values]
+            writer.writerow(header + ["house", "house_edge"] if report == "tiers" else header)
+            for key in sorted(rows):
+                total = [round(value, 2) if isinstance(value, float) else value for value in rows[key]]
+                line = [key[0].isoformat(), *key[1:], *total]
+                if report == "tiers":
+                    stakes, payout = rows[key][2], rows[key][4]
+                    line += [round(stakes - payout, 2), round((stakes - payout) / stakes, 4) if stakes else ""]
+                writer.writerow(line)
+
+    _replace(path, write)
+
+
+def _load_checkpoint() -> dict:
+    path = os.path.join(EXPORT_DIR, CHECKPOINT)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_checkpoint(state: dict) -> None:
+    def write(tmp):
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    _replace(os.path.join(EXPORT_DIR, CHECKPOINT), write)
+
+
+def run_export(chunk: int = EXPORT_CHUNK) -> Dict[str, object]:
+    """Recount the days since shortly before the last export and replace them in the report files.
+
+    The checkpoint holds the time exported up to. Each run counts again from the start
+    of the day EXPORT_RESCAN_SECONDS before it, so a row committed after a run with an
+    earlier timestamp is still counted by a later one. Days are replaced, never added
+    to, so a rerun after a crash cannot count a row twice. Rows archive.py moved out
+    before they were exported are not in the reports.
+    """
+    state = _load_checkpoint()
+    upto = datetime.utcnow()
+    if "upto" in state:
+        start = datetime.fromisoformat(state["upto"]) - timedelta(seconds=EXPORT_RESCAN_SECONDS)
+        since = datetime(start.year, start.month, start.day)
+    else:
+        since = EPOCH
+
+    archived = db.session.execute(select(func.max(ArchivePart.month))).scalar()
+    if archived is not None and archived >= datetime(since.year, since.month, 1):
+        logger.warning("Months up to %s were archived before they were exported and are missing from the reports",
+                       f"{archived:%Y-%m}")
+    db.session.remove()
+
+    started = time.perf_counter()
+    tiers, games = aggregate_games(since, upto, chunk)
+    ledger, transactions = aggregate_ledger(since, upto, chunk)
+    for report, totals in (("tiers", tiers), ("ledger", ledger)):
+        months = defaultdict(dict)
+        for key, total in totals.items():
+            months[f"{key[0]:%Y-%m}"][key] = total
+        # Days in the window that no longer have rows are cleared too
+        touched = set(months) | (set(_months(since.date(), upto.date())) if since > EPOCH else set())
+        for month in sorted(touched):
+            _replace_days(report, month, since.date(), months.get(month, {}))
+    _save_checkpoint({"upto": upto.isoformat()})
+    elapsed = time.perf_counter() - started
+    return {'since': since.isoformat(), 'upto': upto.isoformat(), 'games': games,
+            'transactions': transactions, 'seconds': round(elapsed, 2)}
+
+
+def read_report(report: str) -> Iterator[Dict[str, str]]:
+    """Stream a report's rows, oldest month first."""
+    directory = os.path.join(EXPORT_DIR, report)
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".csv.gz"):
+            with gzip.open(os.path.join(directory, name), "rt", newline="") as f:
+                yield from csv.DictReader(f)
+
+
+def main():
+    from database import create_db_app
+    from logging_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Export daily tier and ledger reports for finance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="fold everything since the last export into the reports")
+    export.add_argument("--chunk", type=int, default=EXPORT_CHUNK, help="rows per cursor fetch")
+    export.add_argument("--rebuild", action="store_true", help="drop the reports and export from scratch")
+    show = sub.add_parser("show", help="print a report")
+    show.add_argument("report", choices=sorted(REPORTS))
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.command == "show":
+        for index, row in enumerate(read_report(args.report)):
+            if index == 0:
+                print("\t".join(row))
+            print("\t".join(row.values()))
+        return 0
+
+    if args.rebuild:
+        for report in REPORTS:
+            shutil.rmtree(os.path.join(EXPORT_DIR, report), ignore_errors=True)
+        if os.path.exists(os.path.join(EXPORT_DIR, CHECKPOINT)):
+            os.remove(os.path.join(EXPORT_DIR, CHECKPOINT))
+    app = create_db_app(__name__)
+    with app.app_context():
+        result = run_export(args.chunk)
+    rows = result['games'] + result['transactions']
+    print(result)
+    if result['seconds']:
+        print(f"{rows / result['seconds'] * 60:,.0f} rows/min")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,46 +1,115 @@
+from startup import StartupTimer
+startup = StartupTimer("web")
+
+import hmac
 import os
 import random
 import asyncio
 import logging
-from flask import Flask, jsonify, request, session, render_template, redirect, url_for
+import time
+from flask import Response, g, jsonify, request, session, render_template, redirect, url_for
 from datetime import datetime
-from database import db, init_db
-from game_logic import BingoGame
+from typing import Tuple
+from database import db, create_db_app
+from models import Game, GameParticipant, User
+from logging_setup import configure_logging, correlation_id, new_correlation_id
+from sharding import create_game_store
+from fragments import called_boards, render_player_board
+from http_cache import init_http_cache
+from webapp_auth import verify_init_data
+from config import CARTELA_SIZE, DEFAULT_PRIZE_TABLE, LIVE_GAMES_SECRET, PRIZE_TABLES, STATE_MAX_AGE
+import fraud
+import metrics
+import referrals
+
+startup.mark("imports")
 
 # Configure logging
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
-# Create Flask app
-app = Flask(__name__)
+# Create Flask app bound to the database; run migrate.py to create the schema
+app = create_db_app(__name__, "web")
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
-
-# Initialize database
-init_db(app)
-
-# Import models after db initialization
-from models import User, Game, GameParticipant, Transaction
+init_http_cache(app)
+startup.mark("app")
 
 # Game storage (temporary, will be moved to database)
-active_games = {}
+active_games = create_game_store()
+startup.mark("game store")
+referrals.start_referral_engine(app)
+fraud.start_fraud_engine(app)
+
+# Metrics
+metrics.instrument_sqlalchemy()
+REQUEST_SECONDS = metrics.histogram(
+    "bingo_http_request_seconds", "HTTP request latency", ["route", "method", "status"])
+WEBHOOKS_IN_FLIGHT = metrics.gauge(
+    "bingo_webhook_queue_depth", "Deposit webhooks currently being processed")
+ACTIVE_GAMES = metrics.gauge("bingo_active_games", "Games currently active")
+ACTIVE_PLAYERS = metrics.gauge("bingo_active_players", "Players in active games")
+GAME_RECORD_FAILURES = metrics.counter(
+    "bingo_game_record_failures", "Finished games that could not be stored in the game table")
+ACTIVE_GAMES.set_function(lambda: sum(shard.get('active', 0) for shard in active_games.health()))
+ACTIVE_PLAYERS.set_function(lambda: sum(shard.get('players', 0) for shard in active_games.health()))
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.current_handler.set(request.endpoint or "unknown")
+    new_correlation_id(request.headers.get('X-Request-ID'))
+
+@app.after_request
+def record_request_latency(response):
+    started = g.pop('request_started', None)
+    if started is not None and request.url_rule is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, route=request.url_rule.rule,
+                                method=request.method, status=response.status_code)
+    response.headers['X-Request-ID'] = correlation_id.get()
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Expose metrics in the Prometheus text format."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/')
 def index():
     """Show available games or create a new one."""
-    if 'user_id' not in session:
-        session['user_id'] = random.randint(1, 1000000)  # Temporary user ID generation
+    new_guest()
     return render_template('game_lobby.html')
 
+def new_guest():
+    """Give a new visitor a guest id; registered users get theirs from /auth/telegram."""
+    if 'user_id' not in session:
+        # Negative so it can never be taken for a registered user's id
+        session['user_id'] = -random.randint(1, 1000000)
+
+@app.route('/auth/telegram', methods=['POST'])
+def auth_telegram():
+    """Sign a registered player in from the Telegram WebApp initData of the bot's buttons.
+
+    This is the only way a web session gets a registered user's id, so ids sent
+    by the client are never trusted.
+    """
+    data = request.get_json(silent=True)
+    tg_user = verify_init_data(data.get('init_data')) if isinstance(data, dict) else None
+    if tg_user is None:
+        return jsonify({'error': 'Invalid Telegram WebApp data'}), 403
+    user = User.query.filter_by(telegram_id=tg_user['id']).first()
+    if user is None:
+        new_guest()
+        return jsonify({'registered': False})
+    session['user_id'] = user.id
+    return jsonify({'registered': True})
+
 @app.route('/webhook/deposit', methods=['POST'])
 def deposit_webhook():
     """Handle deposit webhook from Tasker"""
     try:
         # Get webhook data
         data = request.get_json()
-        logger.info(f"Received deposit webhook: {data}")
+        logger.info("Received deposit webhook for phone %s", data.get('phone') if data else None)
 
         # Validate required fields
         if not data or 'amount' not in data or 'phone' not in data:
@@ -55,15 +124,21 @@ def deposit_webhook():
         except (ValueError, TypeError):
             return jsonify({'error': 'Invalid amount format'}), 400
 
+        fraud.record(fraud.WEBHOOK, request.remote_addr, data['phone'], amount, fraud.payload_digest(data))
+
         # Process deposit through bot
         from bot import process_deposit_confirmation
-        asyncio.run(process_deposit_confirmation(data))
+        WEBHOOKS_IN_FLIGHT.inc()
+        try:
+            asyncio.run(process_deposit_confirmation(data))
+        finally:
+            WEBHOOKS_IN_FLIGHT.dec()
 
         return jsonify({'status': 'success', 'message': 'Deposit processed successfully'})
 
     except Exception as e:
         error_msg = str(e)
-        logger.exception(f"Error processing webhook: {error_msg}")
+        logger.exception("Error processing webhook: %s", error_msg)
         return jsonify({'error': error_msg}), 500
 
 @app.route('/webhook/test', methods=['POST'])
@@ -71,10 +146,7 @@ def test_webhook():
     """Test endpoint for webhook validation"""
     try:
         data = request.get_json()
-        logger.info(f"Test webhook received: {data}")
-
-        # Log headers for debugging
-        logger.debug(f"Request headers: {dict(request.headers)}")
+        logger.info("Test webhook received")
 
         validation = {
             "format_check": [],
@@ -148,11 +220,11 @@ def test_webhook():
             for checks in validation["format_check"] + validation["data_validation"]
         ) else "invalid"
 
-        logger.info(f"Webhook validation result: {validation}")
+        logger.info("Webhook validation result: %s", validation["status"])
         return jsonify(validation)
 
     except Exception as e:
-        logger.error(f"Error in webhook test: {str(e)}")
+        logger.error("Error in webhook test: %s", e)
         return jsonify({
             "status": "error",
             "error": str(e),
@@ -165,25 +237,26 @@ def create_game():
     try:
         if request.method == 'POST':
             entry_price = int(request.json.get('entry_price', 10))
-            user_id = request.json.get('user_id')
+            prize_table = request.json.get('prize_table', DEFAULT_PRIZE_TABLE)
 
             if entry_price not in [10, 20, 50, 100]:
                 return jsonify({'error': 'Invalid entry price'}), 400
+            if prize_table not in PRIZE_TABLES:
+                return jsonify({'error': 'Invalid prize table'}), 400
 
-            game_id = len(active_games) + 1
-            active_games[game_id] = BingoGame(game_id, entry_price)
-
-            # Store user_id in session for web app
-            session['user_id'] = user_id
+            game_id = active_games.create(entry_price, prize_table)
+            new_guest()
 
             return jsonify({
                 'game_id': game_id,
-                'entry_price': entry_price
+                'entry_price': entry_price,
+                'prize_table': prize_table,
+                'seed_hash': active_games.read(game_id, 'seed_hash')
             })
         else:
             return jsonify({'error': 'Invalid request method'}), 405
     except Exception as e:
-        logger.exception(f"Error creating game: {str(e)}")
+        logger.exception("Error creating game: %s", e)
         return jsonify({'error': 'Failed to create game'}), 500
 
 @app.route('/game/<int:game_id>/select_cartela')
@@ -206,6 +279,28 @@ def select_cartela(game_id):
         used_cartelas=used_cartelas
     )
 
+@app.route('/game/<int:game_id>/join', methods=['POST'])
+def join_game(game_id):
+    """Join a game with the cartela picked on the selection page."""
+    if game_id not in active_games:
+        return jsonify({'error': 'Game not found'}), 404
+
+    user_id = session['user_id']
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON object required'}), 400
+    cartela_number = data.get('cartela_number')
+    if (not isinstance(cartela_number, int) or isinstance(cartela_number, bool)
+            or not 1 <= cartela_number <= CARTELA_SIZE):
+        return jsonify({'error': 'Invalid cartela number'}), 400
+
+    if not active_games.has_player(game_id, user_id):
+        board = active_games.apply(game_id, 'add_player', user_id, cartela_number)
+        if not board:
+            return jsonify({'error': 'This cartela is taken or the game is full'}), 409
+        fraud.record(fraud.JOIN, user_id, game_id)
+    return jsonify({'game_id': game_id})
+
 @app.route('/game/<int:game_id>')
 def play_game(game_id):
     """Show the game interface."""
@@ -217,33 +312,44 @@ def play_game(game_id):
 
     # Add player if they haven't joined
     if user_id not in game.players:
-        board = game.add_player(user_id)
+        board = active_games.apply(game_id, 'add_player', user_id)
         if not board:
             return redirect(url_for('index'))
-
-    player = game.players[user_id]
+        fraud.record(fraud.JOIN, user_id, game_id)
+        game = active_games[game_id]
 
     # Auto-start game if enough players have joined
     if game.status == "waiting" and len(game.players) >= game.min_players:
-        game.start_game()
-        if game.status == "active":
-            game.call_number()  # Call first number automatically
+        active_games.apply(game_id, 'start_game')
+        if active_games.read(game_id, 'status') == "active":
+            active_games.apply(game_id, 'call_number')  # Call first number automatically
+        game = active_games[game_id]
+
+    player = game.players[user_id]
 
     # Get current call number
     current_number = None
     if game.status == "active" and game.called_numbers:
         current_number = game.format_number(game.called_numbers[-1])
 
-    return render_template('game.html',
+    started = time.perf_counter()
+    html = render_template('game.html',
                          game_id=game_id,
                          game=game,
-                         board=player['board'],
-                         marked=player['marked'],
+                         cartela_number=player['cartela_number'],
+                         player_board=render_player_board(player['cartela_number'], player['marked']),
+                         called_board=called_boards.render(game_id, game.called_numbers),
                          called_numbers=game.called_numbers,
                          current_number=current_number,
                          active_players=len(game.players),
                          game_status=game.status,
                          entry_price=game.entry_price)
+    render_ms = (time.perf_counter() - started) * 1000
+    logger.debug("Rendered game %s in %.2fms (%d bytes)", game_id, render_ms, len(html))
+
+    response = app.make_response(html)
+    response.headers['Server-Timing'] = f'render;dur={render_ms:.2f}'
+    return response
 
 @app.route('/game/<int:game_id>/call', methods=['POST'])
 def call_number(game_id):
@@ -251,60 +357,177 @@ def call_number(game_id):
     if game_id not in active_games:
         return jsonify({'error': 'Game not found'}), 404
 
-    game = active_games[game_id]
-    if game.status != "active":
+    if active_games.read(game_id, 'status') != "active":
         return jsonify({'error': 'Game not active'}), 400
 
-    number = game.call_number()
+    number = active_games.apply(game_id, 'call_number')
     if number:
         return jsonify({
             'number': number,
-            'called_numbers': game.called_numbers
+            'called_numbers': active_games.read(game_id, 'called_numbers')
         })
     return jsonify({'error': 'No more numbers to call'}), 400
 
+@app.route('/game/<int:game_id>/state')
+def game_state(game_id):
+    """Return the calls made after the client's `since` cursor."""
+    if game_id not in active_games:
+        return jsonify({'error': 'Game not found'}), 404
+
+    try:
+        since = max(int(request.args.get('since', 0)), 0)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    cursor, calls, status, winner_id = active_games.apply(game_id, 'state_since', since)
+    etag = f'{game_id}-{cursor}-{status}-{winner_id or 0}'
+
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        state = {'cursor': cursor, 'calls': calls, 'status': status, 'winner': winner_id}
+        if status == 'finished':
+            state['seed'] = active_games.read(game_id, 'revealed_seed')
+        response = jsonify(state)
+
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = STATE_MAX_AGE
+    return response
+
+def linked_users(user_ids) -> set:
+    """The ids among `user_ids` that belong to registered users, leaving out web guests.
+
+    A web player only holds a positive id after /auth/telegram verified it.
+    """
+    ids = [user_id for user_id in user_ids if isinstance(user_id, int) and user_id > 0]
+    if not ids:
+        return set()
+    return {user_id for user_id, in db.session.query(User.id).filter(User.id.in_(ids))}
+
+def record_game(game, linked: set):
+    """Store a finished game with its seed commitment and revealed seed, for `fairness.py verify`.
+
+    The row gets its own id; the store's game id is per process and restarts, so it is kept in
+    store_id. Only the registered players in `linked` are stored as participants.
+    """
+    try:
+        row = Game(store_id=game.game_id, status=game.status, entry_price=game.entry_price, pool=game.pool,
+                   called_numbers=','.join(map(str, game.called_numbers)),
+                   winner_id=game.winner_id if game.winner_id in linked else None,
+                   created_at=game.created_at, finished_at=game.finished_at,
+                   seed_hash=game.seed_hash, seed=game.revealed_seed)
+        db.session.add(row)
+        db.session.flush()
+        db.session.add_all(GameParticipant(game_id=row.id, user_id=user_id,
+                                           cartela_number=player.cartela_number,
+                                           marked_numbers=','.join(map(str, player.marked)))
+                           for user_id, player in game.players.items() if user_id in linked)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        GAME_RECORD_FAILURES.inc()
+        logger.exception("Failed to record game %s", game.game_id)
+
+def settle_game(game_id: int, winner_id: int):
+    """End a game, record it, and report its registered players' finished game to the referral engine."""
+    active_games.apply(game_id, 'end_game', winner_id)
+    called_boards.discard(game_id)
+    game = active_games[game_id]
+    try:
+        linked = linked_users(game.players)
+    except Exception:
+        db.session.rollback()
+        GAME_RECORD_FAILURES.inc()
+        logger.exception("Failed to look up the players of game %s", game_id)
+        return
+    record_game(game, linked)
+    # Guests have no account to credit; their session ids must not be taken for user ids
+    referrals.record(referrals.GAME, linked)
+
+def claim_prize(game_id: int, user_id: int) -> Tuple[bool, str]:
+    """Award the player's completed prize tiers; the last tier won ends the game."""
+    last_call = active_games.read(game_id, 'last_call_time')
+    fraud.record(fraud.CLAIM, user_id, game_id,
+                 (datetime.utcnow() - last_call).total_seconds() if last_call is not None else None)
+    winner, message = active_games.apply(game_id, 'claim', user_id)
+    if winner and active_games.apply(game_id, 'is_complete'):
+        settle_game(game_id, user_id)
+    return winner, message
+
 @app.route('/game/<int:game_id>/mark', methods=['POST'])
 def mark_number(game_id):
     """Mark a number on the player's board."""
     if game_id not in active_games:
         return jsonify({'error': 'Game not found'}), 404
 
-    game = active_games[game_id]
     user_id = session['user_id']
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'JSON object required'}), 400
 
-    if user_id not in game.players:
+    if not active_games.has_player(game_id, user_id):
         return jsonify({'error': 'Player not in game'}), 400
 
     # Handle bingo check request
-    check_win = request.json.get('check_win', False)
+    check_win = data.get('check_win', False)
     if check_win:
-        winner, message = game.check_winner(user_id)
-        if winner:
-            game.end_game(user_id)
+        winner, message = claim_prize(game_id, user_id)
         return jsonify({
             'winner': winner,
             'message': message
         })
 
     # Handle number marking
-    number = request.json.get('number')
-    if not number:
+    number = data.get('number')
+    if number is None:
         return jsonify({'error': 'Number required'}), 400
+    if not isinstance(number, int) or isinstance(number, bool) or not 1 <= number <= 75:
+        return jsonify({'error': 'Invalid number'}), 400
 
-    success = game.mark_number(user_id, number)
+    success = active_games.apply(game_id, 'mark_number', user_id, number)
     if not success:
         return jsonify({'error': 'Could not mark number'}), 400
+    fraud.record(fraud.MARK, user_id, game_id)
 
     # Check for win after marking
-    winner, message = game.check_winner(user_id)
+    winner, message = active_games.apply(game_id, 'check_winner', user_id)
     if winner:
-        game.end_game(user_id)
+        winner, message = claim_prize(game_id, user_id)
 
     return jsonify({
-        'marked': game.players[user_id]['marked'],
+        'marked': active_games.apply(game_id, 'player_marks', user_id),
         'winner': winner,
         'message': message
     })
 
+@app.route('/games/open')
+def open_games():
+    """Page through the waiting and active games, newest first, for the admin dashboard.
+
+    Only for callers holding LIVE_GAMES_SECRET; refused to everyone while it is unset.
+    """
+    secret = request.headers.get('X-Live-Games-Secret', '')
+    if not LIVE_GAMES_SECRET or not hmac.compare_digest(secret.encode(), LIVE_GAMES_SECRET.encode()):
+        return jsonify({'error': 'Forbidden'}), 403
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+    games = sorted(active_games.open_games(), key=lambda game: game['id'], reverse=True)
+    return jsonify({
+        'games': games[(page - 1) * per_page:page * per_page],
+        'total': len(games),
+        'active': sum(game['status'] == 'active' for game in games),
+    })
+
+@app.route('/health/shards')
+def shard_health():
+    """Report the health of every game shard."""
+    report = active_games.health()
+    status = 200 if all(shard['alive'] for shard in report) else 503
+    return jsonify({'shards': report}), status
+
+startup.mark("routes")
+startup.report()
+
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,270 @@
+import argparse
+import csv
+import gzip
+import logging
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional
+
+from sqlalchemy import bindparam, delete, func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+
+import metrics
+from config import ARCHIVE_BATCH, ARCHIVE_DIR, ARCHIVE_INTERVAL, ARCHIVE_KEEP_MONTHS, ARCHIVE_LEASE_SECONDS
+from database import db
+from models import ArchivePart, Game, GameParticipant, JobLease, Transaction
+
+logger = logging.getLogger(__name__)
+
+ARCHIVED_ROWS = metrics.counter("bingo_archived_rows", "Rows moved from the database to archive files", ["table"])
+
+TRANSACTIONS = Transaction.__table__
+GAMES = Game.__table__
+PARTICIPANTS = GameParticipant.__table__
+# Names _move() gives its files, with the .tmp of a write in progress; nothing else in ARCHIVE_DIR is ours
+ARCHIVE_FILE = re.compile(r"(%s)/\d{4}-\d{2}/\d+-\d+\.csv\.gz(\.tmp)?" % "|".join(
+    re.escape(table.name) for table in (TRANSACTIONS, GAMES, PARTICIPANTS)))
+LEASE = "archive"
+
+
+def add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1)
+
+
+def horizon(now: Optional[datetime] = None, keep: int = ARCHIVE_KEEP_MONTHS) -> datetime:
+    """Start of the oldest month kept in the database; every month before it is closed."""
+    now = now or datetime.utcnow()
+    return add_months(datetime(now.year, now.month, 1), -keep)
+
+
+def _write(path: str, columns: List[str], rows) -> None:
+    """Write rows as gzip CSV, durably, under their final name."""
+    full = os.path.join(ARCHIVE_DIR, path)
+    os.makedirs(os.path.dirname(full), exist_ok=True)
+    tmp = full + ".tmp"
+    with gzip.open(tmp, "wt", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, full)
+
+
+def _move(month: datetime, parts: Dict[str, tuple]):
+    """Write each table's rows to a file, then delete them and record the files in one transaction.
+
+    `parts` maps a table to its (columns, rows) and is deleted from in order.
+    A crash after the files are written but before the commit leaves them
+    unrecorded; remove_orphans() clears them and the rows are moved again.
+    """
+    written = []
+    try:
+        for table, (columns, rows) in parts.items():
+            path = f"{table.name}/{month:%Y-%m}/{rows[0].id}-{rows[-1].id}.csv.gz"
+            _write(path, columns, rows)
+            written.append(path)
+            db.session.execute(delete(table).where(table.c.id.in_(bindparam("ids", expanding=True))),
+                               {"ids": [row.id for row in rows]})
+            db.session.add(ArchivePart(source=table.name, month=month, path=path, rows=len(rows)))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        for path in written:
+            os.remove(os.path.join(ARCHIVE_DIR, path))
+        raise
+    for table, (_, rows) in parts.items():
+        ARCHIVED_ROWS.inc(len(rows), table=table.name)
+
+
+def _months(column, condition, before: datetime) -> List[datetime]:
+    """Closed months that still hold rows matching `condition`, oldest first."""
+    oldest = db.session.execute(select(func.min(column)).where(condition, column < before)).scalar()
+    months = []
+    month = datetime(oldest.year, oldest.month, 1) if oldest is not None else before
+    while month < before:
+        months.append(month)
+        month = add_months(month, 1)
+    return months
+
+
+def acquire_lease(name: str, holder: str, seconds: float) -> bool:
+    """Take or extend the named lease for `holder` unless another holder's is still live."""
+    now = datetime.utcnow()
+    expires_at = now + timedelta(seconds=seconds)
+    try:
+        taken = db.session.execute(
+            update(JobLease)
+            .where(JobLease.name == name, or_(JobLease.holder == holder, JobLease.expires_at < now))
+            .values(holder=holder, expires_at=expires_at)
+        ).rowcount
+        if not taken and db.session.get(JobLease, name) is None:
+            db.session.add(JobLease(name=name, holder=holder, expires_at=expires_at))
+            taken = 1
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()  # another process inserted it first
+        return False
+    return bool(taken)
+
+
+def release_lease(name: str, holder: str):
+    db.session.execute(delete(JobLease).where(JobLease.name == name, JobLease.holder == holder))
+    db.session.commit()
+
+
+def archive_transactions(before: datetime, batch: int = ARCHIVE_BATCH,
+                         on_batch: Callable[[], None] = lambda: None) -> int:
+    """Move settled transactions created before `before` to archive files; pending ones stay."""
+    settled = TRANSACTIONS.c.status != 'pending'
+    columns = [column.name for column in TRANSACTIONS.columns]
+    moved = 0
+    for month in _months(TRANSACTIONS.c.created_at, settled, before):
+        query = (select(TRANSACTIONS)
+                 .where(settled, TRANSACTIONS.c.created_at >= month,
+                        TRANSACTIONS.c.created_at < add_months(month, 1))
+                 .order_by(TRANSACTIONS.c.id).limit(batch))
+        while rows := db.session.execute(query).all():
+            _move(month, {TRANSACTIONS: (columns, rows)})
+            moved += len(rows)
+            on_batch()
+    return moved
+
+
+def archive_games(before: datetime, batch: int = ARCHIVE_BATCH,
+                  on_batch: Callable[[], None] = lambda: None) -> int:
+    """Move games finished before `before`, with their participants, to archive files."""
+    finished = GAMES.c.status == 'finished'
+    game_columns = [column.name for column in GAMES.columns]
+    participant_columns = [column.name for column in PARTICIPANTS.columns]
+    moved = 0
+    for month in _months(GAMES.c.finished_at, finished, before):
+        query = (select(GAMES)
+                 .where(finished, GAMES.c.finished_at >= month, GAMES.c.finished_at < add_months(month, 1))
+                 .order_by(GAMES.c.id).limit(batch))
+        while games := db.session.execute(query).all():
+            participants = db.session.execute(
+                select(PARTICIPANTS).where(PARTICIPANTS.c.game_id.in_([game.id for game in games]))
+                .order_by(PARTICIPANTS.c.id)).all()
+            parts = {PARTICIPANTS: (participant_columns, participants)} if participants else {}
+            parts[GAMES] = (game_columns, games)
+            _move(month, parts)
+            moved += len(games)
+            on_batch()
+    return moved
+
+
+def remove_orphans() -> int:
+    """Delete files left by a run that crashed before recording them; their rows are still in the database.
+
+    Only files named like the archiver's own are considered, so a shared ARCHIVE_DIR is safe.
+    """
+    if not os.path.isdir(ARCHIVE_DIR):
+        return 0
+    recorded = set(db.session.execute(select(ArchivePart.path)).scalars())
+    removed = 0
+    for root, _, files in os.walk(ARCHIVE_DIR):
+        for name in files:
+            path = os.path.relpath(os.path.join(root, name), ARCHIVE_DIR).replace(os.sep, "/")
+            if ARCHIVE_FILE.fullmatch(path) and path not in recorded:
+                os.remove(os.path.join(root, name))
+                removed += 1
+    return removed
+
+
+def run_archive(keep: int = ARCHIVE_KEEP_MONTHS) -> Optional[Dict[str, int]]:
+    """Move every closed month out of the database.
+
+    Runs under a lease row, so with several bot instances only one archives at a
+    time; returns None if another process holds it.
+    """
+    holder = f"{socket.gethostname()}:{os.getpid()}"
+    if not acquire_lease(LEASE, holder, ARCHIVE_LEASE_SECONDS):
+        return None
+
+    def renew():
+        if not acquire_lease(LEASE, holder, ARCHIVE_LEASE_SECONDS):
+            raise RuntimeError("Archive lease lost to another process")
+
+    try:
+        before = horizon(keep=keep)
+        orphans = remove_orphans()
+        if orphans:
+            logger.warning("Removed %d unrecorded archive files from an interrupted run", orphans)
+        return {'before': before.date().isoformat(), 'transactions': archive_transactions(before, on_batch=renew),
+                'games': archive_games(before, on_batch=renew)}
+    finally:
+        release_lease(LEASE, holder)
+
+
+def read_archive(table: str, since: Optional[datetime] = None) -> Iterator[Dict[str, str]]:
+    """Stream the archived rows of a table as dicts of strings, oldest month first."""
+    query = select(ArchivePart.path).where(ArchivePart.source == table)
+    if since is not None:
+        query = query.where(ArchivePart.month >= since)
+    for path in db.session.execute(query.order_by(ArchivePart.month, ArchivePart.id)).scalars():
+        with gzip.open(os.path.join(ARCHIVE_DIR, path), "rt", newline="") as f:
+            yield from csv.DictReader(f)
+
+
+def start_archiver(app, interval: float = ARCHIVE_INTERVAL):
+    """Archive closed months every `interval` seconds in a daemon thread."""
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            started = time.perf_counter()
+            try:
+                with app.app_context():
+                    moved = run_archive()
+                if moved is None:
+                    logger.info("Archive run skipped: another process holds the lease")
+                else:
+                    logger.info("Archived closed months in %.1fs: %s", time.perf_counter() - started, moved)
+            except Exception as e:
+                logger.error("Archive run failed: %s", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="archiver", daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    from database import create_db_app
+    from logging_setup import configure_logging
+
+    parser = argparse.ArgumentParser(description="Move closed months of transactions and games to archive files")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="archive every closed month now")
+    run.add_argument("--keep-months", type=int, default=ARCHIVE_KEEP_MONTHS)
+    sub.add_parser("list", help="show archived rows per table and month")
+    args = parser.parse_args()
+
+    configure_logging()
+    app = create_db_app(__name__)
+    with app.app_context():
+        if args.command == "run":
+            moved = run_archive(args.keep_months)
+            if moved is None:
+                print("Another process is archiving; try again later")
+                return 1
+            print(moved)
+        else:
+            rows = db.session.execute(
+                select(ArchivePart.source, ArchivePart.month, func.count(), func.sum(ArchivePart.rows))
+                .group_by(ArchivePart.source, ArchivePart.month).order_by(ArchivePart.source, ArchivePart.month))
+            for source, month, files, total in rows:
+                print(f"{source:<20}{month:%Y-%m}{files:>8} files{total:>12} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+
+
+def seed(months: int, users: int, per_month: int):
+    """`months` of settled history for every user, a few pending deposits, and finished games."""
+    from archive import add_months
+    from database import db
+    from models import Game, GameParticipant, Transaction, User
+
+    rng = random.Random(months)
+    now = datetime.utcnow()
+    current = datetime(now.year, now.month, 1)
+    db.session.execute(insert(User), [{"id": i, "telegram_id": 10 ** 9 + i, "balance": 0.0}
+                                      for i in range(1, users + 1)])
+    game_id = participant_id = 0
+    for back in range(months, -1, -1):
+        start = add_months(current, -back)
+        span = ((add_months(start, 1) if back else now) - start).total_seconds()
+        stamp = lambda: start + timedelta(seconds=rng.random() * span)
+        rows = []
+        for user_id in range(1, users + 1):
+            for _ in range(per_month):
+                kind = rng.choice(("deposit", "game_entry", "win"))
+                created = stamp()
+                rows.append({"user_id": user_id, "type": kind, "amount": rng.choice((10, 20, 50, 100)),
+                             "status": "completed", "created_at": created, "completed_at": created,
+                             "sms_text": f"Dear customer, you have received {rng.randint(10, 1000)} birr "
+                                         f"ref {rng.getrandbits(48):x}" if kind == "deposit" else None})
+        rows.extend({"user_id": rng.randint(1, users), "type": "deposit", "amount": 50, "status": "pending",
+                     "created_at": stamp()} for _ in range(users // 20))
+        db.session.execute(insert(Transaction), rows)
+        games, participants = [], []
+        for _ in range(users // 10):
+            game_id += 1
+            finished = stamp()
+            games.append({"id": game_id, "status": "finished", "entry_price": 10, "pool": 100,
+                          "created_at": finished - timedelta(minutes=5), "finished_at": finished})
+            for cartela in range(1, 11):
+                participant_id += 1
+                participants.append({"id": participant_id, "game_id": game_id,
+                                     "user_id": rng.randint(1, users), "cartela_number": cartela})
+        db.session.execute(insert(Game), games)
+        db.session.execute(insert(GameParticipant), participants)
+    db.session.commit()
+
+
+def sizes() -> dict:
+    """MiB of the transaction table and of its indexes."""
+    from database import db
+    rows = db.session.execute(text("SELECT name, SUM(pgsize) FROM dbstat GROUP BY name")).all()
+    table = sum(size for name, size in rows if name == "transaction")
+    indexes = sum(size for name, size in rows if name.startswith(("ix_transaction", "sqlite_autoindex_transaction")))
+    return {"table_mib": table / 2 ** 20, "index_mib": indexes / 2 ** 20}
+
+
+def lookups(users: int, count: int) -> dict:
+    """Latency of the deposit webhook's pending-deposit lookup."""
+    from database import db
+    from models import Transaction
+
+    rng = random.Random(1)
+    times = []
+    for _ in range(count):
+        user_id = rng.randint(1, users)
+        started = time.perf_counter()
+        Transaction.query.filter_by(user_id=user_id, type='deposit', status='pending', amount=50) \
+            .order_by(Transaction.created_at.desc()).first()
+        times.append(time.perf_counter() - started)
+        db.session.remove()
+    return {"p50_us": statistics.median(times) * 1e6, "p99_us": statistics.quantiles(times, n=100)[98] * 1e6}
+
+
+def run(months: int, args) -> list:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        import archive
+        archive.ARCHIVE_DIR = os.path.join(tmp, "archive")
+        from database import create_db_app, db
+        from migrate import upgrade
+        from models import Transaction
+
+        app = create_db_app(__name__)
+        with app.app_context():
+            upgrade()
+            seed(months, args.users, args.per_month)
+            results = []
+            for phase in ("before", "after"):
+                if phase == "after":
+                    started = time.perf_counter()
+                    moved = archive.run_archive(args.keep_months)
+                    print(f"  archived {moved} in {time.perf_counter() - started:.1f}s")
+                    db.session.remove()
+                    with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                        conn.execute(text("VACUUM"))  # reclaim the space, as autovacuum would on PostgreSQL
+                rows = db.session.query(Transaction).count()
+                results.append(dict(months=months, phase=phase, rows=rows, **sizes(), **lookups(args.users, args.lookups)))
+            db.session.remove()
+            db.engine.dispose()
+        return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Transaction table size and pending-deposit lookups as history grows")
+    parser.add_argument("--months", type=int, nargs="+", default=[6, 24], help="history sizes to compare")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--per-month", type=int, default=5, help="settled transactions per user and month")
+    parser.add_argument("--keep-months", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = []
+    for months in args.months:
+        print(f"{months} months of history")
+        results.extend(run(months, args))
+    print(f"{'months':>6} {'phase':<7}{'rows':>10}{'table MiB':>11}{'index MiB':>11}{'p50 us':>9}{'p99 us':>9}")
+    for r in results:
+        print(f"{r['months']:>6} {r['phase']:<7}{r['rows']:>10}{r['table_mib']:>11.1f}{r['index_mib']:>11.1f}"
+              f"{r['p50_us']:>9.0f}{r['p99_us']:>9.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.pool import NullPool
+
+from database import TimedQueuePool, engine_options
+
+# Options every process used before pools were tuned per role
+DEFAULT_OPTIONS = {"pool_recycle": 300, "pool_pre_ping": True}
+
+QUERY = text("SELECT id, balance FROM bench_users WHERE id = :id")
+
+
+def profiles(url: str) -> dict:
+    options = {"default": DEFAULT_OPTIONS}
+    for role in ("web", "bot", "admin", "worker"):
+        options[role] = engine_options(role, url)
+    options["nullpool"] = {"poolclass": NullPool}
+    return options
+
+
+def setup(url: str, rows: int = 1000):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        conn.execute(text("DROP TABLE IF EXISTS bench_users"))
+        conn.execute(text("CREATE TABLE bench_users (id INTEGER PRIMARY KEY, balance FLOAT)"))
+        conn.execute(text("INSERT INTO bench_users (id, balance) VALUES (:id, 0)"),
+                     [{"id": i} for i in range(rows)])
+    engine.dispose()
+
+
+def run(url: str, options: dict, threads: int, ops: int, hold: float) -> dict:
+    """Run `threads` workers, each checking out a connection `ops` times for one query plus `hold` seconds."""
+    engine = create_engine(url, **options)
+    opened = []
+    event.listen(engine, "connect", lambda dbapi_connection, record: opened.append(1))
+    with engine.connect() as conn:
+        conn.execute(QUERY, {"id": 0})  # warm the dialect and first connection
+    waits, latencies, errors = [], [], []
+    lock = threading.Lock()
+    start = threading.Barrier(threads + 1)
+
+    def worker(offset: int):
+        own_waits, own_latencies, own_errors = [], [], 0
+        start.wait()
+        for i in range(ops):
+            began = time.perf_counter()
+            try:
+                with engine.connect() as conn:
+                    own_waits.append(time.perf_counter() - began)
+                    conn.execute(QUERY, {"id": (offset + i) % 1000}).all()
+                    if hold:
+                        time.sleep(hold)
+            except Exception:
+                own_errors += 1
+                continue
+            own_latencies.append(time.perf_counter() - began)
+        with lock:
+            waits.extend(own_waits)
+            latencies.extend(own_latencies)
+            errors.append(own_errors)
+
+    workers = [threading.Thread(target=worker, args=(n * ops,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    start.wait()
+    began = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - began
+    engine.dispose()
+
+    def pct(values, q):
+        return statistics.quantiles(values, n=100)[q - 1] * 1000 if len(values) > 1 else 0.0
+
+    return {
+        "ops_per_sec": len(latencies) / elapsed,
+        "wait_mean_ms": statistics.fmean(waits) * 1000 if waits else 0.0,
+        "wait_p50_ms": pct(waits, 50), "wait_p99_ms": pct(waits, 99),
+        "latency_p99_ms": pct(latencies, 99),
+        "errors": sum(errors),
+        "connects": len(opened),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare connection pool profiles under concurrent load")
+    parser.add_argument("--url", default=os.environ.get("BENCH_DATABASE_URL"),
+                        help="database to load (default: a temporary SQLite file); never point at production")
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--ops", type=int, default=200, help="checkouts per thread")
+    parser.add_argument("--hold", type=float, default=0.002,
+                        help="seconds each checkout holds its connection after the query")
+    parser.add_argument("--only", action="append", help="profile to run; repeatable")
+    args = parser.parse_args()
+
+    tmp = None
+    url = args.url
+    if not url:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        url = f"sqlite:///{tmp.name}"
+    setup(url)
+
+    print(f"{args.threads} threads x {args.ops} checkouts, {args.hold * 1000:.1f}ms hold, "
+          f"{url.split('@')[-1]}")
+    print(f"{'profile':<10}{'ops/s':>10}{'wait avg':>10}{'wait p50':>10}{'wait p99':>10}"
+          f"{'lat p99':>10}{'connects':>10}{'errors':>8}")
+    try:
+        for name, options in profiles(url).items():
+            if args.only and name not in args.only:
+                continue
+            if options.get("poolclass") is TimedQueuePool:
+                options = dict(options, role=f"bench-{name}")
+            result = run(url, options, args.threads, args.ops, args.hold)
+            print(f"{name:<10}{result['ops_per_sec']:>10.0f}{result['wait_mean_ms']:>10.2f}"
+                  f"{result['wait_p50_ms']:>10.2f}{result['wait_p99_ms']:>10.2f}{result['latency_p99_ms']:>10.2f}"
+                  f"{result['connects']:>10}{result['errors']:>8}")
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+
+def seed(transactions: int, days: int):
+    """`transactions` completed ledger rows and a game with ten cartelas per hundred of them, over `days`."""
+    from database import db
+    from models import Game, GameParticipant, Transaction, User
+
+    rng = random.Random(transactions)
+    start = datetime.utcnow() - timedelta(days=days)
+    span = days * 86400
+    users = 1000
+    db.session.execute(insert(User), [{"id": i, "telegram_id": 10 ** 9 + i} for i in range(1, users + 1)])
+    game_id = participant_id = 0
+    for offset in range(0, transactions, 50000):
+        rows, games, participants = [], [], []
+        for _ in range(min(50000, transactions - offset)):
+            created = start + timedelta(seconds=rng.random() * span)
+            rows.append({"user_id": rng.randint(1, users), "type": rng.choice(("deposit", "game_entry", "win")),
+                         "amount": rng.choice((10, 20, 50, 100)), "status": "completed",
+                         "created_at": created, "completed_at": created})
+        for _ in range(len(rows) // 100):
+            game_id += 1
+            price = rng.choice((10, 20, 50, 100))
+            finished = start + timedelta(seconds=rng.random() * span)
+            games.append({"id": game_id, "status": "finished", "entry_price": price, "pool": price * 10,
+                          "winner_id": rng.choice((None, rng.randint(1, users))), "finished_at": finished})
+            for cartela in range(1, 11):
+                participant_id += 1
+                participants.append({"id": participant_id, "game_id": game_id,
+                                     "user_id": rng.randint(1, users), "cartela_number": cartela})
+        db.session.execute(insert(Transaction), rows)
+        db.session.execute(insert(Game), games)
+        db.session.execute(insert(GameParticipant), participants)
+    db.session.commit()
+
+
+def run(transactions: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        import analytics
+        from database import create_db_app, db
+        from migrate import upgrade
+
+        app = create_db_app(__name__)
+        with app.app_context():
+            upgrade()
+            seed(transactions, args.days)
+            analytics.EXPORT_DIR = os.path.join(tmp, "timed")
+            started = time.perf_counter()
+            result = analytics.run_export(args.chunk)
+            elapsed = time.perf_counter() - started
+
+            # A second, traced export of the same rows: tracing slows it down, so it isn't timed
+            analytics.EXPORT_DIR = os.path.join(tmp, "traced")
+            tracemalloc.start()
+            analytics.run_export(args.chunk)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            analytics.EXPORT_DIR = os.path.join(tmp, "timed")
+            started = time.perf_counter()
+            rerun = analytics.run_export(args.chunk)
+            rerun_elapsed = time.perf_counter() - started
+            shutil.rmtree(os.path.join(tmp, "traced"))
+            db.session.remove()
+            db.engine.dispose()
+    rows = result["games"] + result["transactions"]
+    return {"transactions": transactions, "rows": rows, "rows_per_min": rows / elapsed * 60,
+            "peak_mib": peak / 2 ** 20, "rerun_rows": rerun["games"] + rerun["transactions"],
+            "rerun_ms": rerun_elapsed * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analytics export throughput and memory as the tables grow")
+    parser.add_argument("--transactions", type=int, nargs="+", default=[250000, 1000000])
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--chunk", type=int, default=10000)
+    args = parser.parse_args()
+
+    results = []
+    for transactions in args.transactions:
+        print(f"{transactions} transactions")
+        results.append(run(transactions, args))
+    print(f"{'transactions':>12}{'rows read':>11}{'rows/min':>13}{'peak MiB':>10}{'rerun rows':>12}{'rerun ms':>10}")
+    for r in results:
+        print(f"{r['transactions']:>12}{r['rows']:>11}{r['rows_per_min']:>13,.0f}{r['peak_mib']:>10.2f}"
+              f"{r['rerun_rows']:>12}{r['rerun_ms']:>10.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+
+
+def bench_draws(count: int) -> float:
+    """Time to precompute a game's draw order at creation, in microseconds."""
+    from fairness import draw_order, new_seed
+
+    seeds = [new_seed() for _ in range(count)]
+    started = time.perf_counter()
+    for seed in seeds:
+        draw_order(seed)
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def seed_games(count: int, tampered: int):
+    """Finished games with revealed seeds, `tampered` of them with a call swapped."""
+    from database import db
+    from fairness import draw_order, new_seed, seed_hash
+    from models import Game
+
+    rng = random.Random(count)
+    bad = set(rng.sample(range(1, count + 1), tampered))
+    now = datetime.utcnow()
+    for start in range(1, count + 1, 10000):
+        rows = []
+        for game_id in range(start, min(start + 10000, count + 1)):
+            seed = new_seed()
+            called = list(draw_order(seed)[:rng.randint(5, 60)])
+            if game_id in bad:
+                called[-1], called[-2] = called[-2], called[-1]
+            rows.append({"id": game_id, "status": "finished", "entry_price": 10, "pool": 100,
+                         "called_numbers": ",".join(map(str, called)), "finished_at": now,
+                         "seed_hash": seed_hash(seed), "seed": seed.hex()})
+        db.session.execute(insert(Game), rows)
+    db.session.commit()
+    return bad
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Draw precomputation cost and verifier throughput")
+    parser.add_argument("--games", type=int, default=100000)
+    parser.add_argument("--tampered", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"Draw order at game creation: {bench_draws(10000):.1f}us")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        from database import create_db_app
+        from fairness import verify_games
+        from migrate import upgrade
+
+        app = create_db_app(__name__)
+        with app.app_context():
+            upgrade()
+            bad = seed_games(args.games, args.tampered)
+            checked, failed = 0, set()
+            started = time.perf_counter()
+            for result in verify_games():
+                if "checked" in result:
+                    checked += result["checked"]
+                else:
+                    failed.add(result["game_id"])
+            elapsed = time.perf_counter() - started
+    print(f"Verified {checked} games in {elapsed:.2f}s ({checked / elapsed:,.0f} games/s); "
+          f"caught {len(failed & bad)}/{len(bad)} tampered, {len(failed - bad)} false alarms")
+    return 0 if failed == bad else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import argparse
+import random
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+
+def production_stream(rooms: int, players: int, seconds: int, call_interval: float, seed: int = 1):
+    """Events of `rooms` full rooms over `seconds`, with a few fraudsters mixed in.
+
+    Returns the events in time order and the subjects that should be flagged.
+    """
+    import fraud
+
+    rng = random.Random(seed)
+    events = []
+    expected = set()
+    user_id = 0
+    # Honest players: one room each, marking about a third of the calls a second or two after them
+    for game_id in range(1, rooms + 1):
+        members = range(user_id + 1, user_id + players + 1)
+        user_id += players
+        for member in members:
+            events.append((fraud.JOIN, rng.random() * 5, (member, game_id)))
+        call = 5.0
+        while call < seconds:
+            for member in members:
+                if rng.random() < 0.32:
+                    events.append((fraud.MARK, call + 1 + rng.random() * 2, (member, game_id)))
+            call += call_interval
+        winner = rng.choice(members)
+        events.append((fraud.CLAIM, seconds * rng.random(), (winner, game_id, 1 + rng.random() * 3)))
+
+    # Bots: sixteen rooms each, marking every call on their boards within 100ms and claiming instantly
+    for bot in range(user_id + 1, user_id + 11):
+        expected |= {("many_rooms", f"user:{bot}"), ("mark_rate", f"user:{bot}"), ("fast_claim", f"user:{bot}")}
+        for game_id in rng.sample(range(1, rooms + 1), 16):
+            events.append((fraud.JOIN, rng.random() * 5, (bot, game_id)))
+            call = 5.0
+            while call < seconds:
+                if rng.random() < 0.32:
+                    events.append((fraud.MARK, call + 0.1, (bot, game_id)))
+                call += call_interval
+        for _ in range(2):
+            events.append((fraud.CLAIM, rng.random() * seconds, (bot, game_id, 0.08)))
+
+    # Deposits: honest webhooks from the known sender, one replayed, one from an unknown sender
+    for n in range(rooms):
+        payload = {"phone": f"09{n:08d}", "amount": 50, "ref": n}
+        events.append((fraud.WEBHOOK, rng.random() * seconds, ("10.0.0.1", payload["phone"], 50,
+                                                               fraud.payload_digest(payload))))
+    replayed = {"phone": "0911111111", "amount": 500, "ref": "x"}
+    for _ in range(3):
+        events.append((fraud.WEBHOOK, rng.random() * seconds, ("10.0.0.1", "0911111111", 500,
+                                                               fraud.payload_digest(replayed))))
+    events.append((fraud.WEBHOOK, rng.random() * seconds, ("203.0.113.9", "0922222222", 1000, "forged")))
+    expected |= {("webhook_replay", "phone:0911111111"), ("webhook_source", "source:203.0.113.9")}
+
+    # Registrations: honest referrals, one referrer farming accounts on one phone, one burst of referees
+    telegram_id = 10 ** 9
+    for n in range(rooms):
+        telegram_id += 1
+        referrer = 10 ** 9 + rng.randint(1, rooms) if rng.random() < 0.3 else None
+        at = rng.random() * seconds
+        if referrer is not None:
+            events.append((fraud.REFERRAL, at, (telegram_id, referrer)))
+        events.append((fraud.PHONE, at + 1, (telegram_id, f"+2519{telegram_id % 10 ** 8:08d}", referrer)))
+    farmer = 5 * 10 ** 9
+    for referee in (farmer + 1, farmer + 2, farmer + 3):
+        at = rng.random() * seconds
+        events.append((fraud.REFERRAL, at, (referee, farmer)))
+        events.append((fraud.PHONE, at + 1, (referee, "+251900000000", farmer)))
+    expected |= {("shared_phone", "phone:+251900000000"), ("referral_ring", f"telegram:{farmer}")}
+    burster = 6 * 10 ** 9
+    for referee in range(burster + 1, burster + 13):
+        events.append((fraud.REFERRAL, rng.random() * min(seconds, 3000), (referee, burster)))
+    expected.add(("referral_burst", f"telegram:{burster}"))
+
+    events.sort(key=lambda event: event[1])
+    return events, expected
+
+
+def bench_record(count: int) -> float:
+    """Request-path cost of fraud.record(), in microseconds."""
+    import fraud
+
+    started = time.perf_counter()
+    for n in range(count):
+        fraud.record(fraud.MARK, n, 1)
+    elapsed = time.perf_counter() - started
+    while not fraud._events.empty():
+        fraud._events.get_nowait()
+    return elapsed / count * 1e6
+
+
+def bench_memory(max_keys: int) -> list:
+    """Detector memory after marks from ever more distinct players; flat once past max_keys."""
+    from fraud import MARK, FraudDetector
+
+    results = []
+    for users in (max_keys // 2, max_keys, max_keys * 2, max_keys * 4):
+        tracemalloc.start()
+        detector = FraudDetector(max_keys=max_keys)
+        for user_id in range(users):
+            detector.process(MARK, user_id * 0.001, (user_id, 1))
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del detector
+        results.append((users, size / 2 ** 20))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fraud detector throughput, request-path cost and memory")
+    parser.add_argument("--rooms", type=int, default=1000)
+    parser.add_argument("--players", type=int, default=50)
+    parser.add_argument("--seconds", type=int, default=120, help="simulated production time")
+    parser.add_argument("--call-interval", type=float, default=2.0)
+    args = parser.parse_args()
+
+    import fraud
+    fraud.FRAUD_WEBHOOK_SOURCES = ["10.0.0.1"]
+
+    print(f"record() on the request path: {bench_record(50000):.2f}us")
+
+    events, expected = production_stream(args.rooms, args.players, args.seconds, args.call_interval)
+    rate = len(events) / args.seconds
+    detector = fraud.FraudDetector()
+    flagged = Counter()
+    subjects = set()
+    started = time.perf_counter()
+    for kind, at, fields in events:
+        for rule, subject, _ in detector.process(kind, at, fields):
+            flagged[rule] += 1
+            subjects.add((rule, subject))
+    elapsed = time.perf_counter() - started
+    throughput = len(events) / elapsed
+    print(f"{len(events):,} events ({args.rooms} rooms x {args.players} players, {rate:,.0f} events/s in production)")
+    print(f"Detector: {throughput:,.0f} events/s, {throughput / rate:.1f}x the production rate")
+    print("Flags: " + ", ".join(f"{rule} {count}" for rule, count in sorted(flagged.items())))
+    missed = expected - subjects
+    false = subjects - expected
+    print(f"Caught {len(expected) - len(missed)}/{len(expected)} injected, {len(false)} false alarms")
+    for rule, subject in sorted(missed):
+        print(f"  missed {rule} {subject}")
+    for rule, subject in sorted(false):
+        print(f"  false alarm {rule} {subject}")
+
+    print("Memory with max_keys=10000:")
+    for users, mib in bench_memory(10000):
+        print(f"  {users:>6} players  {mib:6.2f} MiB")
+    return 0 if not missed and not false and throughput > rate else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
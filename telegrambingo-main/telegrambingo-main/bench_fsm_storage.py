@@ -0,0 +1,145 @@
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from aiogram import Bot, Dispatcher, Router
+from aiogram.filters import Command
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.types import Chat, Message, Update, User
+from sqlalchemy import event
+
+from database import create_db_app, db
+from fsm_storage import DatabaseStorage, FSMUpdateScope
+
+
+class Flow(StatesGroup):
+    waiting_for_amount = State()
+
+
+def build_router() -> Router:
+    """Handlers shaped like the deposit conversation: enter a state, store data, clear."""
+    router = Router()
+
+    @router.message(Command("deposit"))
+    async def start(message: Message, state: FSMContext):
+        await state.set_state(Flow.waiting_for_amount)
+
+    @router.message(Flow.waiting_for_amount)
+    async def amount(message: Message, state: FSMContext):
+        await state.update_data(amount=message.text)
+        await state.set_state(None)
+        await state.clear()
+
+    @router.message()
+    async def other(message: Message):
+        pass
+
+    return router
+
+
+def updates(users: int, rounds: int):
+    """Per user and round: start the conversation, answer it, then send an unrelated message."""
+    update_id = 0
+    now = datetime.utcnow()
+    for _ in range(rounds):
+        for text in ("/deposit", "50", "hello"):
+            for user_id in range(1, users + 1):
+                update_id += 1
+                yield Update(update_id=update_id, message=Message(
+                    message_id=update_id, date=now, text=text,
+                    chat=Chat(id=user_id, type="private"),
+                    from_user=User(id=user_id, is_bot=False, first_name="bench")))
+
+
+def dispatcher(kind: str, app) -> Dispatcher:
+    if kind == "memory":
+        dp = Dispatcher(storage=MemoryStorage())
+    else:
+        storage = DatabaseStorage(app)
+        dp = Dispatcher(storage=storage, disable_fsm=True)
+        dp.update.outer_middleware(FSMUpdateScope(storage))
+        dp.update.outer_middleware(dp.fsm)
+    dp.include_router(build_router())
+    return dp
+
+
+async def run(kind: str, app, bot: Bot, users: int, rounds: int) -> dict:
+    dp = dispatcher(kind, app)
+    batch = list(updates(users, rounds))
+    for update in batch[:users]:  # warm caches and connections
+        await dp.feed_update(bot, update)
+    times = []
+    for update in batch[users:]:
+        started = time.perf_counter()
+        await dp.feed_update(bot, update)
+        times.append(time.perf_counter() - started)
+    return {
+        "mean_us": statistics.fmean(times) * 1e6,
+        "p50_us": statistics.median(times) * 1e6,
+        "p99_us": statistics.quantiles(times, n=100)[98] * 1e6,
+        "updates": len(times),
+    }
+
+
+async def bench(args, app) -> int:
+    bot = Bot("123456:bench")
+    queries = []
+    with app.app_context():
+        event.listen(db.engine, "before_cursor_execute", lambda *a: queries.append(1))
+    print(f"{args.users} users x {args.rounds} rounds, {app.config['SQLALCHEMY_DATABASE_URI'].split('@')[-1]}")
+    print(f"{'storage':<10}{'mean us':>10}{'p50 us':>10}{'p99 us':>10}{'queries/upd':>13}")
+    results = {}
+    try:
+        for kind in ("memory", "database"):
+            queries.clear()
+            result = results[kind] = await run(kind, app, bot, args.users, args.rounds)
+            per_update = len(queries) / (result["updates"] + args.users)
+            print(f"{kind:<10}{result['mean_us']:>10.0f}{result['p50_us']:>10.0f}"
+                  f"{result['p99_us']:>10.0f}{per_update:>13.2f}")
+    finally:
+        await bot.session.close()
+
+    overhead = (results["database"]["mean_us"] - results["memory"]["mean_us"]) / 1000
+    print(f"Database storage overhead: {overhead:.3f}ms per update")
+    if overhead > args.max_ms:
+        print(f"Overhead exceeds {args.max_ms:.3f}ms")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure FSM storage overhead per bot update")
+    parser.add_argument("--url", default=os.environ.get("BENCH_DATABASE_URL"),
+                        help="database to use (default: a temporary SQLite file); never point at production")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=1.0,
+                        help="fail when the database storage adds more than this per update")
+    args = parser.parse_args()
+
+    tmp = None
+    if args.url:
+        os.environ["DATABASE_URL"] = args.url
+    else:
+        tmp = tempfile.NamedTemporaryFile(suffix=".db", delete=False)
+        os.environ["DATABASE_URL"] = f"sqlite:///{tmp.name}"
+    try:
+        app = create_db_app(__name__, "bot")
+        with app.app_context():
+            from migrate import upgrade
+            upgrade()
+        return asyncio.run(bench(args, app))
+    finally:
+        if tmp is not None:
+            os.unlink(tmp.name)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+import argparse
+import json
+import platform
+import sys
+import time
+from typing import Callable, Dict
+
+from game_logic import BingoGame
+
+BASELINE_FILE = "bench_baseline.json"
+PLAYER_COUNTS = (1, 10, 100)
+
+
+def new_game(players: int, start: bool = False, prize_table: str = "classic") -> BingoGame:
+    """Create a game with `players` players on distinct cartelas."""
+    game = BingoGame(1, 10, prize_table=prize_table)
+    game.min_players = players + 1  # keep the game waiting while players join
+    for user_id in range(1, players + 1):
+        game.add_player(user_id, cartela_number=user_id)
+    if start:
+        game.min_players = 1
+        game.status = "active"
+    return game
+
+
+def bench_generate_board() -> float:
+    started = time.perf_counter()
+    for cartela in range(1, 101):
+        BingoGame.generate_board(cartela)
+    return (time.perf_counter() - started) / 100
+
+
+def bench_add_player(players: int) -> Callable[[], float]:
+    def run():
+        game = BingoGame(1, 10)
+        game.min_players = players + 1
+        started = time.perf_counter()
+        for user_id in range(1, players + 1):
+            game.add_player(user_id)
+        return (time.perf_counter() - started) / players
+    return run
+
+
+def bench_call_number() -> float:
+    """Mean time per call over a full 75-call game."""
+    game = new_game(1, start=True)
+    started = time.perf_counter()
+    for _ in range(75):
+        game.call_number()
+    return (time.perf_counter() - started) / 75
+
+
+def bench_mark_number(players: int) -> Callable[[], float]:
+    def run():
+        game = new_game(players, start=True)
+        game.called_numbers = list(range(1, 76))
+        marks = 0
+        started = time.perf_counter()
+        for user_id, player in game.players.items():
+            for number in player['board']:
+                game.mark_number(user_id, number)
+                marks += 1
+        return (time.perf_counter() - started) / marks
+    return run
+
+
+def bench_check_winner(players: int, prize_table: str = "classic") -> Callable[[], float]:
+    """Mean time to check every player once per call across a full game."""
+    def run():
+        game = new_game(players, start=True, prize_table=prize_table)
+        checks = 0
+        elapsed = 0.0
+        for _ in range(75):
+            game.call_number()
+            for user_id, player in game.players.items():
+                number = game.called_numbers[-1]
+                if number in player['board']:
+                    game.mark_number(user_id, number)
+            started = time.perf_counter()
+            for user_id in game.players:
+                game.check_winner(user_id)
+            elapsed += time.perf_counter() - started
+            checks += len(game.players)
+        return elapsed / checks
+    return run
+
+
+def bench_format_number() -> float:
+    started = time.perf_counter()
+    for _ in range(20):
+        for number in range(1, 76):
+            BingoGame.format_number(number)
+    return (time.perf_counter() - started) / 1500
+
+
+def benchmarks() -> Dict[str, Callable[[], float]]:
+    cases = {
+        "generate_board": bench_generate_board,
+        "call_number/full_game": bench_call_number,
+        "format_number": bench_format_number,
+    }
+    for players in PLAYER_COUNTS:
+        cases[f"add_player/{players}"] = bench_add_player(players)
+        cases[f"mark_number/{players}"] = bench_mark_number(players)
+        cases[f"check_winner/{players}"] = bench_check_winner(players)
+    cases["check_winner_promo/100"] = bench_check_winner(100, "promo")
+    return cases
+
+
+def run_all(repeat: int) -> Dict[str, float]:
+    """Run every benchmark `repeat` times and keep the fastest per-op time in microseconds."""
+    return {name: min(case() for _ in range(repeat)) * 1e6 for name, case in benchmarks().items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for game_logic hot paths")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--baseline", default=BASELINE_FILE)
+    parser.add_argument("--save", action="store_true", help="store results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.15,
+                        help="fail when a path is slower than baseline by more than this fraction")
+    args = parser.parse_args()
+
+    results = run_all(args.repeat)
+
+    try:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    except FileNotFoundError:
+        baseline = {}
+
+    regressions = []
+    print(f"{'benchmark':<24}{'us/op':>10}{'baseline':>10}{'change':>9}")
+    for name, value in results.items():
+        base = baseline.get(name)
+        change = (value - base) / base if base else 0.0
+        flag = ""
+        if base and change > args.threshold:
+            regressions.append(name)
+            flag = "  SLOWER"
+        base_text = f"{base:.2f}" if base else "-"
+        print(f"{name:<24}{value:>10.2f}{base_text:>10}{change:>+9.1%}{flag}")
+
+    if args.save:
+        with open(args.baseline, "w") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": results}, f, indent=2, sort_keys=True)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"Regressions over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
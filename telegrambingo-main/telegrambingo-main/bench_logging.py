@@ -0,0 +1,74 @@
+import logging
+import logging.handlers
+import os
+import queue
+import time
+
+from config import LOG_SAMPLE_RATES
+from game_logic import BingoGame
+from logging_setup import CorrelationFilter, DeferredQueueHandler, SamplingFilter, TEXT_FORMAT
+
+
+def build_game(players: int = 100) -> BingoGame:
+    """Create a game with every number called so each board number can be marked."""
+    game = BingoGame(1, 10)
+    game.min_players = players + 1  # keep the game from starting while players join
+    for user_id in range(1, players + 1):
+        game.add_player(user_id, cartela_number=user_id)
+    game.status = "active"
+    game.called_numbers = list(range(1, 76))
+    return game
+
+
+def time_marks(game: BingoGame) -> float:
+    """Mark every number on every board and return the mean time per mark in microseconds."""
+    marks = 0
+    started = time.perf_counter()
+    for user_id, player in game.players.items():
+        for number in player['board']:
+            game.mark_number(user_id, number)
+            marks += 1
+    return (time.perf_counter() - started) / marks * 1e6
+
+
+def setup_sync_debug(stream):
+    """The previous setup: DEBUG level, synchronous stream handler, every record formatted."""
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(TEXT_FORMAT.replace(' [%(correlation_id)s]', '')))
+    return [handler], logging.DEBUG, None
+
+
+def setup_queued(stream, level):
+    """The new pipeline: sampled records handed to a background listener."""
+    output = logging.StreamHandler(stream)
+    output.setFormatter(logging.Formatter(TEXT_FORMAT))
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
+    handler.addFilter(CorrelationFilter())
+    listener = logging.handlers.QueueListener(log_queue, output)
+    listener.start()
+    return [handler], level, listener
+
+
+def run():
+    root = logging.getLogger()
+    with open(os.devnull, "w") as devnull:
+        scenarios = [
+            ("sync DEBUG (before)", lambda: setup_sync_debug(devnull)),
+            ("queued DEBUG, sampled", lambda: setup_queued(devnull, logging.DEBUG)),
+            ("queued INFO (default)", lambda: setup_queued(devnull, logging.INFO)),
+        ]
+        print(f"{'scenario':<26}{'us/mark':>10}")
+        for name, setup in scenarios:
+            handlers, level, listener = setup()
+            root.handlers[:] = handlers
+            root.setLevel(level)
+            result = min(time_marks(build_game()) for _ in range(5))
+            if listener:
+                listener.stop()
+            print(f"{name:<26}{result:>10.2f}")
+
+
+if __name__ == "__main__":
+    run()
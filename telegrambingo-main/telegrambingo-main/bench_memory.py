@@ -0,0 +1,62 @@
+import argparse
+import gc
+import random
+import sys
+import tracemalloc
+
+import metrics
+from game_logic import BingoGame
+
+
+def fill_room(game_id: int, players: int, calls: int) -> BingoGame:
+    """A room of `players` players, `calls` numbers in, with every called number on a board marked."""
+    game = BingoGame(game_id, 10, seed=game_id.to_bytes(32, "big"))
+    game.min_players = players + 1  # keep the room waiting while players join
+    rng = random.Random(game_id)
+    for user_id, cartela in enumerate(rng.sample(range(1, 101), players), start=1):
+        game.add_player(user_id, cartela_number=cartela)
+    game.min_players = 1
+    game.status = "active"
+    for _ in range(calls):
+        number = int(game.call_number()[2:])
+        for user_id in game.players:
+            game.mark_number(user_id, number)
+    return game
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per room with tracemalloc")
+    parser.add_argument("--rooms", type=int, default=200)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--calls", type=int, default=40)
+    parser.add_argument("--max-kib", type=float, default=0,
+                        help="fail when a room takes more than this many KiB (0 disables)")
+    args = parser.parse_args()
+
+    BingoGame.generate_board(1)  # import-time caches and interned objects are not per room
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    rooms = [fill_room(game_id, args.players, args.calls) for game_id in range(1, args.rooms + 1)]
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    # Operation timings land in metrics, which grow with traffic rather than with rooms
+    skip = [tracemalloc.Filter(False, metrics.__file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+    stats = after.filter_traces(skip).compare_to(before.filter_traces(skip), "filename")
+    total = sum(stat.size_diff for stat in stats)
+    per_room = total / len(rooms)
+    print(f"{args.rooms} rooms x {args.players} players, {args.calls} calls")
+    print(f"per room    {per_room / 1024:>10.1f} KiB")
+    print(f"per player  {per_room / args.players:>10.0f} B")
+    for stat in stats[:5]:
+        print(f"  {stat.traceback[0].filename.rsplit('/', 1)[-1]:<20}{stat.size_diff / len(rooms) / 1024:>8.1f} KiB/room")
+    if args.max_kib and per_room / 1024 > args.max_kib:
+        print(f"Room exceeds {args.max_kib:.1f} KiB")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
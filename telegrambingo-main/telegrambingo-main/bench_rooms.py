@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+from game_logic import BingoGame
+from rooms import RoomScheduler
+
+
+def open_rooms(count: int, players: int) -> dict:
+    """Active rooms with `players` players each and no number called yet."""
+    games = {}
+    for game_id in range(1, count + 1):
+        game = BingoGame(game_id, 10, seed=game_id.to_bytes(32, "big"))
+        game.min_players = players + 1  # keep the room waiting while players join
+        for user_id in range(1, players + 1):
+            game.add_player(user_id, cartela_number=user_id)
+        game.status = "active"
+        games[game_id] = game
+    return games
+
+
+async def drive(scheduler: RoomScheduler, seconds: float) -> list:
+    """Run the scheduler for `seconds`, returning the rooms fired on each tick."""
+    fired = []
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        await asyncio.sleep(scheduler.next_tick_in())
+        fired.append(scheduler.run_due())
+    return fired
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure automatic call lag with many rooms on one event loop")
+    parser.add_argument("--rooms", type=int, default=10000)
+    parser.add_argument("--players", type=int, default=2)
+    parser.add_argument("--interval", type=float, default=2.0, help="seconds between calls in a room")
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--max-lag-ms", type=float, default=30.0, help="fail when p99 call lag exceeds this")
+    args = parser.parse_args()
+
+    games = open_rooms(args.rooms, args.players)
+    scheduler = RoomScheduler(games, args.interval)
+    for game_id in games:
+        scheduler.add(game_id)
+
+    cpu = time.process_time()
+    fired = asyncio.run(drive(scheduler, args.seconds))
+    cpu = time.process_time() - cpu
+
+    stats = scheduler.stats()
+    busy = [count for count in fired if count]
+    expected = args.rooms / args.interval
+    print(f"{args.rooms} rooms, {args.interval}s interval, {args.seconds}s, tick {scheduler.wheel.tick * 1000:.0f}ms")
+    print(f"calls/s      {scheduler.calls / args.seconds:>10.0f}  (expected {expected:.0f})")
+    print(f"rooms/tick   {statistics.fmean(busy) if busy else 0:>10.1f}  (max {max(fired, default=0)})")
+    print(f"cpu          {cpu / args.seconds * 100:>9.1f}%  ({cpu / max(scheduler.calls, 1) * 1e6:.1f}us per call)")
+    print(f"lag p50      {stats.get('lag_p50_ms', 0):>10.2f}ms")
+    print(f"lag p99      {stats.get('lag_p99_ms', 0):>10.2f}ms")
+    print(f"lag max      {stats.get('lag_max_ms', 0):>10.2f}ms")
+    if stats.get('lag_p99_ms', 0) > args.max_lag_ms:
+        print(f"p99 lag exceeds {args.max_lag_ms:.1f}ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,57 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROCESSES = {
+    "web": "import app",
+    "bot": "import bot",
+    "admin": "import admin_panel",
+}
+
+
+def cold_start(statement: str, env: dict = None) -> float:
+    """Wall time of a fresh interpreter running `statement`, interpreter startup included."""
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", statement], check=True, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start time of each process")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--only", choices=sorted(PROCESSES), action="append")
+    parser.add_argument("--max", type=float, default=1.0,
+                        help="fail when the web worker's median cold start exceeds this many seconds")
+    args = parser.parse_args()
+
+    cold_start("pass")  # warm the bytecode and filesystem caches
+    baseline = statistics.median(cold_start("pass") for _ in range(args.repeat))
+    print(f"{'process':<10}{'median ms':>12}{'min ms':>10}{'max ms':>10}")
+    print(f"{'python':<10}{baseline * 1000:>12.0f}")
+
+    web = None
+    # Journals and snapshots the processes write on start and exit go to a scratch directory
+    tmp = tempfile.TemporaryDirectory()
+    env = dict(os.environ, JOURNAL_DIR=os.path.join(tmp.name, "journals"),
+               SNAPSHOT_DIR=os.path.join(tmp.name, "snapshots"))
+    for name in args.only or PROCESSES:
+        cold_start(PROCESSES[name], env)
+        times = [cold_start(PROCESSES[name], env) for _ in range(args.repeat)]
+        median = statistics.median(times)
+        if name == "web":
+            web = median
+        print(f"{name:<10}{median * 1000:>12.0f}{min(times) * 1000:>10.0f}{max(times) * 1000:>10.0f}")
+
+    if web is not None and web > args.max:
+        print(f"Web cold start {web:.2f}s exceeds {args.max:.2f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,3 +1,6 @@
+from startup import StartupTimer
+startup = StartupTimer("bot")
+
 import os
 import logging
 import asyncio
@@ -18,16 +21,19 @@ from aiogram.types import (
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from flask import Flask
-from database import db, init_db
+from database import db, create_db_app
 from models import User, Transaction
+from history import CURSOR_PREFIX, decode_cursor, encode_cursor, history_page, win_rate
+from config import BOT_METRICS_PORT, FSM_STORAGE, WEBAPP_URL
+from logging_setup import configure_logging
+import metrics
 import aiohttp
+from aiohttp import web
+
+startup.mark("imports")
 
 # Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # Bot Configuration
@@ -35,12 +41,12 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 if not TOKEN:
     raise ValueError("TELEGRAM_BOT_TOKEN environment variable is not set")
 
-WEBAPP_URL = f"https://{os.getenv('REPLIT_SLUG')}.replit.app" if os.getenv('REPLIT_SLUG') else "http://0.0.0.0:5000"
 router = Router()
 
-# Initialize Flask app for database context
-app = Flask(__name__)
-init_db(app)
+# Flask app for database context; shares the web process's database setup
+app = create_db_app(__name__, "bot")
+metrics.instrument_sqlalchemy()
+startup.mark("app")
 
 # Game prices
 GAME_PRICES = [10, 20, 50, 100]
@@ -60,7 +66,7 @@ async def process_price_selection(callback_query: CallbackQuery):
 
             # Create game through API
             async with aiohttp.ClientSession() as session:
-                async with session.post(f"{WEBAPP_URL}/game/create", json={'entry_price': price, 'user_id': user.id}) as response:
+                async with session.post(f"{WEBAPP_URL}/game/create", json={'entry_price': price}) as response:
                     if response.status == 200:
                         data = await response.json()
                         game_id = data['game_id']
@@ -81,7 +87,7 @@ async def process_price_selection(callback_query: CallbackQuery):
                     else:
                         await callback_query.answer("Failed to create game. Please try again.", show_alert=True)
     except Exception as e:
-        logger.error(f"Error processing price selection: {e}")
+        logger.error("Error processing price selection: %s", e)
         await callback_query.answer("Sorry, there was an error. Please try again.", show_alert=True)
 
 # States
@@ -91,11 +97,48 @@ class UserState(StatesGroup):
     waiting_for_deposit_sms = State()
     waiting_for_withdrawal = State()
 
+def create_bot() -> Bot:
+    """Create a Bot client with API call metrics."""
+    from middlewares import TelegramMetricsMiddleware
+    bot = Bot(token=TOKEN)
+    bot.session.middleware(TelegramMetricsMiddleware())
+    return bot
+
+async def start_metrics_server():
+    """Serve the bot process metrics for scraping."""
+    async def handle_metrics(request):
+        return web.Response(body=metrics.REGISTRY.render().encode(),
+                            headers={'Content-Type': metrics.CONTENT_TYPE})
+
+    metrics_app = web.Application()
+    metrics_app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(metrics_app)
+    await runner.setup()
+    await web.TCPSite(runner, '0.0.0.0', BOT_METRICS_PORT).start()
+    logger.info("Bot metrics available on port %s", BOT_METRICS_PORT)
+    return runner
+
 async def setup_bot():
     """Setup bot and dispatcher"""
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
-    bot = Bot(token=TOKEN)
+    # Imported here, like the background engines in main(), so importing the module stays light
+    from fsm_storage import DatabaseStorage, FSMUpdateScope
+    from middlewares import HandlerMetricsMiddleware, ThrottlingMiddleware
+
+    # Conversation states live in the database by default, so they survive
+    # restarts and any bot instance can continue them
+    storage = MemoryStorage() if FSM_STORAGE == "memory" else DatabaseStorage(app)
+    dp = Dispatcher(storage=storage, disable_fsm=True)
+    # Floods and repeated taps are dropped before they reach the FSM storage or a handler
+    dp.update.outer_middleware(ThrottlingMiddleware())
+    if isinstance(storage, DatabaseStorage):
+        dp.update.outer_middleware(FSMUpdateScope(storage))
+        storage.start_purging()
+    dp.update.outer_middleware(dp.fsm)
+    bot = create_bot()
+
+    # Label DB metrics with the handler that issued the queries
+    dp.message.middleware(HandlerMetricsMiddleware())
+    dp.callback_query.middleware(HandlerMetricsMiddleware())
 
     # Include router
     dp.include_router(router)
@@ -106,6 +149,8 @@ async def setup_bot():
 @router.message(Command("start"))
 async def cmd_start(message: Message):
     """Handle /start command and registration"""
+    import fraud
+    from replicas import mark_written
     try:
         user_id = message.from_user.id
         username = message.from_user.username
@@ -127,7 +172,10 @@ async def cmd_start(message: Message):
                 )
                 db.session.add(user)
                 db.session.commit()
-                logger.info(f"New user registered: {user_id} ({username})")
+                mark_written(user_id)
+                if referrer_id is not None:
+                    fraud.record(fraud.REFERRAL, user_id, referrer_id)
+                logger.info("New user registered: %s (%s)", user_id, username)
 
                 keyboard = ReplyKeyboardMarkup(
                     keyboard=[[KeyboardButton(text="📱 Share Phone Number", request_contact=True)]],
@@ -145,16 +193,17 @@ async def cmd_start(message: Message):
                 await show_main_menu(message)
 
     except Exception as e:
-        logger.error(f"Error in start command: {e}")
+        logger.error("Error in start command: %s", e)
         await message.answer("Sorry, there was an error. Please try again later.")
 
 async def show_main_menu(message: Message):
     """Show main menu with balance and options"""
     try:
+        # Balance reads stay on the primary: deposits are confirmed by the web process
         with app.app_context():
             user = User.query.filter_by(telegram_id=message.from_user.id).first()
             if not user:
-                logger.error(f"User not found for main menu: {message.from_user.id}")
+                logger.error("User not found for main menu: %s", message.from_user.id)
                 await message.answer("Please register first using /start")
                 return
 
@@ -175,12 +224,15 @@ async def show_main_menu(message: Message):
                 reply_markup=keyboard
             )
     except Exception as e:
-        logger.error(f"Error showing main menu: {e}")
+        logger.error("Error showing main menu: %s", e)
         await message.answer("Sorry, there was an error. Please try again later.")
 
 @router.message(F.contact)
 async def process_phone_number(message: Message):
     """Handle shared contact information"""
+    import fraud
+    import referrals
+    from replicas import mark_written
     if not message.contact or message.contact.user_id != message.from_user.id:
         await message.answer("Please share your own contact information.")
         return
@@ -194,9 +246,12 @@ async def process_phone_number(message: Message):
 
             user.phone = message.contact.phone_number
             db.session.commit()
-            logger.info(f"Phone number registered for user: {message.from_user.id}")
+            mark_written(message.from_user.id)
+            referrals.record(referrals.PHONE, [user.id])
+            fraud.record(fraud.PHONE, user.telegram_id, user.phone, user.referrer_id)
+            logger.info("Phone number registered for user: %s", message.from_user.id)
 
-            bot = Bot(token=TOKEN)
+            bot = create_bot()
             bot_info = await bot.get_me()
             referral_link = f"https://t.me/{bot_info.username}?start={message.from_user.id}"
 
@@ -213,7 +268,7 @@ async def process_phone_number(message: Message):
             # Show main menu
             await show_main_menu(message)
     except Exception as e:
-        logger.error(f"Error processing phone number: {e}")
+        logger.error("Error processing phone number: %s", e)
         await message.answer("Sorry, there was an error. Please try again later.")
 
 
@@ -241,7 +296,7 @@ async def process_play_command(message: Message):
                 reply_markup=keyboard
             )
     except Exception as e:
-        logger.error(f"Error processing play command: {e}")
+        logger.error("Error processing play command: %s", e)
         await message.answer("Sorry, there was an error. Please try again later.")
 
 @router.message(F.text == "💰 Deposit")
@@ -261,12 +316,13 @@ async def process_deposit_command(message: Message, state: FSMContext):
                 "Maximum: 1000 birr\n"
             )
     except Exception as e:
-        logger.error(f"Error processing deposit command: {e}")
+        logger.error("Error processing deposit command: %s", e)
         await message.answer("Sorry, there was an error. Please try again later.")
 
 @router.message(UserState.waiting_for_deposit_amount)
 async def process_deposit_amount(message: Message, state: FSMContext):
     """Handle deposit amount input"""
+    from replicas import mark_written
     try:
         amount = float(message.text)
         if amount < 10:
@@ -291,6 +347,7 @@ async def process_deposit_amount(message: Message, state: FSMContext):
             )
             db.session.add(transaction)
             db.session.commit()
+            mark_written(message.from_user.id)
 
             await state.set_state(UserState.waiting_for_deposit_sms)
             await message.answer(
@@ -305,14 +362,14 @@ async def process_deposit_amount(message: Message, state: FSMContext):
     except ValueError:
         await message.answer("⚠️ Please enter a valid amount")
     except Exception as e:
-        logger.error(f"Error processing deposit amount: {e}")
+        logger.error("Error processing deposit amount: %s", e)
         await message.answer("Sorry, there was an error. Please try again later.")
 
 async def send_notification(user_id: int, message: str):
     """Send a notification to a user through Telegram Bot API securely."""
     try:
-        logger.info(f"Attempting to send notification to user {user_id}")
-        bot = Bot(token=TOKEN)  # Using environment variable
+        logger.debug("Attempting to send notification to user %s", user_id)
+        bot = create_bot()  # Using environment variable
 
         # Send message with HTML formatting
         sent_message = await bot.send_message(
@@ -321,28 +378,29 @@ async def send_notification(user_id: int, message: str):
             parse_mode="HTML"  # Support HTML formatting
         )
 
-        logger.info(f"Successfully sent notification to user {user_id}: {message}")
+        logger.info("Sent notification to user %s (%d chars)", user_id, len(message))
         return sent_message
     except Exception as e:
-        logger.error(f"Failed to send notification to user {user_id}: {e}")
+        logger.error("Failed to send notification to user %s: %s", user_id, e)
         raise
 
 async def process_deposit_confirmation(data: dict):
     """Handle deposit confirmation from webhook"""
+    import referrals
+    from replicas import mark_written
     try:
         # Extract data from webhook
         received_amount = float(data.get('amount', 0))
         received_phone = data.get('phone')
 
-        logger.info(f"Processing deposit confirmation: amount={received_amount}, phone={received_phone}")
+        logger.info("Processing deposit confirmation: amount=%s, phone=%s", received_amount, received_phone)
 
         with app.app_context():
             # Find user by phone number
             user = User.query.filter_by(phone=received_phone).first()
             if not user:
-                error_msg = f"No user found with phone: {received_phone}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
+                logger.error("No user found with phone: %s", received_phone)
+                raise ValueError(f"No user found with phone: {received_phone}")
 
             # Get pending transaction
             transaction = Transaction.query.filter_by(
@@ -360,6 +418,8 @@ async def process_deposit_confirmation(data: dict):
                 # Update user balance
                 user.balance += received_amount
                 db.session.commit()
+                mark_written(user.telegram_id)
+                referrals.record(referrals.DEPOSIT, [user.id])
 
                 # Send notification using secure method
                 await send_notification(
@@ -368,14 +428,13 @@ async def process_deposit_confirmation(data: dict):
                            f"Amount: {received_amount:.2f} birr\n"
                            f"New Balance: {user.balance:.2f} birr"
                 )
-                logger.info(f"Deposit approved for user {user.id}: {received_amount} birr")
+                logger.info("Deposit approved for user %s: %s birr", user.id, received_amount)
             else:
-                error_msg = f"No pending deposit found for user {user.id} with amount {received_amount}"
-                logger.error(error_msg)
-                raise ValueError(error_msg)
+                logger.error("No pending deposit found for user %s with amount %s", user.id, received_amount)
+                raise ValueError(f"No pending deposit found for user {user.id} with amount {received_amount}")
 
     except Exception as e:
-        logger.error(f"Error processing deposit confirmation: {e}")
+        logger.error("Error processing deposit confirmation: %s", e)
         raise
 
 @router.message(F.text == "💳 Withdraw")
@@ -401,41 +460,81 @@ async def process_withdraw_command(message: Message, state: FSMContext):
                 "Reply with the amount you want to withdraw:"
             )
     except Exception as e:
-        logger.error(f"Error processing withdraw command: {e}")
+        logger.error("Error processing withdraw command: %s", e)
         await message.answer("Sorry, there was an error. Please try again later.")
 
+def render_stats(user: User, before=None):
+    """Build the stats text and history keyboard for one page of transactions."""
+    transactions, has_more = history_page(user.id, before)
+
+    stats = (
+        f"📊 Your Stats\n\n"
+        f"💰 Current Balance: {user.balance:.2f} birr\n"
+        f"🎮 Games Played: {user.games_played}\n"
+        f"🏆 Games Won: {user.games_won} ({win_rate(user):.0%} win rate)\n"
+        f"📥 Total Deposited: {user.total_deposited:.2f} birr\n"
+        f"🎉 Total Won: {user.total_won:.2f} birr\n\n"
+        f"{'Recent' if before is None else 'Older'} Transactions:\n"
+    )
+
+    for tx in transactions:
+        stats += (f"{'➕' if tx.amount > 0 else '➖'} {abs(tx.amount)} birr - {tx.type} ({tx.status}) "
+                  f"{tx.created_at:%Y-%m-%d}\n")
+    if not transactions:
+        stats += "No transactions yet\n"
+
+    buttons = []
+    if before is not None:
+        buttons.append(InlineKeyboardButton(text="⏮ Newest", callback_data=CURSOR_PREFIX))
+    if has_more:
+        buttons.append(InlineKeyboardButton(text="Older ▶", callback_data=encode_cursor(transactions[-1])))
+    keyboard = InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+    return stats, keyboard
+
 @router.message(F.text == "📊 My Stats")
 async def process_stats_command(message: Message):
     """Handle stats command"""
+    from replicas import user_reads
     try:
         with app.app_context():
+            # The user row from the primary; their history from the replica unless they wrote lately
             user = User.query.filter_by(telegram_id=message.from_user.id).first()
             if not user:
                 await message.answer("Please register first using /start")
                 return
 
-            # Get transaction history
-            transactions = Transaction.query.filter_by(user_id=user.id).order_by(Transaction.created_at.desc()).limit(5).all()
-
-            stats = (
-                f"📊 Your Stats\n\n"
-                f"💰 Current Balance: {user.balance:.2f} birr\n"
-                f"🎮 Games Played: {user.games_played}\n"
-                f"🏆 Games Won: {user.games_won}\n\n"
-                f"Recent Transactions:\n"
-            )
+            with user_reads(user):
+                stats, keyboard = render_stats(user)
+            await message.answer(stats, reply_markup=keyboard)
+    except Exception as e:
+        logger.error("Error processing stats command: %s", e)
+        await message.answer("Sorry, there was an error. Please try again later.")
 
-            for tx in transactions:
-                stats += f"{'➕' if tx.amount > 0 else '➖'} {abs(tx.amount)} birr - {tx.type} ({tx.status})\n"
+@router.callback_query(F.data.startswith(CURSOR_PREFIX))
+async def process_history_page(callback_query: CallbackQuery):
+    """Show the next (or first) page of the user's transaction history"""
+    from replicas import user_reads
+    try:
+        before = decode_cursor(callback_query.data) if callback_query.data != CURSOR_PREFIX else None
+        with app.app_context():
+            # Always page the caller's own history, whatever the callback data says
+            user = User.query.filter_by(telegram_id=callback_query.from_user.id).first()
+            if not user:
+                await callback_query.answer("Please register first using /start", show_alert=True)
+                return
 
-            await message.answer(stats)
+            with user_reads(user):
+                stats, keyboard = render_stats(user, before)
+            await callback_query.message.edit_text(stats, reply_markup=keyboard)
+            await callback_query.answer()
     except Exception as e:
-        logger.error(f"Error processing stats command: {e}")
-        await message.answer("Sorry, there was an error. Please try again later.")
+        logger.error("Error processing history page: %s", e)
+        await callback_query.answer("Sorry, there was an error. Please try again.", show_alert=True)
 
 @router.message(UserState.waiting_for_withdrawal)
 async def process_withdrawal_request(message: Message, state: FSMContext):
     """Handle withdrawal amount input"""
+    from replicas import mark_written
     try:
         amount = float(message.text)
         if amount < 100:
@@ -458,6 +557,7 @@ async def process_withdrawal_request(message: Message, state: FSMContext):
             )
             db.session.add(transaction)
             db.session.commit()
+            mark_written(message.from_user.id)
 
             await message.answer(
                 "✅ Withdrawal request received!\n\n"
@@ -469,7 +569,7 @@ async def process_withdrawal_request(message: Message, state: FSMContext):
         await message.answer("⚠️ Please enter a valid amount")
         return
     except Exception as e:
-        logger.error(f"Error processing withdrawal request: {e}")
+        logger.error("Error processing withdrawal request: %s", e)
         await message.answer("Sorry, there was an error. Please try again later.")
 
     await state.clear()
@@ -477,14 +577,26 @@ async def process_withdrawal_request(message: Message, state: FSMContext):
 
 async def main():
     """Main entry point for the bot"""
+    import fraud
+    import referrals
+    from archive import start_archiver
+    from replicas import start_lag_checks
+
     try:
         logger.info("Starting bot...")
         bot, dp = await setup_bot()
+        await start_metrics_server()
+        referrals.start_referral_engine(app, sweep=True)
+        start_archiver(app)
+        fraud.start_fraud_engine(app)
+        start_lag_checks(app)
+        startup.mark("setup")
+        startup.report()
 
         # Start polling
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     except Exception as e:
-        logger.error(f"Error starting bot: {e}")
+        logger.error("Error starting bot: %s", e)
         raise
 
 if __name__ == "__main__":
@@ -493,4 +605,4 @@ if __name__ == "__main__":
     except (KeyboardInterrupt, SystemExit):
         logger.info("Bot stopped")
     except Exception as e:
-        logger.error(f"Fatal error: {e}")
\ No newline at end of file
+        logger.error("Fatal error: %s", e)
\ No newline at end of file
@@ -3,6 +3,17 @@ import os
 # Bot Configuration
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ADMIN_IDS = [int(id) for id in os.getenv("ADMIN_IDS", "").split(",") if id]
+NOTIFY_BATCH_SIZE = 25  # notifications sent concurrently per batch
+HISTORY_PAGE_SIZE = 5  # transactions per "My Stats" history page
+NOTIFY_RATE = 25.0  # notifications per second, under the Bot API's 30/s broadcast limit
+FSM_STORAGE = os.getenv("FSM_STORAGE", "database")  # database (shared by bot instances) or memory
+FSM_STATE_TTL = float(os.getenv("FSM_STATE_TTL", "86400"))  # seconds an untouched conversation state lives
+FSM_FLUSH_INTERVAL = 0.05  # seconds between group commits of changed states
+FSM_PURGE_INTERVAL = 3600  # seconds between deletes of expired states
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", "1.0"))  # updates per second a user may sustain
+THROTTLE_BURST = int(os.getenv("THROTTLE_BURST", "5"))  # updates a user may send at once after a pause
+DUPLICATE_WINDOW = 2.0  # seconds a repeat of the same button or text is dropped
+THROTTLE_MAX_USERS = 100000  # users tracked before the least recently seen are evicted
 
 # Game Configuration
 CARTELA_SIZE = 100
@@ -11,16 +22,123 @@ GAME_PRICES = [10, 20, 50, 100]  # in birr
 MIN_GAMES_FOR_WITHDRAWAL = 5
 MIN_WINS_FOR_WITHDRAWAL = 1
 REFERRAL_BONUS = 20  # in birr
+REFERRAL_BATCH_INTERVAL = 5.0  # seconds between referral event batches
+REFERRAL_BATCH_SIZE = 1000  # user ids per referral batch; a busier queue is drained over several batches
+REFERRAL_SWEEP_INTERVAL = float(os.getenv("REFERRAL_SWEEP_INTERVAL", "3600"))  # seconds, 0 disables
+REFERRAL_SWEEP_BATCH = 1000  # users checked per sweep query
+# Prizes per game: (pattern from patterns.py, share of the pool); the game ends once every tier is won
+PRIZE_TABLES = {
+    "classic": [("line", 1.0)],
+    "promo": [("four_corners", 0.1), ("x", 0.2), ("two_lines", 0.2), ("full_house", 0.5)],
+}
+DEFAULT_PRIZE_TABLE = "classic"
+
+# Game Sharding Configuration
+GAME_SHARDS = int(os.getenv("GAME_SHARDS", "0"))  # 0 keeps games in the web process
+SHARD_VNODES = 64  # virtual nodes per shard on the hash ring
+SHARD_REQUEST_TIMEOUT = 5.0  # seconds
+SHARD_HEALTH_MAX_AGE = 2.0  # seconds a shard health report is reused before the shards are pinged again
+CALL_INTERVAL_SECONDS = float(os.getenv("CALL_INTERVAL_SECONDS", "2"))  # 0 disables automatic calls
+ROOM_TICK_SECONDS = 0.01  # timer wheel resolution; bounds how late an automatic call can fire
+ROOM_WHEEL_SLOTS = 512  # one revolution is 5.12s, longer than the call interval
+FINISHED_GAME_TTL = 300  # seconds a finished game stays readable for its players' last polls
+GAME_EVICT_INTERVAL = 30  # seconds between sweeps for finished games to evict
 
 # Admin Panel Configuration
 ADMIN_USERNAME = os.getenv("ADMIN_USERNAME", "admin")
 ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD", "admin123")
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")
+ADMIN_PAGE_SIZE = 50
+WITHDRAWAL_BATCH_LIMIT = 1000  # withdrawals approved or rejected per request
+TOP_DEPOSITORS = 10
+SUMMARY_REFRESH_INTERVAL = float(os.getenv("SUMMARY_REFRESH_INTERVAL", "60"))  # seconds, 0 disables
+WEBAPP_URL = os.getenv("WEBAPP_URL") or (
+    f"https://{os.getenv('REPLIT_SLUG')}.replit.app" if os.getenv("REPLIT_SLUG") else "http://0.0.0.0:5000")
+LIVE_GAMES_TIMEOUT = 2.0  # seconds the dashboard waits for the web app's live games
+LIVE_GAMES_SECRET = os.getenv("LIVE_GAMES_SECRET")  # shared with the web app; its /games/open refuses requests without it
+SUMMARY_LAG_SECONDS = 30  # rows newer than this are left for the next refresh so late commits aren't skipped
 
 # Database Configuration
 SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL")
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL")  # read replica for menus, stats and admin listings
+REPLICA_MAX_LAG = float(os.getenv("REPLICA_MAX_LAG", "5"))  # seconds behind before reads fall back to the primary
+REPLICA_CHECK_INTERVAL = 1.0  # seconds between replica lag checks
+REPLICA_STICKY_USERS = 100000  # recent writers tracked for read-your-writes before the oldest are evicted
+
+# Database Pool Configuration
+# Per process role: connections kept open, extra connections allowed under bursts,
+# and whether to test each connection with a round trip on checkout
+DB_POOL_PROFILES = {
+    "web": {"size": int(os.getenv("DB_WEB_POOL_SIZE", "5")),
+            "overflow": int(os.getenv("DB_WEB_MAX_OVERFLOW", "10")), "pre_ping": False},
+    "bot": {"size": int(os.getenv("DB_BOT_POOL_SIZE", "3")),
+            "overflow": int(os.getenv("DB_BOT_MAX_OVERFLOW", "2")), "pre_ping": False},
+    "admin": {"size": int(os.getenv("DB_ADMIN_POOL_SIZE", "2")),
+              "overflow": int(os.getenv("DB_ADMIN_MAX_OVERFLOW", "2")), "pre_ping": True},
+    "worker": {"size": int(os.getenv("DB_WORKER_POOL_SIZE", "2")),
+               "overflow": int(os.getenv("DB_WORKER_MAX_OVERFLOW", "0")), "pre_ping": True},
+}
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))  # seconds to wait for a free connection
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "300"))  # seconds; keep below the server's idle timeout
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "1200"))  # compiled statements cached per engine
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER") == "1"  # DATABASE_URL points at pgbouncer in transaction mode
 
 # Flask Configuration
 FLASK_HOST = "0.0.0.0"
-FLASK_PORT = 5000
\ No newline at end of file
+FLASK_PORT = 5000
+STATIC_MAX_AGE = 31536000  # seconds; static files are served with far-future cache headers
+COMPRESS_MIN_SIZE = 512  # bytes; smaller responses are sent uncompressed
+COMPRESS_LEVEL = 6
+STATE_MAX_AGE = 1  # seconds a shared cache may serve /game/<id>/state
+FRAGMENT_CACHE_GAMES = 10000  # games whose called-number board stays cached
+WEBAPP_AUTH_MAX_AGE = 86400  # seconds a Telegram WebApp initData signature is accepted for
+
+# Journal Configuration
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "journals")  # empty disables game journals
+JOURNAL_FLUSH_INTERVAL = 0.05  # seconds between group commits
+JOURNAL_SEGMENT_BYTES = 64 * 2 ** 20  # segment files roll over at this size and at midnight UTC
+JOURNAL_KEEP_SECONDS = float(os.getenv("JOURNAL_KEEP_SECONDS", "86400"))  # segments outlive the snapshots covering them this long, for replay
+
+# Fraud Detection Configuration
+# Addresses deposit webhooks may come from; webhooks from any other are flagged. Empty trusts every sender.
+FRAUD_WEBHOOK_SOURCES = [s for s in os.getenv("FRAUD_WEBHOOK_SOURCES", "").split(",") if s]
+FRAUD_REPLAY_WINDOW = 3600  # seconds within which a repeated deposit webhook payload is a replay
+FRAUD_PHONE_WINDOW = 7 * 86400  # seconds accounts registering the same phone are compared over
+FRAUD_PHONE_ACCOUNTS = 2  # accounts on one phone before it is flagged
+FRAUD_ROOM_WINDOW = 120  # seconds, shorter than a game, so rooms joined within it are played at once
+FRAUD_MAX_ROOMS = 5  # rooms a player may join within the window
+FRAUD_MIN_CLAIM_SECONDS = 0.5  # a claim this soon after the last call is faster than a person
+FRAUD_FAST_CLAIMS = 2  # fast claims within an hour before a player is flagged
+FRAUD_MAX_MARKS_PER_MINUTE = 120  # marks across all rooms
+FRAUD_MAX_REFERRALS_PER_HOUR = 10  # new referees of one referrer
+FRAUD_FLAG_COOLDOWN = 3600  # seconds before a rule flags the same subject again
+FRAUD_MAX_KEYS = 100000  # keys per sliding window before the least recently seen are evicted
+FRAUD_QUEUE_SIZE = 100000  # events buffered for the detector; beyond that they are dropped, never waited for
+FRAUD_BATCH_INTERVAL = 1.0  # seconds between flag writes
+
+# Archive Configuration
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")  # gzip CSV files of archived months
+ARCHIVE_KEEP_MONTHS = int(os.getenv("ARCHIVE_KEEP_MONTHS", "3"))  # months kept in the database besides the current one
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", "86400"))  # seconds between archive runs, 0 disables
+ARCHIVE_BATCH = 10000  # rows moved per file and transaction
+ARCHIVE_LEASE_SECONDS = 600  # a run holds the archive lease this long past its last batch
+
+# Analytics Export Configuration
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")  # daily report files and the export checkpoint
+EXPORT_CHUNK = 10000  # rows fetched per round trip from the server-side cursor
+EXPORT_RESCAN_SECONDS = 86400  # each export recounts from the day this long before the last one
+
+# Crash Recovery Configuration
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "10"))  # seconds between snapshots, 0 disables
+RECOVERY_LOOKBACK_DAYS = 1  # journal day directories scanned for games newer than the snapshot
+
+# Metrics Configuration
+METRICS_SAMPLE_EVERY = int(os.getenv("METRICS_SAMPLE_EVERY", "10"))  # time 1 in N hot-path calls
+BOT_METRICS_PORT = int(os.getenv("BOT_METRICS_PORT", "9101"))
+
+# Logging Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text or json
+LOG_SAMPLE_RATES = {"mark": 100, "call": 10}  # keep 1 in N records tagged with extra={'sample': key}
@@ -1,21 +1,118 @@
 import os
+import time
+from typing import Optional
+
+from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import DeclarativeBase
+from sqlalchemy.pool import NullPool, QueuePool
+
+import metrics
+from config import (
+    DB_PGBOUNCER, DB_POOL_PROFILES, DB_POOL_RECYCLE, DB_POOL_TIMEOUT, DB_QUERY_CACHE_SIZE,
+)
+
+REPLICA = "replica"  # bind key of the read replica, and the session.info flag that routes reads to it
 
 class Base(DeclarativeBase):
     pass
 
-db = SQLAlchemy(model_class=Base)
+class RoutingSession(Session):
+    """Session that sends reads to the replica while session.info[REPLICA] is set (see replicas.py).
+
+    Flushes, and everything outside a replica scope, go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(REPLICA) and not self._flushing:
+            engine = self._db.engines.get(REPLICA)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
+
+POOL_CHECKOUT_SECONDS = metrics.histogram(
+    "bingo_db_pool_checkout_seconds", "Time spent waiting for a pooled connection", ["role"])
+POOL_TIMEOUTS = metrics.counter(
+    "bingo_db_pool_timeouts", "Checkouts that gave up waiting for a connection", ["role"])
+POOL_IN_USE = metrics.gauge(
+    "bingo_db_pool_in_use", "Connections currently checked out of the pool", ["role"])
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records checkout wait time, timeouts and connections in use per role."""
+
+    def __init__(self, creator, role: str = "none", **kw):
+        super().__init__(creator, **kw)
+        self.role = role
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.role = self.role
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            POOL_TIMEOUTS.inc(role=self.role)
+            raise
+        finally:
+            POOL_CHECKOUT_SECONDS.observe(time.perf_counter() - started, role=self.role)
+        POOL_IN_USE.inc(role=self.role)
+        return connection
+
+    def _do_return_conn(self, record):
+        POOL_IN_USE.dec(role=self.role)
+        super()._do_return_conn(record)
+
+def engine_options(role: str, url: Optional[str] = None) -> dict:
+    """Engine options for a process role: 'web', 'bot', 'admin', 'worker' or 'migrate'."""
+    options = {"query_cache_size": DB_QUERY_CACHE_SIZE}
+    url = make_url(url) if url else None
+    if DB_PGBOUNCER or role == "migrate":
+        # pgbouncer pools server connections itself, and migrations must not leave
+        # open connections behind for the processes main.py forks afterwards
+        options["poolclass"] = NullPool
+        if DB_PGBOUNCER and url is not None and url.get_driver_name() == "psycopg":
+            # Server-side prepared statements don't survive transaction pooling
+            options["connect_args"] = {"prepare_threshold": None}
+        return options
+    if url is not None and url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return options  # Flask-SQLAlchemy keeps in-memory SQLite on a single static connection
+
+    profile = DB_POOL_PROFILES[role]
+    options.update(
+        poolclass=TimedQueuePool,
+        role=role,
+        pool_size=profile["size"],
+        max_overflow=profile["overflow"],
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=profile["pre_ping"],
+        pool_use_lifo=True,  # idle spares age out while the busy few stay warm
+    )
+    return options
 
-def init_db(app):
+def init_db(app, role: str = "worker"):
+    """Bind the database to an app. The schema is managed by migrate.py, not here."""
     app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-        "pool_recycle": 300,
-        "pool_pre_ping": True,
-    }
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(role, app.config["SQLALCHEMY_DATABASE_URI"])
+    replica_url = os.environ.get("DATABASE_REPLICA_URL")
+    if replica_url and role != "migrate":
+        options = engine_options(role, replica_url)
+        if "role" in options:
+            options["role"] = f"{role}_replica"
+        app.config["SQLALCHEMY_BINDS"] = {REPLICA: {"url": replica_url, **options}}
     db.init_app(app)
 
-    with app.app_context():
-        import models  # Import models here to avoid circular imports
-        db.create_all()
+def create_db_app(import_name: str, role: str = "worker") -> Flask:
+    """Create a Flask app bound to the database; the one init path for web, bot and tools."""
+    app = Flask(import_name)
+    init_db(app, role)
+    return app
@@ -0,0 +1,153 @@
+import argparse
+import hashlib
+import hmac
+import secrets
+import sys
+import time
+from typing import Dict, Iterator, Optional
+
+SEED_BYTES = 32
+PERSONALIZATION = b"bingo-draw-order"  # part of the DRBG input, so the seed's output is specific to draws
+NUMBERS = 75
+# (position, bound, limit) for each Fisher-Yates step; bytes at or above `limit` are skipped
+_STEPS = tuple((i, i + 1, 256 - 256 % (i + 1)) for i in range(NUMBERS - 1, 0, -1))
+
+
+def new_seed() -> bytes:
+    return secrets.token_bytes(SEED_BYTES)
+
+
+def seed_hash(seed: bytes) -> str:
+    """The commitment published before a game starts: hex SHA-256 of its seed."""
+    return hashlib.sha256(seed).hexdigest()
+
+
+class HmacDrbg:
+    """HMAC_DRBG with SHA-256 (NIST SP 800-90A), without reseeding or additional input."""
+
+    __slots__ = ("key", "value")
+
+    def __init__(self, seed_material: bytes):
+        self.key = b"\x00" * 32
+        self.value = b"\x01" * 32
+        self._update(seed_material)
+
+    def _update(self, data: bytes = b""):
+        self.key = hmac.digest(self.key, self.value + b"\x00" + data, "sha256")
+        self.value = hmac.digest(self.key, self.value, "sha256")
+        if data:
+            self.key = hmac.digest(self.key, self.value + b"\x01" + data, "sha256")
+            self.value = hmac.digest(self.key, self.value, "sha256")
+
+    def generate(self, size: int) -> bytes:
+        out = []
+        for _ in range(-(-size // 32)):
+            self.value = hmac.digest(self.key, self.value, "sha256")
+            out.append(self.value)
+        self._update()
+        return b"".join(out)[:size]
+
+
+def draw_order(seed: bytes) -> bytes:
+    """The order in which a game with this seed calls the numbers 1-75.
+
+    A Fisher-Yates shuffle of 1..75 from the last position down; position i swaps
+    with j = b % (i + 1) for the next DRBG byte b, skipping bytes at or above the
+    largest multiple of i + 1 below 256 so every j is equally likely.
+    """
+    drbg = HmacDrbg(seed + PERSONALIZATION)
+    order = bytearray(range(1, NUMBERS + 1))
+    block = drbg.generate(128)
+    pos = 0
+    for i, bound, limit in _STEPS:
+        while True:
+            if pos == len(block):
+                block = drbg.generate(64)
+                pos = 0
+            byte = block[pos]
+            pos += 1
+            if byte < limit:
+                break
+        j = byte % bound
+        order[i], order[j] = order[j], order[i]
+    return bytes(order)
+
+
+def verify_game(seed_hex: str, commitment: str, called_numbers: str) -> Optional[str]:
+    """Check a finished game's revealed seed against its commitment and its calls; returns the problem, if any."""
+    try:
+        seed = bytes.fromhex(seed_hex)
+    except ValueError:
+        return "seed is not hex"
+    if not hmac.compare_digest(seed_hash(seed), commitment or ""):
+        return "seed does not match the commitment"
+    try:
+        called = bytes(int(number) for number in called_numbers.split(",")) if called_numbers else b""
+    except ValueError:
+        return "called numbers are malformed"
+    if len(called) > NUMBERS:
+        return f"{len(called)} numbers were called"
+    drawn = draw_order(seed)
+    if drawn[:len(called)] != called:
+        at = next(i for i, (a, b) in enumerate(zip(called, drawn)) if a != b)
+        return f"call {at + 1} is {called[at]}, but the seed draws {drawn[at]}"
+    return None
+
+
+def verify_games(since_id: int = 0, chunk: int = 10000) -> Iterator[Dict[str, object]]:
+    """Check every game with a revealed seed after `since_id`; yields each failure, and a count per chunk checked.
+
+    Reads from a server-side cursor in chunks, so it runs over the whole table in constant memory.
+    """
+    from sqlalchemy import select
+
+    from database import db
+    from models import Game
+
+    GAMES = Game.__table__
+    query = (select(GAMES.c.id, GAMES.c.seed, GAMES.c.seed_hash, GAMES.c.called_numbers)
+             .where(GAMES.c.seed.is_not(None), GAMES.c.id > since_id).order_by(GAMES.c.id))
+    with db.engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk).execute(query)
+        for part in result.partitions():
+            for game_id, seed, commitment, called in part:
+                problem = verify_game(seed, commitment, called)
+                if problem is not None:
+                    yield {"game_id": game_id, "problem": problem}
+            yield {"checked": len(part)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that finished games called the numbers their seeds committed to")
+    sub = parser.add_subparsers(dest="command", required=True)
+    verify = sub.add_parser("verify", help="check every finished game in the database")
+    verify.add_argument("--since-id", type=int, default=0)
+    draw = sub.add_parser("draw", help="print the commitment and draw order of a revealed seed")
+    draw.add_argument("seed", help="hex seed revealed at the end of the game")
+    args = parser.parse_args()
+
+    if args.command == "draw":
+        seed = bytes.fromhex(args.seed)
+        print(f"commitment {seed_hash(seed)}")
+        print("draw order " + ",".join(map(str, draw_order(seed))))
+        return 0
+
+    from database import create_db_app
+    app = create_db_app(__name__)
+    checked = failed = 0
+    started = time.perf_counter()
+    with app.app_context():
+        for result in verify_games(args.since_id):
+            if "checked" in result:
+                checked += result["checked"]
+            else:
+                failed += 1
+                print(f"game {result['game_id']}: {result['problem']}")
+    elapsed = time.perf_counter() - started
+    print(f"Checked {checked} games in {elapsed:.2f}s ({checked / elapsed if elapsed else 0:,.0f} games/s), "
+          f"{failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
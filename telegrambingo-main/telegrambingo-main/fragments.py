@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from functools import lru_cache
+from threading import Lock
+from typing import Iterable, List, Tuple
+
+from markupsafe import Markup
+
+from config import CARTELA_SIZE, FRAGMENT_CACHE_GAMES
+from game_logic import cartela
+
+CENTER = 12  # free space index on the 5x5 board
+
+
+@lru_cache(maxsize=CARTELA_SIZE + 1)
+def cartela_cells(cartela_number: int) -> Tuple[Tuple[int, str, str], ...]:
+    """Precompile the 25 board cells of a cartela as (number, unmarked, marked) HTML."""
+    board, _ = cartela(cartela_number)
+    cells = []
+    for index, number in enumerate(board):
+        label = "FREE" if index == CENTER else str(number)
+        template = ('<div class="number-cell{active}" data-number="%d" '
+                    'onclick="markNumber(%d)">%s</div>') % (number, number, label)
+        marked = template.format(active=" active")
+        unmarked = marked if index == CENTER else template.format(active="")
+        cells.append((number, unmarked, marked))
+    return tuple(cells)
+
+
+def render_player_board(cartela_number: int, marked: Iterable[int]) -> Markup:
+    """Assemble a player's board from the cached cartela cells and their marks."""
+    marked = set(marked)
+    return Markup("".join(marked_html if number in marked else unmarked_html
+                          for number, unmarked_html, marked_html in cartela_cells(cartela_number)))
+
+
+class CalledBoardCache:
+    """Per-game called-number board, updated only with numbers called since the last render."""
+
+    def __init__(self, max_games: int = FRAGMENT_CACHE_GAMES):
+        self.max_games = max_games
+        self._games: "OrderedDict[int, Tuple[int, List[str], Markup]]" = OrderedDict()
+        self._lock = Lock()
+
+    @staticmethod
+    def _cell(number: int, active: bool) -> str:
+        return '<div class="number-cell%s" id="called-%d">%d</div>' % (
+            " active" if active else "", number, number)
+
+    def render(self, game_id: int, called_numbers: List[int]) -> Markup:
+        """Return the 75-number board for a game, reusing the previous render."""
+        with self._lock:
+            entry = self._games.get(game_id)
+            if entry is not None and entry[0] == len(called_numbers):
+                self._games.move_to_end(game_id)
+                return entry[2]
+
+            if entry is None or entry[0] > len(called_numbers):
+                cells = [self._cell(n, False) for n in range(1, 76)]
+                new_calls = called_numbers
+            else:
+                cells = entry[1]
+                new_calls = called_numbers[entry[0]:]
+
+            for number in new_calls:
+                cells[number - 1] = self._cell(number, True)
+
+            html = Markup("".join(cells))
+            self._games[game_id] = (len(called_numbers), cells, html)
+            self._games.move_to_end(game_id)
+            while len(self._games) > self.max_games:
+                self._games.popitem(last=False)
+            return html
+
+    def discard(self, game_id: int):
+        """Drop a game's cached board."""
+        with self._lock:
+            self._games.pop(game_id, None)
+
+
+called_boards = CalledBoardCache()
@@ -0,0 +1,265 @@
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Hashable, List, Tuple
+
+from sqlalchemy import insert
+
+import metrics
+from config import (
+    FRAUD_BATCH_INTERVAL, FRAUD_FAST_CLAIMS, FRAUD_FLAG_COOLDOWN, FRAUD_MAX_KEYS, FRAUD_MAX_MARKS_PER_MINUTE,
+    FRAUD_MAX_REFERRALS_PER_HOUR, FRAUD_MAX_ROOMS, FRAUD_MIN_CLAIM_SECONDS, FRAUD_PHONE_ACCOUNTS,
+    FRAUD_PHONE_WINDOW, FRAUD_QUEUE_SIZE, FRAUD_REPLAY_WINDOW, FRAUD_ROOM_WINDOW, FRAUD_WEBHOOK_SOURCES,
+)
+from database import db
+from models import FraudFlag
+
+logger = logging.getLogger(__name__)
+
+FRAUD_EVENTS = metrics.counter("bingo_fraud_events", "Events checked by the fraud detector", ["kind"])
+FRAUD_DROPPED = metrics.counter("bingo_fraud_events_dropped", "Events dropped because the detector fell behind")
+FRAUD_FLAGS = metrics.counter("bingo_fraud_flags", "Fraud flags raised", ["rule"])
+
+# Event kinds
+WEBHOOK = "webhook"  # source, phone, amount, payload digest
+PHONE = "phone"  # telegram id, phone, referrer telegram id
+REFERRAL = "referral"  # telegram id, referrer telegram id
+JOIN = "join"  # user id, game id
+MARK = "mark"  # user id, game id
+CLAIM = "claim"  # user id, game id, seconds since the last call
+
+Flag = Tuple[str, str, str]  # rule, subject, detail
+
+_events: "queue.Queue" = queue.Queue(maxsize=FRAUD_QUEUE_SIZE)
+_engine = None
+
+
+def record(kind: str, *fields):
+    """Queue an event for the detector. Never blocks and never touches the database."""
+    try:
+        _events.put_nowait((kind, time.time(), fields))
+    except queue.Full:
+        FRAUD_DROPPED.inc()
+
+
+def payload_digest(data: dict) -> str:
+    """Digest of a webhook payload, equal for byte-for-byte replays whatever the key order."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class _Lru(OrderedDict):
+    """Mapping that evicts its least recently touched keys beyond `max_keys`."""
+
+    def __init__(self, max_keys: int):
+        super().__init__()
+        self.max_keys = max_keys
+
+    def touch(self, key: Hashable, default_factory):
+        entry = self.get(key)
+        if entry is None:
+            entry = self[key] = default_factory()
+            if len(self) > self.max_keys:
+                self.popitem(last=False)
+        else:
+            self.move_to_end(key)
+        return entry
+
+
+class SlidingCounter:
+    """Per-key event counts over roughly the last `window` seconds, kept in `buckets` time slices.
+
+    Memory is bounded by `max_keys` keys of at most `buckets` slices each; the
+    least recently seen keys are evicted first.
+    """
+
+    def __init__(self, window: float, buckets: int = 6, max_keys: int = FRAUD_MAX_KEYS):
+        self.width = window / buckets
+        self.buckets = buckets
+        self._keys = _Lru(max_keys)
+
+    def add(self, key: Hashable, now: float, amount: int = 1) -> int:
+        """Count an event and return the key's total in the window."""
+        slot = int(now // self.width)
+        slices = self._keys.touch(key, dict)
+        slices[slot] = slices.get(slot, 0) + amount
+        if len(slices) > 1:
+            for old in [s for s in slices if s <= slot - self.buckets]:
+                del slices[old]
+        return sum(slices.values())
+
+
+class SlidingDistinct:
+    """Distinct values per key seen in the last `window` seconds, at most `cap` per key."""
+
+    def __init__(self, window: float, cap: int = 16, max_keys: int = FRAUD_MAX_KEYS):
+        self.window = window
+        self.cap = cap
+        self._keys = _Lru(max_keys)
+
+    def add(self, key: Hashable, value: Hashable, now: float) -> int:
+        """Note a value for the key and return how many distinct values it has in the window."""
+        values = self._keys.touch(key, OrderedDict)
+        values[value] = now
+        values.move_to_end(value)
+        while values and (len(values) > self.cap or next(iter(values.values())) < now - self.window):
+            values.popitem(last=False)
+        return len(values)
+
+    def values(self, key: Hashable) -> List[Hashable]:
+        values = self._keys.get(key)
+        return list(values) if values else []
+
+
+class FraudDetector:
+    """Applies the fraud rules to events in arrival order, in memory; returns the flags raised."""
+
+    def __init__(self, max_keys: int = FRAUD_MAX_KEYS):
+        self.replays = SlidingCounter(FRAUD_REPLAY_WINDOW, max_keys=max_keys)
+        self.phone_accounts = SlidingDistinct(FRAUD_PHONE_WINDOW, max_keys=max_keys)
+        self.rooms = SlidingDistinct(FRAUD_ROOM_WINDOW, cap=FRAUD_MAX_ROOMS * 2, max_keys=max_keys)
+        self.marks = SlidingCounter(60, max_keys=max_keys)
+        self.fast_claims = SlidingCounter(3600, max_keys=max_keys)
+        self.referrals = SlidingCounter(3600, max_keys=max_keys)
+        self.referrers = _Lru(max_keys)  # telegram id -> referrer telegram id
+        self.flagged = _Lru(max_keys)  # (rule, subject) -> time flagged
+        self.handlers = {WEBHOOK: self.webhook, PHONE: self.phone, REFERRAL: self.referral,
+                         JOIN: self.join, MARK: self.mark, CLAIM: self.claim}
+
+    def process(self, kind: str, at: float, fields: tuple) -> List[Flag]:
+        flags = []
+        self.handlers[kind](at, flags, *fields)
+        return [flag for flag in flags if self._fresh(flag, at)]
+
+    def _fresh(self, flag: Flag, at: float) -> bool:
+        """Whether this rule hasn't flagged this subject within the cooldown."""
+        key = flag[:2]
+        last = self.flagged.get(key)
+        if last is not None and at - last < FRAUD_FLAG_COOLDOWN:
+            return False
+        self.flagged.touch(key, float)  # bounds the LRU
+        self.flagged[key] = at
+        return True
+
+    def webhook(self, at, flags, source, phone, amount, digest):
+        if FRAUD_WEBHOOK_SOURCES and source not in FRAUD_WEBHOOK_SOURCES:
+            flags.append(("webhook_source", f"source:{source}",
+                          f"deposit webhook for {phone} ({amount} birr) from an unknown sender"))
+        count = self.replays.add(digest, at)
+        if count > 1:
+            flags.append(("webhook_replay", f"phone:{phone}",
+                          f"the same deposit webhook ({amount} birr) arrived {count} times within an hour"))
+
+    def phone(self, at, flags, telegram_id, phone, referrer_id):
+        if referrer_id is not None:
+            self.referrers.touch(telegram_id, lambda: referrer_id)
+        count = self.phone_accounts.add(phone, telegram_id, at)
+        if count < FRAUD_PHONE_ACCOUNTS:
+            return
+        accounts = self.phone_accounts.values(phone)
+        flags.append(("shared_phone", f"phone:{phone}", f"{count} accounts registered this phone: "
+                      + ", ".join(map(str, accounts))))
+        # Accounts on one phone that referred each other, or share a referrer, farm referral bonuses
+        referred = {account: self.referrers.get(account) for account in accounts}
+        ring = {r for r in referred.values() if r in referred}
+        ring |= {r for r, n in Counter(referred.values()).items() if r is not None and n > 1}
+        for referrer in ring:
+            flags.append(("referral_ring", f"telegram:{referrer}",
+                          f"accounts {', '.join(map(str, accounts))} on one phone were referred by {referrer}"))
+
+    def referral(self, at, flags, telegram_id, referrer_id):
+        self.referrers.touch(telegram_id, lambda: referrer_id)
+        count = self.referrals.add(referrer_id, at)
+        if count >= FRAUD_MAX_REFERRALS_PER_HOUR:
+            flags.append(("referral_burst", f"telegram:{referrer_id}", f"{count} new referees within an hour"))
+
+    def join(self, at, flags, user_id, game_id):
+        count = self.rooms.add(user_id, game_id, at)
+        if count >= FRAUD_MAX_ROOMS:
+            flags.append(("many_rooms", f"user:{user_id}",
+                          f"joined {count} rooms within {FRAUD_ROOM_WINDOW}s"))
+
+    def mark(self, at, flags, user_id, game_id):
+        count = self.marks.add(user_id, at)
+        if count > FRAUD_MAX_MARKS_PER_MINUTE:
+            flags.append(("mark_rate", f"user:{user_id}", f"{count} marks within a minute, latest in game {game_id}"))
+
+    def claim(self, at, flags, user_id, game_id, delay):
+        if delay is None or delay >= FRAUD_MIN_CLAIM_SECONDS:
+            return
+        count = self.fast_claims.add(user_id, at)
+        if count >= FRAUD_FAST_CLAIMS:
+            flags.append(("fast_claim", f"user:{user_id}",
+                          f"{count} claims within {FRAUD_MIN_CLAIM_SECONDS}s of a call in an hour, "
+                          f"latest {delay * 1000:.0f}ms after the call in game {game_id}"))
+
+
+def save_flags(flags: List[Tuple[float, Flag]]):
+    """Insert flags in one statement. Call inside an app context."""
+    try:
+        db.session.execute(insert(FraudFlag), [
+            {"rule": rule, "subject": subject[:64], "detail": detail, "created_at": datetime.utcfromtimestamp(at)}
+            for at, (rule, subject, detail) in flags
+        ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+class FraudEngine:
+    """Drains events into the detector and writes its flags in batches."""
+
+    def __init__(self, app, interval: float = FRAUD_BATCH_INTERVAL):
+        self.app = app
+        self.interval = interval
+        self.detector = FraudDetector()
+        self._thread = threading.Thread(target=self._run, name="fraud", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _drain(self) -> List[Tuple[float, Flag]]:
+        flags = []
+        kinds = Counter()
+        deadline = time.monotonic() + self.interval
+        while True:
+            try:
+                kind, at, fields = _events.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            kinds[kind] += 1
+            try:
+                flags.extend((at, flag) for flag in self.detector.process(kind, at, fields))
+            except Exception as e:
+                logger.error("Fraud rule for %s failed: %s", kind, e)
+        for kind, count in kinds.items():
+            FRAUD_EVENTS.inc(count, kind=kind)
+        return flags
+
+    def _run(self):
+        while True:
+            flags = self._drain()
+            if not flags:
+                continue
+            for _, (rule, subject, _) in flags:
+                FRAUD_FLAGS.inc(rule=rule)
+                logger.warning("Fraud flag %s for %s", rule, subject)
+            try:
+                with self.app.app_context():
+                    save_flags(flags)
+            except Exception as e:
+                logger.error("Saving %d fraud flags failed: %s", len(flags), e)
+
+
+def start_fraud_engine(app) -> FraudEngine:
+    """Start this process's fraud detector."""
+    global _engine
+    if _engine is None:
+        _engine = FraudEngine(app)
+        _engine.start()
+    return _engine
@@ -0,0 +1,241 @@
+import asyncio
+import atexit
+import copy
+import json
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+from sqlalchemy import bindparam, delete, select
+from sqlalchemy.dialects import postgresql, sqlite
+
+import metrics
+from config import FSM_FLUSH_INTERVAL, FSM_PURGE_INTERVAL, FSM_STATE_TTL
+from database import db
+from models import FsmState
+
+logger = logging.getLogger(__name__)
+
+FSM_STORAGE_SECONDS = metrics.histogram(
+    "bingo_fsm_storage_seconds", "FSM storage database round trips", ["op"])
+
+UPSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+# Records read or written during the current update, keyed by storage key
+_scope: ContextVar[Optional[Dict[str, "_Record"]]] = ContextVar("fsm_scope", default=None)
+
+
+class _Record:
+    __slots__ = ("state", "data", "dirty")
+
+    def __init__(self, state: Optional[str] = None, data: Optional[Dict[str, Any]] = None):
+        self.state = state
+        self.data = data or {}
+        self.dirty = False
+
+    def copy(self) -> "_Record":
+        return _Record(self.state, copy.deepcopy(self.data))
+
+
+class DatabaseStorage(BaseStorage):
+    """aiogram FSM storage in the fsm_state table, shared by every bot instance.
+
+    Within an update opened by FSMUpdateScope each key is read at most once.
+    Changed states are group-committed by a background thread every
+    `flush_interval` seconds, so an update never waits on a write and a key
+    changed several times in between is written once. Other instances see a
+    change once it is flushed. States untouched for `ttl` seconds read as
+    empty and are purged.
+    """
+
+    def __init__(self, app, ttl: float = FSM_STATE_TTL, flush_interval: float = FSM_FLUSH_INTERVAL):
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        with app.app_context():
+            self.engine = db.engine
+        # Built once: constructing statements costs more than running them against a warm pool
+        table = FsmState.__table__
+        self._select = select(table.c.state, table.c.data).where(
+            table.c.key == bindparam("key"), table.c.updated_at >= bindparam("cutoff"))
+        self._delete = delete(table).where(table.c.key.in_(bindparam("keys", expanding=True)))
+        self._purge = delete(table).where(table.c.updated_at < bindparam("cutoff"))
+        insert = UPSERTS[self.engine.dialect.name](table)
+        self._upsert = insert.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={column: insert.excluded[column] for column in ("state", "data", "updated_at")},
+        )
+        self._pending: Dict[str, _Record] = {}  # written by updates, not yet flushed
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._purger: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _name(key: StorageKey) -> str:
+        return ":".join("" if part is None else str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny))
+
+    def _load(self, name: str) -> _Record:
+        """Read a record from the database; blocking, so run it off the event loop."""
+        started = time.perf_counter()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        with self.engine.connect() as conn:
+            row = conn.execute(self._select, {"key": name, "cutoff": cutoff}).first()
+        FSM_STORAGE_SECONDS.observe(time.perf_counter() - started, op="load")
+        if row is None:
+            return _Record()
+        return _Record(row.state, json.loads(row.data) if row.data else None)
+
+    def _write(self, records: Dict[str, _Record]):
+        """Upsert the given records in one transaction; empty records are deleted instead."""
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        cleared = [name for name, record in records.items() if record.state is None and not record.data]
+        rows = [
+            {"key": name, "state": record.state, "data": json.dumps(record.data) if record.data else None,
+             "updated_at": now}
+            for name, record in records.items() if record.state is not None or record.data
+        ]
+        with self.engine.begin() as conn:
+            if cleared:
+                conn.execute(self._delete, {"keys": cleared})
+            if rows:
+                conn.execute(self._upsert, rows)
+        FSM_STORAGE_SECONDS.observe(time.perf_counter() - started, op="write")
+
+    async def _get(self, key: StorageKey) -> _Record:
+        name = self._name(key)
+        scope = _scope.get()
+        if scope is not None and name in scope:
+            return scope[name]
+        with self._lock:
+            pending = self._pending.get(name)
+        if pending is not None:
+            record = pending.copy()
+        else:
+            record = await asyncio.to_thread(self._load, name)
+        if scope is not None:
+            scope[name] = record
+        return record
+
+    def _put(self, key: StorageKey, record: _Record):
+        scope = _scope.get()
+        if scope is None:
+            self.submit({self._name(key): record})
+        else:
+            record.dirty = True
+
+    def submit(self, records: Dict[str, _Record]):
+        """Queue records for the next group commit."""
+        with self._lock:
+            self._pending.update(records)
+        self._ensure_thread()
+
+    def end_update(self, scope: Dict[str, _Record]):
+        """Queue the records an update changed."""
+        dirty = {name: record for name, record in scope.items() if record.dirty}
+        if dirty:
+            self.submit(dirty)
+
+    def flush(self):
+        """Write every queued record in one transaction."""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if not batch:
+                return
+            try:
+                self._write(batch)
+            except Exception:
+                with self._lock:
+                    # Requeue, keeping anything newer written in the meantime
+                    self._pending = {**batch, **self._pending}
+                raise
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="fsm-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("FSM state flush failed: %s", e)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._get(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._put(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return (await self._get(key)).state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = await self._get(key)
+        record.data = copy.deepcopy(data)
+        self._put(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        return copy.deepcopy((await self._get(key)).data)
+
+    def purge_expired(self) -> int:
+        """Delete states older than the TTL and return how many were deleted."""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+        with self.engine.begin() as conn:
+            return conn.execute(self._purge, {"cutoff": cutoff}).rowcount
+
+    async def _purge_forever(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                purged = await asyncio.to_thread(self.purge_expired)
+                if purged:
+                    logger.info("Purged %d expired FSM states", purged)
+            except Exception as e:
+                logger.error("FSM state purge failed: %s", e)
+
+    def start_purging(self, interval: float = FSM_PURGE_INTERVAL):
+        """Delete expired states every `interval` seconds on the running event loop."""
+        if self._purger is None:
+            self._purger = asyncio.create_task(self._purge_forever(interval))
+
+    async def close(self) -> None:
+        if self._purger is not None:
+            self._purger.cancel()
+            self._purger = None
+        await asyncio.to_thread(self.flush)
+
+
+class FSMUpdateScope(BaseMiddleware):
+    """Cache FSM reads and collect FSM writes for the duration of one update.
+
+    Register as an update outer middleware ahead of the dispatcher's FSM middleware.
+    """
+
+    def __init__(self, storage: DatabaseStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        scope: Dict[str, _Record] = {}
+        token = _scope.set(scope)
+        try:
+            return await handler(event, data)
+        finally:
+            _scope.reset(token)
+            self.storage.end_update(scope)
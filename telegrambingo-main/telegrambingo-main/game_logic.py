@@ -1,14 +1,94 @@
 import random
+import logging
 from datetime import datetime
+from functools import lru_cache
 from typing import List, Dict, Optional, Tuple
+from config import DEFAULT_PRIZE_TABLE
+from fairness import draw_order, new_seed, seed_hash
+from metrics import GAME_OP_SECONDS, timed
+from patterns import CENTER, Pattern, prize_tiers
+
+logger = logging.getLogger(__name__)
+
+# Journal event types
+EVENT_JOIN = 1
+EVENT_START = 2
+EVENT_CALL = 3
+EVENT_MARK = 4
+EVENT_CLAIM = 5
+EVENT_END = 6
+
+
+class PlayerState:
+    """A player's cartela and marks.
+
+    The board is shared by every player holding the same cartela. Marks are
+    two bitmasks: `mask` over the 25 board cells for pattern checks and
+    `numbers` over the numbers 1-75 (bit n for n) for validation. Dict-style
+    reads (`player['marked']`, `player.get('cartela_number')`) keep working
+    for views and templates.
+    """
+
+    __slots__ = ("cartela_number", "board", "cells", "mask", "numbers")
+
+    def __init__(self, cartela_number: int, mask: int = CENTER):
+        self.cartela_number = cartela_number
+        self.board, self.cells = cartela(cartela_number)
+        self.mask = mask
+        self.numbers = 0
+        while mask:
+            low = mask & -mask
+            self.numbers |= 1 << self.board[low.bit_length() - 1]
+            mask ^= low
+
+    def __reduce__(self):
+        # Rebuilt from the cartela so unpickled players share boards again
+        return PlayerState, (self.cartela_number, self.mask)
+
+    @property
+    def marked(self) -> List[int]:
+        """Marked numbers, ascending."""
+        return [number for number in sorted(self.board) if self.numbers >> number & 1]
+
+    def mark(self, number: int) -> bool:
+        """Mark a number on the board; returns False if it isn't on the board."""
+        cell = self.cells.get(number)
+        if cell is None:
+            return False
+        self.mask |= 1 << cell
+        self.numbers |= 1 << number
+        return True
+
+    def __getitem__(self, key: str):
+        if key != "marked" and key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
 
 class BingoGame:
-    def __init__(self, game_id: int, entry_price: int = 10):
+    __slots__ = (
+        "game_id", "entry_price", "pool", "players", "called_numbers", "_called", "prize_table", "prizes",
+        "awards", "status", "winner_id", "created_at", "finished_at", "min_players", "max_players",
+        "last_call_time", "seed", "draw_order", "journal",
+    )
+
+    def __init__(self, game_id: int, entry_price: int = 10, seed: Optional[bytes] = None,
+                 prize_table: str = DEFAULT_PRIZE_TABLE):
         self.game_id = game_id
         self.entry_price = entry_price
         self.pool = 0
-        self.players: Dict[int, dict] = {}  # user_id -> {board: List[int], marked: List[int]}
+        self.players: Dict[int, PlayerState] = {}
         self.called_numbers: List[int] = []
+        self._called = (0, 0)  # (len(called_numbers), bitmask of them), caught up as calls grow
+        self.prize_table = prize_table
+        self.prizes = prize_tiers(prize_table)
+        self.awards: Dict[str, Tuple[int, float]] = {}  # pattern name -> (user_id, prize)
         self.status = "waiting"  # waiting, active, finished
         self.winner_id = None
         self.created_at = datetime.utcnow()
@@ -16,21 +96,50 @@ class BingoGame:
         self.min_players = 1  # Temporarily set to 1 for testing
         self.max_players = 100  # Maximum players allowed
         self.last_call_time = None
+        # Every draw derives from the seed, which is committed to by seed_hash when the game is
+        # created and revealed when it ends; precomputed so calls only index into it
+        self.seed = seed if seed is not None else new_seed()
+        self.draw_order = draw_order(self.seed)
+        self.journal = None  # GameJournal receiving state changes, if journaling is enabled
 
-    def generate_board(self, cartela_number: int) -> List[int]:
+    def __getstate__(self):
+        state = {name: getattr(self, name) for name in self.__slots__}
+        state['journal'] = None  # journals belong to the process writing them
+        return state
+
+    def __setstate__(self, state: dict):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def _record(self, event: int, user_id: int = 0, number: int = 0, cartela: int = 0,
+                at: Optional[datetime] = None):
+        if self.journal is not None:
+            self.journal.append(event, user_id, number, cartela, at)
+
+    @property
+    def seed_hash(self) -> str:
+        """Commitment to the seed, published when the game is created."""
+        return seed_hash(self.seed)
+
+    @property
+    def revealed_seed(self) -> Optional[str]:
+        """The seed in hex once the game is finished, for checking against seed_hash."""
+        if self.status != "finished":
+            return None
+        return self.seed.hex()
+
+    @staticmethod
+    def generate_board(cartela_number: int) -> List[int]:
         """Generate a 5x5 BINGO board with consistent numbers based on cartela number."""
         # Use cartela number as seed for random number generation
-        random.seed(cartela_number)
+        rng = random.Random(cartela_number)
 
         # Generate numbers for each column with proper ranges
-        b_numbers = random.sample(range(1, 16), 5)
-        i_numbers = random.sample(range(16, 31), 5)
-        n_numbers = random.sample(range(31, 46), 5)
-        g_numbers = random.sample(range(46, 61), 5)
-        o_numbers = random.sample(range(61, 76), 5)
-
-        # Reset random seed
-        random.seed()
+        b_numbers = rng.sample(range(1, 16), 5)
+        i_numbers = rng.sample(range(16, 31), 5)
+        n_numbers = rng.sample(range(31, 46), 5)
+        g_numbers = rng.sample(range(46, 61), 5)
+        o_numbers = rng.sample(range(61, 76), 5)
 
         board = []
         for i in range(5):
@@ -44,41 +153,45 @@ class BingoGame:
         if user_id in self.players or len(self.players) >= self.max_players:
             return []
 
-        if cartela_number is None:
+        drawn = cartela_number is None
+        if drawn:
             # Generate a random unused cartela number
-            used_cartelas = set(p.get('cartela_number', 0) for p in self.players.values())
+            used_cartelas = set(p.cartela_number for p in self.players.values())
             available = [n for n in range(1, 101) if n not in used_cartelas]
-            cartela_number = random.choice(available) if available else 0
-
-        board = self.generate_board(cartela_number)
-        self.players[user_id] = {
-            'board': board,
-            'marked': [board[12]],  # Center square is automatically marked
-            'cartela_number': cartela_number
-        }
+            rng = random.Random(f"{self.seed}-{len(self.players)}")
+            cartela_number = rng.choice(available) if available else 0
+        elif any(p.cartela_number == cartela_number for p in self.players.values()):
+            return []  # a cartela is held by one player per game
+
+        player = self.players[user_id] = PlayerState(cartela_number)  # Center square is automatically marked
         self.pool += self.entry_price
+        self._record(EVENT_JOIN, user_id, int(drawn), cartela_number)
 
         # Auto-start if we reach minimum players
         if len(self.players) >= self.min_players:
             self.start_game()
 
-        return board
+        return list(player.board)
 
+    @timed(GAME_OP_SECONDS, op="call_number")
     def call_number(self) -> Optional[str]:
         """Call the next random number if the game is active."""
         if self.status != "active":
             return None
 
-        # Get list of uncalled numbers
-        available = [n for n in range(1, 76) if n not in self.called_numbers]
-        if not available:
+        # Numbers are called in the game's precomputed draw order
+        if len(self.called_numbers) >= len(self.draw_order):
             self.status = "finished"  # End game if all numbers are called
+            self.finished_at = datetime.utcnow()
+            self._record(EVENT_END, at=self.finished_at)
             return None
 
         # Call a new number
-        number = random.choice(available)
+        number = self.draw_order[len(self.called_numbers)]
         self.called_numbers.append(number)
         self.last_call_time = datetime.utcnow()
+        self._record(EVENT_CALL, number=number, at=self.last_call_time)
+        logger.debug("Game %s called %s", self.game_id, number, extra={'sample': 'call'})
         return self.format_number(number)
 
     @staticmethod
@@ -96,58 +209,95 @@ class BingoGame:
             prefix = "O"
         return f"{prefix}-{number}"
 
+    @timed(GAME_OP_SECONDS, op="mark_number")
     def mark_number(self, user_id: int, number: int) -> bool:
         """Mark a number on a player's board."""
         if user_id not in self.players:
             return False
 
+        if not isinstance(number, int) or isinstance(number, bool) or not 1 <= number <= 75:
+            return False
         player = self.players[user_id]
         # Only allow marking numbers that are both on the player's board and have been called
-        if number in player['board'] and number in self.called_numbers:
-            if number not in player['marked']:
-                player['marked'].append(number)
-                player['marked'].sort()  # Keep marked numbers sorted
+        if not self._called_bits() >> number & 1:
+            return False
+        if player.numbers >> number & 1:
             return True
-        return False
+        if not player.mark(number):
+            return False
+        self._record(EVENT_MARK, user_id, number)
+        logger.debug("Game %s user %s marked %s", self.game_id, user_id, number, extra={'sample': 'mark'})
+        return True
+
+    def player_marks(self, user_id: int) -> List[int]:
+        """The numbers a player has marked."""
+        return self.players[user_id].marked
 
+    def _called_bits(self) -> int:
+        """Bitmask of the called numbers, bit n for number n."""
+        count, bits = self._called
+        called = self.called_numbers
+        if count != len(called):
+            if count > len(called):  # the list was replaced
+                count, bits = 0, 0
+            for number in called[count:]:
+                bits |= 1 << number
+            self._called = (len(called), bits)
+        return bits
+
+    def winning_tiers(self, mask: int) -> List[Tuple[Pattern, float]]:
+        """Prize tiers not yet awarded whose pattern the marked cells complete."""
+        return [(pattern, share) for pattern, share in self.prizes
+                if pattern.name not in self.awards and pattern.matches(mask)]
+
+    @timed(GAME_OP_SECONDS, op="check_winner")
     def check_winner(self, user_id: int) -> Tuple[bool, str]:
-        """Check if a player has won."""
+        """Check if a player has completed a prize pattern that is still open."""
         if user_id not in self.players:
             return False, "Player not in game"
 
         player = self.players[user_id]
-        marked = set(player['marked'])
-        board = player['board']
-
-        # Validate that all marked numbers are actually on the board and have been called
-        for num in marked:
-            if num not in board and num != board[12]:  # Allow center free space
-                return False, "Invalid marked numbers detected"
-            if num not in self.called_numbers and num != board[12]:  # Allow center free space
-                return False, "Number has not been called yet"
-
-        # Check rows
-        for i in range(0, 25, 5):
-            if all(board[i + j] in marked for j in range(5)):
-                return True, "Winner - Row complete!"
-
-        # Check columns
-        for i in range(5):
-            if all(board[i + j*5] in marked for j in range(5)):
-                return True, "Winner - Column complete!"
 
-        # Check diagonals
-        if all(board[i] in marked for i in [0, 6, 12, 18, 24]):
-            return True, "Winner - Diagonal complete!"
-        if all(board[i] in marked for i in [4, 8, 12, 16, 20]):
-            return True, "Winner - Diagonal complete!"
+        # Marks can only be board cells; validate they have all been called, allowing the center free space
+        if player.numbers & ~(self._called_bits() | 1 << player.board[12]):
+            return False, "Number has not been called yet"
+
+        won = self.winning_tiers(player.mask)
+        if not won:
+            return False, "Keep playing"
+        return True, f"Winner - {', '.join(pattern.label for pattern, _ in won)}!"
+
+    def award(self, user_id: int) -> float:
+        """Give the player every open tier they have completed; returns the prize total."""
+        total = 0.0
+        for pattern, share in self.winning_tiers(self.players[user_id].mask):
+            prize = round(self.pool * share, 2)
+            self.awards[pattern.name] = (user_id, prize)
+            total += prize
+        return total
 
-        return False, "Keep playing"
+    def is_complete(self) -> bool:
+        """Whether every prize tier has been won."""
+        return len(self.awards) == len(self.prizes)
+
+    def claim(self, user_id: int) -> Tuple[bool, str]:
+        """Handle a BINGO claim and record it in the journal."""
+        winner, message = self.check_winner(user_id)
+        if winner:
+            message = f"{message} Prize: {self.award(user_id):.2f} birr"
+        self._record(EVENT_CLAIM, user_id, int(winner))
+        return winner, message
+
+    def state_since(self, since: int) -> Tuple[int, List[int], str, Optional[int]]:
+        """Return the call cursor, calls made after `since`, status and winner."""
+        return len(self.called_numbers), self.called_numbers[since:], self.status, self.winner_id
 
     def start_game(self) -> bool:
         """Start the game if enough players have joined."""
         if len(self.players) < self.min_players:
             return False
+        if self.status != "active":
+            self._record(EVENT_START)
         self.status = "active"
         # Call first number automatically when game starts
         self.call_number() 
@@ -157,4 +307,12 @@ class BingoGame:
         """End the game and set the winner."""
         self.winner_id = winner_id
         self.status = "finished"
-        self.finished_at = datetime.utcnow()
\ No newline at end of file
+        self.finished_at = datetime.utcnow()
+        self._record(EVENT_END, winner_id, at=self.finished_at)
+
+
+@lru_cache(maxsize=None)
+def cartela(cartela_number: int) -> Tuple[Tuple[int, ...], Dict[int, int]]:
+    """A cartela's board and number -> cell index, built once and shared by every player holding it."""
+    board = tuple(BingoGame.generate_board(cartela_number))
+    return board, {number: cell for cell, number in enumerate(board)}
@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select, update
+
+from config import HISTORY_PAGE_SIZE
+from database import db
+from models import USER_TOTALS, Transaction, User
+
+EPOCH = datetime(1970, 1, 1)
+CURSOR_PREFIX = "hist"
+
+
+def encode_cursor(transaction: Transaction) -> str:
+    """Callback data pointing just past `transaction`; well under Telegram's 64 bytes."""
+    created_us = (transaction.created_at - EPOCH) // timedelta(microseconds=1)
+    return f"{CURSOR_PREFIX}:{created_us}:{transaction.id}"
+
+
+def decode_cursor(data: str) -> Tuple[datetime, int]:
+    """Return the (created_at, transaction_id) key from encode_cursor() output."""
+    prefix, created_us, transaction_id = data.split(":")
+    if prefix != CURSOR_PREFIX:
+        raise ValueError(f"Not a history cursor: {data}")
+    return EPOCH + timedelta(microseconds=int(created_us)), int(transaction_id)
+
+
+def history_page(user_id: int, before: Optional[Tuple[datetime, int]] = None,
+                 limit: int = HISTORY_PAGE_SIZE) -> Tuple[List[Transaction], bool]:
+    """Return a user's transactions newest first, starting after the `before` key.
+
+    Keyset pagination on (created_at, id) walks ix_transaction_user_created, so
+    every page costs the same however deep the user pages. Returns the page and
+    whether more rows follow.
+    """
+    query = Transaction.query.filter(Transaction.user_id == user_id)
+    if before is not None:
+        created_at, transaction_id = before
+        query = query.filter(or_(
+            Transaction.created_at < created_at,
+            and_(Transaction.created_at == created_at, Transaction.id < transaction_id),
+        ))
+    rows = query.order_by(Transaction.created_at.desc(), Transaction.id.desc()).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def win_rate(user: User) -> float:
+    return (user.games_won or 0) / user.games_played if user.games_played else 0.0
+
+
+def backfill_user_totals():
+    """Recompute every user's running totals from completed transactions in one UPDATE."""
+    values = {}
+    for tx_type, column in USER_TOTALS.items():
+        values[column] = select(func.coalesce(func.sum(func.abs(Transaction.amount)), 0.0)).where(
+            Transaction.user_id == User.id, Transaction.type == tx_type, Transaction.status == 'completed'
+        ).scalar_subquery()
+    db.session.execute(update(User).values(values))
+    db.session.commit()
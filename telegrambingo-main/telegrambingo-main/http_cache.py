@@ -0,0 +1,50 @@
+import gzip
+import logging
+
+from flask import request
+
+from config import COMPRESS_LEVEL, COMPRESS_MIN_SIZE, STATIC_MAX_AGE
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = {
+    'text/html', 'text/css', 'text/plain', 'application/json', 'application/javascript',
+}
+
+
+def compress_response(response):
+    """Gzip text responses for clients that accept it.
+
+    Streamed and passthrough bodies are left alone rather than buffered in full.
+    """
+    if (response.is_streamed or response.direct_passthrough
+            or response.status_code < 200 or response.status_code >= 300
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or 'gzip' not in request.headers.get('Accept-Encoding', '').lower()):
+        return response
+
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return response
+
+    compressed = gzip.compress(data, compresslevel=COMPRESS_LEVEL)
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = 'gzip'
+    response.headers['Content-Length'] = str(len(compressed))
+    response.vary.add('Accept-Encoding')
+    logger.debug("Compressed %s from %d to %d bytes", request.path, len(data), len(compressed))
+    return response
+
+
+def init_http_cache(app):
+    """Configure static cache headers and response compression."""
+    app.config['SEND_FILE_MAX_AGE_DEFAULT'] = STATIC_MAX_AGE
+
+    @app.after_request
+    def _cache_and_compress(response):
+        if request.endpoint == 'static':
+            response.cache_control.public = True
+            response.cache_control.max_age = STATIC_MAX_AGE
+            response.cache_control.immutable = True
+        return compress_response(response)
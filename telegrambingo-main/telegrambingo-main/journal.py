@@ -0,0 +1,344 @@
+import argparse
+import atexit
+import glob
+import hashlib
+import itertools
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from config import JOURNAL_DIR, JOURNAL_FLUSH_INTERVAL, JOURNAL_SEGMENT_BYTES
+from game_logic import (
+    BingoGame, EVENT_CALL, EVENT_CLAIM, EVENT_END, EVENT_JOIN, EVENT_MARK, EVENT_START, PlayerState,
+)
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"BSEG"
+VERSION = 1
+SEGMENT_HEADER = struct.Struct("<4sB")  # magic, version
+# Entries follow the segment header back to back, each starting with its kind
+OPEN = struct.Struct("<cqI32sd16s")  # b"O", game_id, entry_price, seed, created_at, prize table
+RECORD = struct.Struct("<c8sIBBHqQ")  # b"R", game tag, sequence, event, number, cartela, user_id, timestamp (us)
+ENTRIES = {b"O": OPEN, b"R": RECORD}
+EPOCH = datetime(1970, 1, 1)
+
+
+def to_epoch_us(value: datetime) -> int:
+    """Naive UTC datetime to integer epoch microseconds, without float rounding."""
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def from_epoch_us(ts: int) -> datetime:
+    return EPOCH + timedelta(microseconds=ts)
+
+
+def game_tag(seed: bytes) -> bytes:
+    """Eight bytes naming a game in the segments: the start of its seed's commitment, unique across processes."""
+    return hashlib.sha256(seed).digest()[:8]
+
+
+class GameJournal:
+    """Numbers one game's events and queues them on its process's segment writer."""
+
+    __slots__ = ("tag", "count", "_pending")
+
+    def __init__(self, tag: bytes, pending: deque, count: int = 0):
+        self.tag = tag
+        self.count = count  # records appended over the game's lifetime, in every process
+        self._pending = pending
+
+    def append(self, event: int, user_id: int, number: int, cartela: int,
+               at: Optional[datetime] = None):
+        ts = to_epoch_us(at) if at is not None else time.time_ns() // 1000
+        self._pending.append(RECORD.pack(b"R", self.tag, self.count, event, number, cartela, user_id, ts))
+        self.count += 1
+
+
+class JournalWriter:
+    """Group-commits every game's events to one segment file: one write and one fsync per interval.
+
+    Segments roll over at JOURNAL_SEGMENT_BYTES and at midnight UTC, under a day
+    directory, so only one file is ever open. A game's events carry its tag and a
+    per-game sequence number; per-game views are built when reading.
+    """
+
+    def __init__(self, directory: str, flush_interval: float = JOURNAL_FLUSH_INTERVAL,
+                 segment_bytes: int = JOURNAL_SEGMENT_BYTES):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.segment_bytes = segment_bytes
+        self._pending = deque()  # packed entries; appends and pops are atomic, so games never wait on a lock
+        self._flush_lock = threading.Lock()
+        self._file = None
+        self._day = None
+        self._names = itertools.count()
+        self._thread = None
+
+    def open(self, game: BingoGame, resume: bool = False, count: int = 0) -> GameJournal:
+        """Start (or resume after a shard move or restart, at record `count`) journaling a game.
+
+        Every open writes the game's header again, so the segments a process writes
+        always hold the headers of the games journaled in them.
+        """
+        created_at = game.created_at.replace(tzinfo=timezone.utc).timestamp()
+        self._pending.append(OPEN.pack(b"O", game.game_id, game.entry_price, game.seed, created_at,
+                                       game.prize_table.encode()))
+        game.journal = GameJournal(game_tag(game.seed), self._pending, count if resume else 0)
+        self._ensure_thread()
+        return game.journal
+
+    def detach(self, game: BingoGame) -> int:
+        """Flush a game's events so another process can take it over; returns its record count."""
+        count = game.journal.count if game.journal is not None else 0
+        game.journal = None
+        self.flush()
+        return count
+
+    def _segment(self):
+        """The open segment, rolling over to a new one when the day changes, it is full or it was pruned."""
+        day = datetime.utcnow().strftime("%Y-%m-%d")
+        # A segment idle for longer than JOURNAL_KEEP_SECONDS may have been pruned while open
+        if self._file is not None and (day != self._day or self._file.tell() >= self.segment_bytes
+                                       or os.fstat(self._file.fileno()).st_nlink == 0):
+            self._file.close()
+            self._file = None
+        if self._file is None:
+            os.makedirs(os.path.join(self.directory, day), exist_ok=True)
+            name = f"segment-{time.time_ns() // 1000}-{os.getpid()}-{next(self._names)}.bjl"
+            self._file = open(os.path.join(self.directory, day, name), "ab")
+            self._file.write(SEGMENT_HEADER.pack(MAGIC, VERSION))
+            self._day = day
+        return self._file
+
+    def flush(self):
+        """Write every pending entry to the segment and fsync it once."""
+        with self._flush_lock:
+            count = len(self._pending)
+            if not count:
+                return
+            popleft = self._pending.popleft
+            data = b"".join(popleft() for _ in range(count))
+            f = self._segment()
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _ensure_thread(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="journal-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError as e:
+                logger.error("Journal flush failed: %s", e)
+
+
+_writer: Optional[JournalWriter] = None
+
+
+def get_writer() -> Optional[JournalWriter]:
+    global _writer
+    if _writer is None and JOURNAL_DIR:
+        _writer = JournalWriter(JOURNAL_DIR)
+    return _writer
+
+
+def attach_journal(game: BingoGame, resume: bool = False, count: int = 0):
+    """Start journaling a game if journaling is enabled."""
+    writer = get_writer()
+    if writer is not None:
+        writer.open(game, resume=resume, count=count)
+
+
+def detach_journal(game: BingoGame) -> int:
+    """Stop journaling a game in this process; returns the record count to resume from."""
+    writer = get_writer()
+    if writer is None:
+        return 0
+    return writer.detach(game)
+
+
+def read_segment(path: str) -> Iterator[tuple]:
+    """Yield a segment's entries: (b"O", game_id, entry_price, seed, created_at, prize table) and
+    (b"R", tag, sequence, event, number, cartela, user_id, ts). A torn final entry is ignored."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if data[:SEGMENT_HEADER.size] != SEGMENT_HEADER.pack(MAGIC, VERSION):
+        raise ValueError(f"{path} is not a version {VERSION} journal segment")
+    pos, end = SEGMENT_HEADER.size, len(data)
+    while pos < end:
+        entry = ENTRIES.get(data[pos:pos + 1])
+        if entry is None:
+            raise ValueError(f"{path} has an unknown entry at byte {pos}")
+        if pos + entry.size > end:
+            break
+        yield entry.unpack_from(data, pos)
+        pos += entry.size
+
+
+def segments(directory: str, since: float = 0.0, days: Optional[int] = None) -> List[str]:
+    """Segment files under `directory` written to at or after `since`, optionally only from the last `days` days."""
+    if days is None:
+        paths = glob.glob(os.path.join(directory, "*", "*.bjl"))
+    else:
+        today = datetime.utcnow().date()
+        paths = [path for n in range(days + 1)
+                 for path in glob.glob(os.path.join(directory, f"{today - timedelta(days=n):%Y-%m-%d}", "*.bjl"))]
+    return sorted(path for path in paths if os.path.getmtime(path) >= since)
+
+
+def collect(paths: Iterable[str], skip: Optional[Dict[bytes, int]] = None,
+            tags: Optional[set] = None) -> Dict[bytes, Tuple[Optional[dict], Dict[int, tuple]]]:
+    """Gather per-game headers and records from segments: tag -> (header, sequence -> record).
+
+    Records numbered below skip[tag] are dropped, and only games in `tags` are kept if given.
+    """
+    skip = skip or {}
+    games: Dict[bytes, Tuple[Optional[dict], Dict[int, tuple]]] = {}
+    headers: Dict[bytes, dict] = {}
+    for path in paths:
+        try:
+            entries = list(read_segment(path))
+        except (OSError, ValueError) as e:
+            logger.warning("Skipping unreadable journal segment %s: %s", path, e)
+            continue
+        for entry in entries:
+            if entry[0] == b"R":
+                _, tag, seq, event, number, cartela, user_id, ts = entry
+                if (tags is not None and tag not in tags) or seq < skip.get(tag, 0):
+                    continue
+                games.setdefault(tag, (None, {}))[1][seq] = (event, number, cartela, user_id, ts)
+            else:
+                _, game_id, entry_price, seed, created_at, prize_table = entry
+                tag = game_tag(seed)
+                if (tags is not None and tag not in tags) or tag in headers:
+                    continue
+                headers[tag] = {"game_id": game_id, "entry_price": entry_price, "seed": seed,
+                                "created_at": created_at, "prize_table": prize_table.rstrip(b"\0").decode()}
+    return {tag: (headers.get(tag), games.get(tag, (None, {}))[1]) for tag in set(games) | set(headers)}
+
+
+def ordered(records: Dict[int, tuple]) -> List[tuple]:
+    return [records[seq] for seq in sorted(records)]
+
+
+def replay_records(game: BingoGame, records, at_call: Optional[int] = None) -> List[tuple]:
+    """Apply journal records to a game; stop before call number `at_call`. Returns the claims.
+
+    Every call is checked against the draw order derived from the game's seed,
+    so a tampered journal fails to replay.
+    """
+    players = game.players
+    called = game.called_numbers
+    draw_order = game.draw_order
+    claims = []
+    last_ts = None
+    for event, number, cartela, user_id, ts in records:
+        if event == EVENT_MARK:
+            players[user_id].mark(number)
+        elif event == EVENT_CALL:
+            if at_call is not None and len(called) >= at_call:
+                break
+            drawn = draw_order[len(called)]
+            if drawn != number:
+                raise ValueError(f"Call {len(called) + 1} is {number}, but the seed draws {drawn}")
+            called.append(number)
+            last_ts = ts
+        elif event == EVENT_JOIN:
+            players[user_id] = PlayerState(cartela)
+            game.pool += game.entry_price
+        elif event == EVENT_START:
+            game.status = "active"
+        elif event == EVENT_CLAIM:
+            if number:
+                game.award(user_id)
+            claims.append((ts, user_id, bool(number)))
+        elif event == EVENT_END:
+            game.status = "finished"
+            game.winner_id = user_id or None
+            game.finished_at = from_epoch_us(ts)
+    if last_ts is not None:
+        game.last_call_time = from_epoch_us(last_ts)
+    return claims
+
+
+def build_game(header: dict, records: Dict[int, tuple], at_call: Optional[int] = None
+               ) -> Tuple[BingoGame, List[tuple]]:
+    """Rebuild a game from its header and records, optionally as of a call index."""
+    game = BingoGame(header["game_id"], header["entry_price"], seed=header["seed"],
+                     prize_table=header["prize_table"])
+    game.created_at = datetime.utcfromtimestamp(header["created_at"])
+    claims = replay_records(game, ordered(records), at_call)
+    return game, claims
+
+
+def replay(commitment: str, directory: str = JOURNAL_DIR, at_call: Optional[int] = None
+           ) -> Tuple[BingoGame, List[tuple]]:
+    """Rebuild the game with this seed commitment (seed_hash, or its first 16 hex digits) from the segments."""
+    tag = bytes.fromhex(commitment[:16])
+    header, records = collect(segments(directory), tags={tag}).get(tag, (None, {}))
+    if header is None:
+        raise ValueError(f"No journal for game {commitment} under {directory}")
+    return build_game(header, records, at_call)
+
+
+def _summary(game: BingoGame, claims: List[tuple]) -> dict:
+    return {
+        "game_id": game.game_id,
+        "seed": game.seed.hex(),
+        "seed_hash": game.seed_hash,
+        "status": game.status,
+        "winner_id": game.winner_id,
+        "pool": game.pool,
+        "prize_table": game.prize_table,
+        "awards": {name: {"user_id": uid, "prize": prize} for name, (uid, prize) in game.awards.items()},
+        "called_numbers": game.called_numbers,
+        "players": {str(uid): {"cartela": p.cartela_number, "marked": p.marked}
+                    for uid, p in game.players.items()},
+        "claims": [{"at": from_epoch_us(ts).isoformat(), "user_id": uid, "won": won}
+                   for ts, uid, won in claims],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and replay game journals")
+    sub = parser.add_subparsers(dest="command", required=True)
+    replay_cmd = sub.add_parser("replay", help="print a game's state from the journal segments")
+    replay_cmd.add_argument("commitment", help="the game's seed_hash, or its first 16 hex digits")
+    replay_cmd.add_argument("--dir", default=JOURNAL_DIR)
+    replay_cmd.add_argument("--at", type=int, help="stop before this call index")
+    bench_cmd = sub.add_parser("bench", help="replay every game in the segments under a directory")
+    bench_cmd.add_argument("directory", nargs="?", default=JOURNAL_DIR)
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        game, claims = replay(args.commitment, args.dir, args.at)
+        print(json.dumps(_summary(game, claims), indent=2))
+        return
+
+    started = time.perf_counter()
+    games = collect(segments(args.directory))
+    events = 0
+    for header, records in games.values():
+        if header is not None:
+            build_game(header, records)
+            events += len(records)
+    elapsed = time.perf_counter() - started
+    print(f"Replayed {len(games)} games, {events} events in {elapsed:.3f}s "
+          f"({events / elapsed if elapsed else 0:,.0f} events/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import re
+import sys
+import time
+from collections import defaultdict
+
+import aiohttp
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BOARD_CELL = re.compile(r'data-number="(\d+)"')
+FREE_CARTELA = re.compile(r'selectCartela\((\d+), True\)')
+JOIN_ATTEMPTS = 3
+
+
+class Stats:
+    """Per-route latency samples and error counts."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, route: str, seconds: float, ok: bool):
+        self.latencies[route].append(seconds)
+        if not ok:
+            self.errors[route] += 1
+
+    @staticmethod
+    def _percentile(values, pct):
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+    def report(self, elapsed: float) -> dict:
+        routes = {}
+        for route, values in sorted(self.latencies.items()):
+            routes[route] = {
+                "requests": len(values),
+                "errors": self.errors[route],
+                "error_rate": round(self.errors[route] / len(values), 4),
+                "p50_ms": round(self._percentile(values, 50) * 1000, 2),
+                "p95_ms": round(self._percentile(values, 95) * 1000, 2),
+                "p99_ms": round(self._percentile(values, 99) * 1000, 2),
+            }
+        total = sum(len(v) for v in self.latencies.values())
+        return {
+            "requests": total,
+            "throughput_rps": round(total / elapsed, 1) if elapsed else 0,
+            "error_rate": round(sum(self.errors.values()) / total, 4) if total else 0,
+            "routes": routes,
+        }
+
+
+async def request(session, stats, method, url, route, expected=(200,), **kwargs):
+    """Send one request, record its latency and return (status, body)."""
+    started = time.perf_counter()
+    try:
+        async with session.request(method, url, **kwargs) as response:
+            body = await response.read()
+            stats.record(route, time.perf_counter() - started, response.status in expected)
+            return response.status, body
+    except aiohttp.ClientError:
+        stats.record(route, time.perf_counter() - started, False)
+        return None, b""
+
+
+async def play(base_url, connector, stats, game_id, args, deadline):
+    """One virtual player: pick a cartela, join, poll, mark and claim until the game ends."""
+    jar = aiohttp.CookieJar(unsafe=True)  # keep the Flask session cookie on IP hosts
+    async with aiohttp.ClientSession(connector=connector, connector_owner=False, cookie_jar=jar) as session:
+        await request(session, stats, "GET", f"{base_url}/", "/")
+        for _ in range(JOIN_ATTEMPTS):
+            status, body = await request(session, stats, "GET", f"{base_url}/game/{game_id}/select_cartela",
+                                         "/game/<id>/select_cartela")
+            free = FREE_CARTELA.findall(body.decode()) if status == 200 else []
+            if not free:
+                return
+            # Another player may take the same cartela first; pick again on a 409
+            status, _ = await request(session, stats, "POST", f"{base_url}/game/{game_id}/join",
+                                      "/game/<id>/join", expected=(200, 409),
+                                      json={"cartela_number": int(random.choice(free))})
+            if status == 200:
+                break
+        else:
+            return
+        status, body = await request(session, stats, "GET", f"{base_url}/game/{game_id}",
+                                     "/game/<id>")
+        if status != 200:
+            return
+
+        board = {int(n) for n in BOARD_CELL.findall(body.decode())}
+        cursor, etag = 0, None
+        while time.monotonic() < deadline:
+            headers = {"If-None-Match": etag} if etag else {}
+            started = time.perf_counter()
+            try:
+                async with session.get(f"{base_url}/game/{game_id}/state",
+                                       params={"since": cursor}, headers=headers) as response:
+                    stats.record("/game/<id>/state", time.perf_counter() - started,
+                                 response.status in (200, 304))
+                    if response.status == 200:
+                        etag = response.headers.get("ETag")
+                        state = await response.json()
+                    else:
+                        state = None
+            except aiohttp.ClientError:
+                stats.record("/game/<id>/state", time.perf_counter() - started, False)
+                state = None
+
+            if state:
+                cursor = state["cursor"]
+                if state["status"] == "finished":
+                    return
+                for number in state["calls"]:
+                    if number in board:
+                        status, body = await request(
+                            session, stats, "POST", f"{base_url}/game/{game_id}/mark",
+                            "/game/<id>/mark", json={"number": number})
+                        if status == 200 and json.loads(body).get("winner"):
+                            return
+                if random.random() < args.claim_probability:
+                    await request(session, stats, "POST", f"{base_url}/game/{game_id}/mark",
+                                  "/game/<id>/mark [claim]", json={"check_win": True})
+
+            await asyncio.sleep(args.poll_interval)
+
+
+async def run_room(base_url, connector, stats, room, args, deadline):
+    """Create a room, send a deposit webhook and run its players."""
+    async with aiohttp.ClientSession(connector=connector, connector_owner=False) as session:
+        price = random.choice([10, 20, 50, 100])
+        status, body = await request(session, stats, "POST", f"{base_url}/game/create",
+                                     "/game/create", json={"entry_price": price})
+        if status != 200:
+            return
+        game_id = json.loads(body)["game_id"]
+
+        await request(session, stats, "POST", f"{base_url}{args.deposit_path}", args.deposit_path,
+                      expected=(200, 400), json={"amount": price, "phone": f"09{room:08d}"})
+
+    await asyncio.gather(*(
+        play(base_url, connector, stats, game_id, args, deadline)
+        for _ in range(args.players)
+    ))
+
+
+async def run_level(base_url, rooms, args) -> dict:
+    """Run `rooms` concurrent rooms and return the report for this level."""
+    stats = Stats()
+    connector = aiohttp.TCPConnector(limit=args.connections)
+    started = time.monotonic()
+    deadline = started + args.duration
+    try:
+        await asyncio.gather(*(
+            run_room(base_url, connector, stats, room, args, deadline)
+            for room in range(1, rooms + 1)
+        ))
+    finally:
+        await connector.close()
+    report = stats.report(time.monotonic() - started)
+    report["rooms"] = rooms
+    return report
+
+
+def print_report(report: dict):
+    print(f"\n=== {report['rooms']} rooms: {report['requests']} requests, "
+          f"{report['throughput_rps']} req/s, error rate {report['error_rate']:.2%}")
+    print(f"{'route':<32}{'requests':>10}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, row in report["routes"].items():
+        print(f"{route:<32}{row['requests']:>10}{row['errors']:>8}{row['p50_ms']:>10}{row['p95_ms']:>10}"
+              f"{row['p99_ms']:>10}")
+
+
+def regressions(reports: list, baseline: dict, max_p95: float, max_error_rate: float) -> list:
+    """Compare levels and routes present in both runs; returns a line per regression."""
+    levels = {level["rooms"]: level for level in baseline["levels"]}
+    found = []
+    for report in reports:
+        base = levels.get(report["rooms"])
+        if base is None:
+            continue
+        if report["error_rate"] > base["error_rate"] + max_error_rate:
+            found.append(f"{report['rooms']} rooms: error rate {report['error_rate']:.2%} "
+                         f"(baseline {base['error_rate']:.2%})")
+        for route, row in report["routes"].items():
+            base_row = base["routes"].get(route)
+            if base_row is not None and row["p95_ms"] > base_row["p95_ms"] * (1 + max_p95):
+                found.append(f"{report['rooms']} rooms {route}: p95 {row['p95_ms']}ms "
+                             f"(baseline {base_row['p95_ms']}ms)")
+    return found
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Simulate full Bingo rooms against a local instance")
+    parser.add_argument("--url", default="http://127.0.0.1:5000")
+    parser.add_argument("--rooms", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--players", type=int, default=5, help="players per room")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per level")
+    parser.add_argument("--poll-interval", type=float, default=1.0)
+    parser.add_argument("--claim-probability", type=float, default=0.05)
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--deposit-path", default="/webhook/test",
+                        help="use /webhook/deposit against a database with registered phones")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="fail if p95 or error rate regressed against this --output report")
+    parser.add_argument("--max-p95-regression", type=float, default=0.2,
+                        help="allowed relative p95 increase per route over the baseline")
+    parser.add_argument("--max-error-rate-increase", type=float, default=0.01,
+                        help="allowed absolute error rate increase per level over the baseline")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    reports = []
+    for rooms in args.rooms:
+        logger.info("Running %s rooms x %s players for %ss", rooms, args.players, args.duration)
+        report = await run_level(args.url.rstrip("/"), rooms, args)
+        print_report(report)
+        reports.append(report)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"players_per_room": args.players, "duration": args.duration,
+                       "levels": reports}, f, indent=2)
+        logger.info("Report written to %s", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        found = regressions(reports, baseline, args.max_p95_regression, args.max_error_rate_increase)
+        for line in found:
+            logger.error("Regression: %s", line)
+        if found:
+            return 1
+        logger.info("No regressions against %s", args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,104 @@
+import atexit
+import itertools
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+
+from config import LOG_FORMAT, LOG_LEVEL, LOG_SAMPLE_RATES
+
+# Correlation id shared by the webhook -> bot -> notification chain of a request
+correlation_id: ContextVar[str] = ContextVar("correlation_id", default="-")
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - [%(correlation_id)s] %(message)s'
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_RESERVED = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "correlation_id", "sample"}
+
+
+def new_correlation_id(value: str = None) -> str:
+    """Set (or generate) the correlation id for the current context."""
+    value = value or uuid.uuid4().hex[:16]
+    correlation_id.set(value)
+    return value
+
+
+class CorrelationFilter(logging.Filter):
+    """Attach the current correlation id to every record."""
+
+    def filter(self, record):
+        record.correlation_id = correlation_id.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep one in N records tagged with extra={'sample': key}."""
+
+    def __init__(self, rates: dict):
+        super().__init__()
+        self.rates = rates
+        self._counters = {key: itertools.count() for key in rates}
+
+    def filter(self, record):
+        key = getattr(record, "sample", None)
+        if key is None or key not in self.rates:
+            return True
+        return next(self._counters[key]) % self.rates[key] == 0
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "correlation_id": getattr(record, "correlation_id", "-"),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Queue records unformatted so message formatting happens on the listener thread."""
+
+    def prepare(self, record):
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+
+_listener = None
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """Route all logging through a background queue listener."""
+    global _listener
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    handler = DeferredQueueHandler(log_queue)
+    handler.addFilter(SamplingFilter(LOG_SAMPLE_RATES))
+    handler.addFilter(CorrelationFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
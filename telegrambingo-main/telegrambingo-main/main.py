@@ -1,7 +1,5 @@
 import os
 import asyncio
-from app import app
-from bot import main as bot_main
 from multiprocessing import Process
 import signal
 import sys
@@ -10,8 +8,14 @@ def signal_handler(sig, frame):
     print('Shutting down gracefully...')
     sys.exit(0)
 
+def migrate_schema():
+    # One explicit schema step before the workers start; they never run DDL themselves
+    from migrate import run_upgrade
+    run_upgrade()
+
 def run_flask():
-    # Use gunicorn configuration
+    # Imported here so only the web process pays for the web app's imports
+    from app import app
     from gunicorn.app.base import BaseApplication
 
     class FlaskApplication(BaseApplication):
@@ -30,11 +34,13 @@ def run_flask():
     options = {
         'bind': '0.0.0.0:5000',
         'workers': 1,
-        'reload': True
+        # Live games survive restarts through snapshots, but reloading on every file touch stays opt-in
+        'reload': os.getenv("FLASK_RELOAD") == "1"
     }
     FlaskApplication(app, options).run()
 
 def run_bot():
+    from bot import main as bot_main
     asyncio.run(bot_main())
 
 if __name__ == "__main__":
@@ -42,6 +48,9 @@ if __name__ == "__main__":
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
 
+    if os.getenv("SKIP_MIGRATIONS") != "1":
+        migrate_schema()
+
     # Start Flask in a separate process
     flask_process = Process(target=run_flask)
     flask_process.start()
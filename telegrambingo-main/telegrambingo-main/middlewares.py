@@ -0,0 +1,151 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import TelegramObject, Update
+
+import metrics
+from config import DUPLICATE_WINDOW, THROTTLE_BURST, THROTTLE_MAX_USERS, THROTTLE_RATE
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_REQUEST_SECONDS = metrics.histogram(
+    "bingo_telegram_request_seconds", "Telegram Bot API call latency", ["method"])
+TELEGRAM_RETRY_AFTER = metrics.counter(
+    "bingo_telegram_429", "Telegram Bot API calls rejected with 429 Too Many Requests", ["method"])
+HANDLER_SECONDS = metrics.histogram(
+    "bingo_bot_handler_seconds", "Bot update handler latency", ["handler"])
+DROPPED_UPDATES = metrics.counter(
+    "bingo_bot_dropped_updates", "Updates dropped before reaching a handler", ["reason"])
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Time every Bot API call and count rate-limit rejections."""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            TELEGRAM_RETRY_AFTER.inc(method=name)
+            raise
+        finally:
+            TELEGRAM_REQUEST_SECONDS.observe(time.perf_counter() - started, method=name)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Label DB metrics with the running handler and time it."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object else "unknown"
+        token = metrics.current_handler.set(name)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, handler=name)
+            metrics.current_handler.reset(token)
+
+
+class _UserBudget:
+    __slots__ = ("tokens", "stamp", "last_key", "last_at", "in_flight", "warned")
+
+    def __init__(self, tokens: float, now: float):
+        self.tokens = tokens
+        self.stamp = now
+        self.last_key: Optional[str] = None
+        self.last_at = 0.0
+        self.in_flight = False
+        self.warned = False
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """Per-user token bucket plus suppression of repeated taps and messages.
+
+    Register on the update observer ahead of the FSM middleware, so dropped
+    updates cost no database round trip. A repeat of the previous callback
+    data or message text is dropped while the first is still being handled or
+    within `duplicate_window` seconds of it. Users are kept in LRU order and
+    the least recently seen are evicted past `max_users`.
+    """
+
+    def __init__(self, rate: float = THROTTLE_RATE, burst: int = THROTTLE_BURST,
+                 duplicate_window: float = DUPLICATE_WINDOW, max_users: int = THROTTLE_MAX_USERS):
+        self.rate = rate
+        self.burst = burst
+        self.duplicate_window = duplicate_window
+        self.max_users = max_users
+        self._users: "OrderedDict[int, _UserBudget]" = OrderedDict()
+
+    def _budget(self, user_id: int, now: float) -> _UserBudget:
+        budget = self._users.get(user_id)
+        if budget is None:
+            budget = self._users[user_id] = _UserBudget(self.burst, now)
+            if len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+        else:
+            self._users.move_to_end(user_id)
+        return budget
+
+    async def _reply(self, event: Update, text: Optional[str]):
+        try:
+            if event.callback_query is not None:
+                # Always answered, or the client keeps the button spinning
+                await event.callback_query.answer(text)
+            elif event.message is not None and text:
+                await event.message.answer(text)
+        except TelegramAPIError as e:
+            logger.debug("Could not answer a dropped update: %s", e)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None or not isinstance(event, Update):
+            return await handler(event, data)
+        if event.callback_query is not None:
+            key = event.callback_query.data
+        else:
+            key = event.message.text if event.message is not None else None
+
+        now = time.monotonic()
+        budget = self._budget(user.id, now)
+        if key is not None and key == budget.last_key and (
+                budget.in_flight or now - budget.last_at < self.duplicate_window):
+            DROPPED_UPDATES.inc(reason="duplicate")
+            await self._reply(event, None)
+            return None
+
+        budget.tokens = min(self.burst, budget.tokens + (now - budget.stamp) * self.rate)
+        budget.stamp = now
+        if budget.tokens < 1:
+            DROPPED_UPDATES.inc(reason="throttled")
+            warn = not budget.warned
+            budget.warned = True
+            await self._reply(event, "⏳ Too many requests. Please wait a moment." if warn else None)
+            return None
+        budget.tokens -= 1
+        budget.warned = False
+
+        budget.last_key = key
+        budget.last_at = now
+        budget.in_flight = True
+        try:
+            return await handler(event, data)
+        finally:
+            if budget.last_key == key:
+                budget.in_flight = False
@@ -0,0 +1,124 @@
+import argparse
+import logging
+import sys
+import time
+from typing import Callable, List, Tuple
+
+from sqlalchemy import inspect, select, text
+from sqlalchemy.schema import CreateIndex
+
+from database import create_db_app, db
+from logging_setup import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def pending_steps() -> List[str]:
+    """DDL needed to bring the database up to the models: new tables, columns and indexes.
+
+    Columns are only ever added, never altered or dropped. A column that is NOT
+    NULL without a server default is added as nullable.
+    """
+    import models  # noqa: F401 - registers the tables on db.metadata
+
+    engine = db.engine
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    existing_tables = set(inspector.get_table_names())
+    steps = []
+
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            steps.append(f"CREATE TABLE {preparer.format_table(table)}")
+            continue
+        columns = {c['name'] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in columns:
+                continue
+            ddl = (f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                   f"{preparer.format_column(column)} {column.type.compile(engine.dialect)}")
+            if column.server_default is not None:
+                ddl += f" DEFAULT '{column.server_default.arg}'"
+                if not column.nullable:
+                    ddl += " NOT NULL"
+            steps.append(ddl)
+        indexes = {i['name'] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in indexes:
+                steps.append(str(CreateIndex(index).compile(engine)))
+    return steps
+
+
+def backfill_user_totals():
+    from history import backfill_user_totals
+    backfill_user_totals()
+
+
+# Data migrations run once per database, in version order, after the schema steps;
+# each is recorded in SchemaVersion once it has run. Never renumber or remove one.
+DATA_MIGRATIONS: List[Tuple[int, Callable[[], None]]] = [
+    (1, backfill_user_totals),  # User.total_* columns from completed transactions
+]
+
+
+def pending_migrations() -> List[Tuple[int, Callable[[], None]]]:
+    """Data migrations not yet recorded as applied."""
+    from models import SchemaVersion
+
+    if SchemaVersion.__tablename__ not in inspect(db.engine).get_table_names():
+        return list(DATA_MIGRATIONS)
+    applied = set(db.session.scalars(select(SchemaVersion.version)))
+    return [(version, run) for version, run in DATA_MIGRATIONS if version not in applied]
+
+
+def upgrade() -> List[str]:
+    """Apply every pending step and data migration and return their descriptions."""
+    from models import SchemaVersion
+
+    steps = pending_steps()
+    new_tables = any(step.startswith("CREATE TABLE") for step in steps)
+    with db.engine.begin() as conn:
+        if new_tables:
+            db.metadata.create_all(conn)
+        for step in steps:
+            if not step.startswith("CREATE TABLE"):
+                conn.execute(text(step))
+    for version, run in pending_migrations():
+        run()
+        db.session.add(SchemaVersion(version=version))
+        db.session.commit()
+        steps.append(f"Data migration {version}: {run.__name__}")
+    return steps
+
+
+def run_upgrade():
+    """Upgrade the schema of DATABASE_URL, logging each step."""
+    app = create_db_app(__name__, "migrate")
+    with app.app_context():
+        started = time.perf_counter()
+        steps = upgrade()
+        for step in steps:
+            logger.info("Applied: %s", step)
+        logger.info("Schema up to date (%d steps in %.2fs)", len(steps), time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create or update the database schema")
+    parser.add_argument("--check", action="store_true",
+                        help="list pending steps and data migrations and exit 1 if there are any, without applying them")
+    args = parser.parse_args()
+
+    configure_logging()
+    if not args.check:
+        run_upgrade()
+        return 0
+    with create_db_app(__name__, "migrate").app_context():
+        steps = pending_steps()
+        steps += [f"Data migration {version}: {run.__name__}" for version, run in pending_migrations()]
+    for step in steps:
+        print(step)
+    return 1 if steps else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
 from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import Session
 from database import db
 
 class User(db.Model):
@@ -9,18 +11,31 @@ class User(db.Model):
     balance = db.Column(db.Float, default=0.0)
     games_played = db.Column(db.Integer, default=0)
     games_won = db.Column(db.Integer, default=0)
+    # Running totals of completed transactions, kept current by _update_user_totals
+    total_deposited = db.Column(db.Float, default=0.0, nullable=False, server_default='0')
+    total_won = db.Column(db.Float, default=0.0, nullable=False, server_default='0')
+    total_withdrawn = db.Column(db.Float, default=0.0, nullable=False, server_default='0')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     referrer_id = db.Column(db.BigInteger, nullable=True)
+    # Referral milestones of this user as a referee; see referrals.py
+    first_deposit_at = db.Column(db.DateTime)
+    first_game_at = db.Column(db.DateTime)
+    referral_credited_at = db.Column(db.DateTime)
+    # Last change to this user's row or transactions, from any process; see replicas.py
+    last_write_at = db.Column(db.DateTime)
 
 class Game(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    status = db.Column(db.String(20), default='waiting')  # waiting, active, finished
+    store_id = db.Column(db.Integer)  # id in the game store, which each process numbers on its own
+    status = db.Column(db.String(20), default='waiting', index=True)  # waiting, active, finished
     entry_price = db.Column(db.Float, nullable=False)
     pool = db.Column(db.Float, default=0.0)
     called_numbers = db.Column(db.String, default='')  # Store as comma-separated numbers
     winner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    finished_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime, index=True)
+    seed_hash = db.Column(db.String(64))  # SHA-256 of the draw seed, published when the game is created
+    seed = db.Column(db.String(64))  # hex, revealed when the game ends; see fairness.py
 
     # Relationships
     participants = db.relationship('GameParticipant', backref='game', lazy=True)
@@ -55,4 +70,126 @@ class Transaction(db.Model):
     # For withdrawals
     withdrawal_phone = db.Column(db.String(20))
     withdrawal_status = db.Column(db.String(20))  # pending, approved, rejected
-    admin_note = db.Column(db.Text)
\ No newline at end of file
+    admin_note = db.Column(db.Text)
+
+    __table_args__ = (
+        # Per-user history, newest first, paged by (created_at, id)
+        db.Index('ix_transaction_user_created', 'user_id', 'created_at', 'id'),
+        # Pending withdrawal queue and summary refresh windows
+        db.Index('ix_transaction_type_status_created', 'type', 'status', 'created_at'),
+        db.Index('ix_transaction_type_status_completed', 'type', 'status', 'completed_at'),
+        # Closed months for the archiver
+        db.Index('ix_transaction_created', 'created_at'),
+    )
+
+# Summary tables, maintained incrementally by summaries.refresh_summaries()
+
+class TierRevenue(db.Model):
+    entry_price = db.Column(db.Float, primary_key=True)
+    games = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)  # entry fees of finished games
+
+class DepositorTotal(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    deposits = db.Column(db.Integer, default=0, nullable=False)
+    total = db.Column(db.Float, default=0.0, nullable=False, index=True)
+
+    user = db.relationship('User', lazy='joined')
+
+class SummaryWatermark(db.Model):
+    name = db.Column(db.String(32), primary_key=True)
+    value = db.Column(db.DateTime, nullable=False)  # rows up to this time are folded in
+
+class FsmState(db.Model):
+    key = db.Column(db.String(128), primary_key=True)  # bot:chat:user:thread:business:destiny
+    state = db.Column(db.String(100))
+    data = db.Column(db.Text)  # JSON
+    updated_at = db.Column(db.DateTime, nullable=False, index=True)
+
+# Raised by fraud.py for an admin to review
+
+class FraudFlag(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    rule = db.Column(db.String(32), nullable=False)  # webhook_replay, shared_phone, fast_claim, ...
+    subject = db.Column(db.String(64), nullable=False)  # user:<id>, telegram:<id>, phone:<number>, source:<address>
+    detail = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    dismissed_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_fraud_flag_open', 'dismissed_at', 'created_at'),)
+
+# A file of rows moved out of the database by archive.py; rows are deleted in the transaction that adds it
+
+class ArchivePart(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(32), nullable=False)  # table the rows came from
+    month = db.Column(db.DateTime, nullable=False)  # first day of the month the rows belong to
+    path = db.Column(db.String(255), unique=True, nullable=False)  # relative to ARCHIVE_DIR
+    rows = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.Index('ix_archive_part_source_month', 'source', 'month'),)
+
+# Held by the one process running a singleton job such as archive.run_archive; lapses if the holder dies
+
+class JobLease(db.Model):
+    name = db.Column(db.String(32), primary_key=True)
+    holder = db.Column(db.String(64), nullable=False)  # host:pid
+    expires_at = db.Column(db.DateTime, nullable=False)
+
+class ReplicaHeartbeat(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    beat_at = db.Column(db.DateTime, nullable=False)  # stamped on the primary; its age on a replica is the lag
+
+# A data migration from migrate.DATA_MIGRATIONS that has run against this database
+
+class SchemaVersion(db.Model):
+    version = db.Column(db.Integer, primary_key=True)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+# Transaction type -> User running total it feeds
+USER_TOTALS = {'deposit': 'total_deposited', 'win': 'total_won', 'withdraw': 'total_withdrawn'}
+
+@event.listens_for(Session, 'before_flush')
+def _update_user_totals(session, flush_context, instances):
+    """Add transactions that became completed in this flush to their user's totals.
+
+    Set-based UPDATEs that complete transactions outside the ORM (see
+    withdrawals.py) maintain the totals in the same statement instead.
+    """
+    deltas = {}
+    for obj in list(session.new) + list(session.dirty):
+        if not isinstance(obj, Transaction) or obj.status != 'completed':
+            continue
+        column = USER_TOTALS.get(obj.type)
+        if column is None:
+            continue
+        if obj not in session.new:
+            history = db.inspect(obj).attrs.status.history
+            if not history.added or 'completed' in history.deleted:
+                continue
+        key = (obj.user_id, column)
+        deltas[key] = deltas.get(key, 0.0) + abs(obj.amount)
+
+    for (user_id, column), amount in deltas.items():
+        with session.no_autoflush:
+            user = session.get(User, user_id)
+        if user is not None:
+            setattr(user, column, getattr(User, column) + amount)
+
+@event.listens_for(Session, 'before_flush')
+def _stamp_user_writes(session, flush_context, instances):
+    """Stamp last_write_at on users whose row or transactions change in this flush.
+
+    Runs after _update_user_totals, so completing a transaction stamps its user.
+    Set-based UPDATEs stamp the column themselves.
+    """
+    now = datetime.utcnow()
+    user_ids = {obj.user_id for obj in list(session.new) + list(session.dirty)
+                if isinstance(obj, Transaction) and obj.user_id is not None}
+    users = [obj for obj in session.dirty if isinstance(obj, User) and session.is_modified(obj)]
+    with session.no_autoflush:
+        users += [session.get(User, user_id) for user_id in user_ids]
+    for user in users:
+        if user is not None:
+            user.last_write_at = now
@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from config import NOTIFY_BATCH_SIZE, NOTIFY_RATE, TELEGRAM_BOT_TOKEN
+import metrics
+
+logger = logging.getLogger(__name__)
+
+NOTIFICATIONS_SENT = metrics.counter(
+    "bingo_notifications_total", "Queued Telegram notifications by outcome", ["outcome"])
+
+
+class NotificationSender:
+    """Sends queued Telegram messages in rate-limited batches from a background thread.
+
+    Callers in sync code (Flask views) enqueue and return immediately; one Bot
+    session is reused for every batch and 429 responses push the batch back.
+    """
+
+    def __init__(self, token: str, batch_size: int = NOTIFY_BATCH_SIZE, rate: float = NOTIFY_RATE):
+        self.token = token
+        self.batch_size = batch_size
+        self.rate = rate
+        self._queue: "queue.Queue[Tuple[int, str]]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def send(self, chat_id: int, text: str):
+        self.send_many([(chat_id, text)])
+
+    def send_many(self, messages: Iterable[Tuple[int, str]]):
+        """Queue (chat_id, text) pairs for delivery."""
+        for message in messages:
+            self._queue.put(message)
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=lambda: asyncio.run(self._run()),
+                                                name="notification-sender", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> List[Tuple[int, str]]:
+        batch = [self._queue.get()]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    async def _send(self, bot, chat_id: int, text: str) -> Optional[float]:
+        """Send one message; returns the retry delay if Telegram throttled it."""
+        from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+
+        try:
+            await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML")
+            NOTIFICATIONS_SENT.inc(outcome="sent")
+        except TelegramRetryAfter as e:
+            return e.retry_after
+        except TelegramAPIError as e:
+            NOTIFICATIONS_SENT.inc(outcome="failed")
+            logger.error("Failed to notify %s: %s", chat_id, e)
+        return None
+
+    async def _run(self):
+        # aiogram takes seconds to import; only pay for it once something is sent
+        from aiogram import Bot
+        from middlewares import TelegramMetricsMiddleware
+
+        bot = Bot(token=self.token)
+        bot.session.middleware(TelegramMetricsMiddleware())
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                batch = await loop.run_in_executor(None, self._next_batch)
+                started = time.monotonic()
+                delays = await asyncio.gather(*(self._send(bot, chat_id, text) for chat_id, text in batch))
+                throttled = [message for message, delay in zip(batch, delays) if delay is not None]
+                if throttled:
+                    logger.warning("Telegram throttled %d notifications; retrying", len(throttled))
+                    await asyncio.sleep(max(d for d in delays if d is not None))
+                    self.send_many(throttled)
+                    continue
+                # Keep the overall send rate under the Bot API limit
+                await asyncio.sleep(max(0.0, len(batch) / self.rate - (time.monotonic() - started)))
+        finally:
+            await bot.session.close()
+
+
+_sender: Optional[NotificationSender] = None
+
+
+def get_sender() -> Optional[NotificationSender]:
+    global _sender
+    if _sender is None and TELEGRAM_BOT_TOKEN:
+        _sender = NotificationSender(TELEGRAM_BOT_TOKEN)
+    return _sender
+
+
+def notify(messages: Iterable[Tuple[int, str]]):
+    """Queue notifications if a bot token is configured."""
+    messages = list(messages)
+    if not messages:
+        return
+    sender = get_sender()
+    if sender is None:
+        logger.warning("TELEGRAM_BOT_TOKEN is not set; dropping %d notifications", len(messages))
+        return
+    sender.send_many(messages)
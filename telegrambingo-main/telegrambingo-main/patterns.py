@@ -0,0 +1,81 @@
+from itertools import combinations
+from typing import Dict, Iterable, List, Tuple, Union
+
+from config import PRIZE_TABLES
+
+# Bit i of a mask is board cell i, row-major: bit 0 is B1, bit 12 the free centre, bit 24 O5
+FULL_CARD = (1 << 25) - 1
+CENTER = 1 << 12
+
+
+def cells_mask(cells: Iterable[int]) -> int:
+    mask = 0
+    for cell in cells:
+        mask |= 1 << cell
+    return mask
+
+
+def grid_mask(grid: str) -> int:
+    """Mask of the X cells in a 5x5 grid written as five rows separated by '/', e.g. "X...X/...../..."."""
+    rows = grid.split("/")
+    if len(rows) != 5 or any(len(row) != 5 for row in rows):
+        raise ValueError(f"Pattern grid must be 5 rows of 5 cells: {grid!r}")
+    return cells_mask(r * 5 + c for r, row in enumerate(rows) for c, cell in enumerate(row) if cell in "Xx")
+
+
+ROWS = tuple(cells_mask(range(r * 5, r * 5 + 5)) for r in range(5))
+COLUMNS = tuple(cells_mask(range(c, 25, 5)) for c in range(5))
+DIAGONALS = (cells_mask((0, 6, 12, 18, 24)), cells_mask((4, 8, 12, 16, 20)))
+LINES = ROWS + COLUMNS + DIAGONALS
+
+
+class Pattern:
+    """A named win condition, met when every cell of any one of its masks is marked."""
+
+    __slots__ = ("name", "label", "masks")
+
+    def __init__(self, name: str, label: str, masks: Iterable[int]):
+        self.name = name
+        self.label = label
+        self.masks = tuple(sorted(set(masks)))
+
+    def matches(self, marked: int) -> bool:
+        for mask in self.masks:
+            if marked & mask == mask:
+                return True
+        return False
+
+
+PATTERNS: Dict[str, Pattern] = {}
+
+
+def register_pattern(name: str, label: str, *shapes: Union[int, str]) -> Pattern:
+    """Register a pattern made of masks or grid strings; completing any one shape wins it."""
+    if not shapes:
+        raise ValueError(f"Pattern {name} needs at least one shape")
+    masks = [grid_mask(shape) if isinstance(shape, str) else shape for shape in shapes]
+    if any(not 0 < mask <= FULL_CARD for mask in masks):
+        raise ValueError(f"Pattern {name} has a mask outside the 25 board cells")
+    PATTERNS[name] = pattern = Pattern(name, label, masks)
+    return pattern
+
+
+register_pattern("line", "Line complete", *LINES)
+register_pattern("two_lines", "Two lines complete", *(a | b for a, b in combinations(LINES, 2)))
+register_pattern("four_corners", "Four corners", "X...X/...../...../...../X...X")
+register_pattern("x", "Letter X", DIAGONALS[0] | DIAGONALS[1])
+register_pattern("full_house", "Full house", FULL_CARD)
+
+
+def prize_tiers(table: str) -> Tuple[Tuple[Pattern, float], ...]:
+    """The (pattern, pool share) tiers of a prize table from config.PRIZE_TABLES."""
+    try:
+        tiers = PRIZE_TABLES[table]
+    except KeyError:
+        raise ValueError(f"Unknown prize table: {table}") from None
+    return tuple((PATTERNS[name], share) for name, share in tiers)
+
+
+def board_mask(board: List[int], marked: Iterable[int]) -> int:
+    """Mask of a board's marked cells."""
+    return cells_mask(board.index(number) for number in marked if number in board)
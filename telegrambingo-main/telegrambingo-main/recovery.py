@@ -0,0 +1,187 @@
+import glob
+import logging
+import os
+import pickle
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from config import JOURNAL_DIR, JOURNAL_KEEP_SECONDS, RECOVERY_LOOKBACK_DAYS, SNAPSHOT_DIR
+from game_logic import BingoGame, PlayerState, cartela
+from patterns import board_mask
+from journal import (
+    attach_journal, build_game, collect, from_epoch_us, game_tag, get_writer, ordered, replay_records,
+    segments, to_epoch_us,
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 3  # games carry 32-byte committed seeds
+
+
+def _ts(value: Optional[datetime]) -> Optional[int]:
+    return to_epoch_us(value) if value is not None else None
+
+
+def _dt(value: Optional[int]) -> Optional[datetime]:
+    return from_epoch_us(value) if value is not None else None
+
+
+def snapshot_game(game: BingoGame) -> tuple:
+    """Encode a game as a compact tuple; boards and the draw order are rebuilt from seeds."""
+    players = tuple((user_id, p['cartela_number'], bytes(p.marked))
+                    for user_id, p in game.players.items())
+    journal_count = game.journal.count if game.journal is not None else 0
+    return (game.game_id, game.entry_price, game.seed, _ts(game.created_at), game.status,
+            game.winner_id, game.pool, _ts(game.last_call_time), _ts(game.finished_at),
+            game.min_players, game.max_players, bytes(game.called_numbers), players, journal_count,
+            game.prize_table, tuple(game.awards.items()))
+
+
+def restore_game(entry: tuple) -> Tuple[BingoGame, int]:
+    """Rebuild a game from snapshot_game() output; returns it with its journal position."""
+    (game_id, entry_price, seed, created_at, status, winner_id, pool, last_call_time,
+     finished_at, min_players, max_players, called, players, journal_count, prize_table, awards) = entry
+    game = BingoGame(game_id, entry_price, seed=seed, prize_table=prize_table)
+    game.created_at = _dt(created_at)
+    game.status = status
+    game.winner_id = winner_id
+    game.pool = pool
+    game.last_call_time = _dt(last_call_time)
+    game.finished_at = _dt(finished_at)
+    game.min_players = min_players
+    game.max_players = max_players
+    game.called_numbers = list(called)
+    game.awards = dict(awards)
+    for user_id, cartela_number, marked in players:
+        board, _ = cartela(cartela_number)
+        game.players[user_id] = PlayerState(cartela_number, board_mask(board, marked))
+    return game, journal_count
+
+
+def snapshot_path(name: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"{name}.snap")
+
+
+def encode_snapshot(games: Iterable[BingoGame], next_id: int) -> dict:
+    """Capture the live games; call while holding the store's lock."""
+    return {
+        'version': SNAPSHOT_VERSION,
+        'created': time.time(),
+        'next_id': next_id,
+        'games': [snapshot_game(g) for g in games if g.status != "finished"],
+    }
+
+
+def write_snapshot(name: str, snapshot: dict):
+    """Atomically replace the named snapshot file."""
+    path = snapshot_path(name)
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    # Stamped with the capture time, so prune_journals() can tell what it covers without unpickling it
+    os.utime(path, (snapshot['created'], snapshot['created']))
+    prune_journals()
+
+
+def prune_journals(now: Optional[float] = None) -> int:
+    """Delete journal segments recovery no longer needs and return how many were deleted.
+
+    Recovery replays segments written after its snapshot, from the last
+    RECOVERY_LOOKBACK_DAYS days; a segment last written before every snapshot in
+    SNAPSHOT_DIR, or outside those days, is never read again. Segments are kept
+    JOURNAL_KEEP_SECONDS regardless, for journal.py replay.
+    """
+    if not JOURNAL_DIR:
+        return 0
+    now = now if now is not None else time.time()
+    snapshots = glob.glob(os.path.join(SNAPSHOT_DIR, "*.snap"))
+    try:
+        covered = min(os.path.getmtime(path) for path in snapshots) if snapshots else 0.0
+    except FileNotFoundError:
+        return 0  # a snapshot is being replaced; try again next time
+    today = datetime.utcfromtimestamp(now).date()
+    recent = {f"{today - timedelta(days=n):%Y-%m-%d}" for n in range(RECOVERY_LOOKBACK_DAYS + 1)}
+    removed = 0
+    for path in segments(JOURNAL_DIR):
+        try:
+            written = os.path.getmtime(path)
+            if written < now - JOURNAL_KEEP_SECONDS and (
+                    written < covered or os.path.basename(os.path.dirname(path)) not in recent):
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            continue  # removed by another process pruning at the same time
+    for day in glob.glob(os.path.join(JOURNAL_DIR, "*", "")):
+        try:
+            os.rmdir(day)
+        except OSError:
+            pass  # not empty
+    if removed:
+        logger.info("Pruned %d journal segments", removed)
+    return removed
+
+
+def load_snapshot(name: str) -> Optional[dict]:
+    try:
+        with open(snapshot_path(name), "rb") as f:
+            snapshot = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        logger.warning("Ignoring snapshot %s with unknown version", name)
+        return None
+    return snapshot
+
+
+def recover_games(name: str, owns: Callable[[int], bool] = lambda game_id: True
+                  ) -> Tuple[Dict[int, BingoGame], int]:
+    """Restore in-flight games from the named snapshot plus the journal records written after it.
+
+    Games created after the snapshot are rebuilt from the journal alone when
+    `owns(game_id)` says this process is responsible for them. Returns the games
+    and the next free game id.
+    """
+    started = time.perf_counter()
+    snapshot = load_snapshot(name) or {'created': 0.0, 'next_id': 1, 'games': []}
+    games: Dict[int, BingoGame] = {}
+    counts: Dict[int, int] = {}
+    known: Dict[bytes, BingoGame] = {}
+
+    for entry in snapshot['games']:
+        game, journal_count = restore_game(entry)
+        games[game.game_id] = game
+        counts[game.game_id] = journal_count
+        known[game_tag(game.seed)] = game
+
+    next_id = snapshot['next_id']
+    if get_writer() is not None:
+        paths = segments(JOURNAL_DIR, since=snapshot['created'], days=RECOVERY_LOOKBACK_DAYS)
+        skip = {tag: counts[game.game_id] for tag, game in known.items()}
+        for tag, (header, records) in collect(paths, skip).items():
+            game = known.get(tag)
+            if game is None:
+                if (header is None or header['created_at'] < snapshot['created']
+                        or not owns(header['game_id'])):
+                    continue
+                game, _ = build_game(header, records)
+                games[game.game_id] = game
+                next_id = max(next_id, game.game_id + 1)
+            else:
+                replay_records(game, ordered(records))
+            if records:
+                counts[game.game_id] = max(counts.get(game.game_id, 0), max(records) + 1)
+
+    games = {game_id: g for game_id, g in games.items() if g.status != "finished"}
+    for game in games.values():
+        attach_journal(game, resume=True, count=counts.get(game.game_id, 0))
+
+    next_id = max([next_id] + [game_id + 1 for game_id in games])
+    if games:
+        logger.info("Recovered %d games from snapshot %s in %.3fs",
+                    len(games), name, time.perf_counter() - started)
+    return games, next_id
@@ -0,0 +1,225 @@
+import logging
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Set
+
+from sqlalchemy import bindparam, exists, func, select, update
+from sqlalchemy.orm import aliased
+
+from config import (
+    REFERRAL_BATCH_INTERVAL, REFERRAL_BATCH_SIZE, REFERRAL_BONUS, REFERRAL_SWEEP_BATCH,
+    REFERRAL_SWEEP_INTERVAL,
+)
+from database import db
+from models import GameParticipant, Transaction, User
+from notifications import notify
+
+logger = logging.getLogger(__name__)
+
+# Milestones a referee must reach before the referrer is paid
+PHONE = "phone"
+DEPOSIT = "deposit"
+GAME = "game"
+MILESTONE_COLUMNS = {DEPOSIT: User.first_deposit_at, GAME: User.first_game_at}
+
+_events: "queue.SimpleQueue" = queue.SimpleQueue()
+_engine = None
+
+
+def record(milestone: str, user_ids: Iterable[int]):
+    """Note that users reached a milestone. Never touches the database."""
+    _events.put((milestone, tuple(user_ids)))
+
+
+def _mark_milestones(events: Dict[str, Set[int]], now: datetime):
+    for milestone, user_ids in events.items():
+        column = MILESTONE_COLUMNS.get(milestone)
+        if column is None or not user_ids:
+            continue
+        db.session.execute(
+            update(User)
+            .where(User.id.in_(user_ids), column.is_(None), User.referrer_id.isnot(None))
+            .values({column.key: now})
+            .execution_options(synchronize_session=False)
+        )
+
+
+def credit_referrals(user_ids: Iterable[int], now: datetime) -> List[int]:
+    """Pay referrers of the given referees that have reached every milestone.
+
+    The referee row is claimed by setting referral_credited_at in the same
+    UPDATE that checks the milestones, so a bonus is paid at most once even when
+    the event worker and the sweep race. Call inside a transaction.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return []
+    referrer = aliased(User)
+    claimed = db.session.execute(
+        update(User)
+        .where(
+            User.id.in_(user_ids),
+            User.referral_credited_at.is_(None),
+            User.referrer_id.isnot(None),
+            User.referrer_id != User.telegram_id,
+            User.phone.isnot(None),
+            User.first_deposit_at.isnot(None),
+            User.first_game_at.isnot(None),
+            exists().where(referrer.telegram_id == User.referrer_id),
+        )
+        .values(referral_credited_at=now)
+        .returning(User.id, User.referrer_id)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if not claimed:
+        return []
+
+    referrers = dict(db.session.execute(
+        select(User.telegram_id, User.id).where(User.telegram_id.in_({row.referrer_id for row in claimed}))
+    ).all())
+    bonuses = Counter(referrers[row.referrer_id] for row in claimed)
+    users = User.__table__  # Core table: one executemany UPDATE with a bonus per referrer
+    db.session.execute(
+        update(users).where(users.c.id == bindparam('referrer')).values(balance=users.c.balance + bindparam('bonus'), last_write_at=now),
+        [{'referrer': referrer_id, 'bonus': count * REFERRAL_BONUS} for referrer_id, count in bonuses.items()],
+    )
+    db.session.execute(db.insert(Transaction), [
+        dict(user_id=referrers[row.referrer_id], type='referral', amount=REFERRAL_BONUS,
+             status='completed', created_at=now, completed_at=now, admin_note=f"referee {row.id}")
+        for row in claimed
+    ])
+    return [row.id for row in claimed]
+
+
+def _notify_referrers(referee_ids: List[int]):
+    if not referee_ids:
+        return
+    referrer_ids = db.session.execute(
+        select(User.referrer_id).where(User.id.in_(referee_ids))
+    ).scalars().all()
+    notify(
+        (telegram_id,
+         f"🎁 <b>Referral Bonus!</b>\n\n"
+         f"{count} friend{'s' if count > 1 else ''} completed registration, deposit and first game.\n"
+         f"You earned {count * REFERRAL_BONUS:.2f} birr")
+        for telegram_id, count in Counter(referrer_ids).items()
+    )
+
+
+def process_events(events: Dict[str, Set[int]]) -> List[int]:
+    """Apply one batch of milestone events and credit whoever now qualifies."""
+    now = datetime.utcnow()
+    try:
+        _mark_milestones(events, now)
+        credited = credit_referrals(set().union(*events.values()), now)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    _notify_referrers(credited)
+    return credited
+
+
+def sweep(batch_size: int = REFERRAL_SWEEP_BATCH) -> int:
+    """Backfill milestones from existing rows and credit every qualifying referee.
+
+    Walks referees in primary-key batches, so each query touches at most
+    `batch_size` users however large the table is.
+    """
+    first_deposit = select(func.min(Transaction.completed_at)).where(
+        Transaction.user_id == User.id, Transaction.type == 'deposit', Transaction.status == 'completed'
+    ).scalar_subquery()
+    first_game = select(func.min(GameParticipant.created_at)).where(
+        GameParticipant.user_id == User.id
+    ).scalar_subquery()
+
+    credited = 0
+    last_id = 0
+    while True:
+        batch = db.session.execute(
+            select(User.id)
+            .where(User.id > last_id, User.referrer_id.isnot(None), User.referral_credited_at.is_(None))
+            .order_by(User.id).limit(batch_size)
+        ).scalars().all()
+        if not batch:
+            break
+        last_id = batch[-1]
+        now = datetime.utcnow()
+        try:
+            for column, value in ((User.first_deposit_at, first_deposit), (User.first_game_at, first_game)):
+                db.session.execute(
+                    update(User).where(User.id.in_(batch), column.is_(None)).values({column.key: value})
+                    .execution_options(synchronize_session=False)
+                )
+            referee_ids = credit_referrals(batch, now)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        _notify_referrers(referee_ids)
+        credited += len(referee_ids)
+    return credited
+
+
+class ReferralEngine:
+    """Drains milestone events in batches and runs the periodic sweep."""
+
+    def __init__(self, app, interval: float = REFERRAL_BATCH_INTERVAL,
+                 sweep_interval: float = 0, batch_size: int = REFERRAL_BATCH_SIZE):
+        self.app = app
+        self.interval = interval
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        self._thread = threading.Thread(target=self._run, name="referrals", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _drain(self) -> Dict[str, Set[int]]:
+        """Collect events for up to `interval` seconds, stopping early at `batch_size` user ids."""
+        events = defaultdict(set)
+        deadline = time.monotonic() + self.interval
+        collected = 0
+        while collected < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                milestone, user_ids = _events.get(timeout=remaining)
+            except queue.Empty:
+                break
+            events[milestone].update(user_ids)
+            collected += len(user_ids)
+        return events
+
+    def _run(self):
+        next_sweep = time.monotonic() if self.sweep_interval > 0 else None
+        while True:
+            events = self._drain()
+            try:
+                with self.app.app_context():
+                    if events:
+                        credited = process_events(events)
+                        if credited:
+                            logger.info("Credited referral bonuses for %d referees", len(credited))
+                    if next_sweep is not None and time.monotonic() >= next_sweep:
+                        started = time.perf_counter()
+                        credited = sweep()
+                        logger.info("Referral sweep credited %d referees in %.2fs",
+                                    credited, time.perf_counter() - started)
+                        next_sweep = time.monotonic() + self.sweep_interval
+            except Exception as e:
+                # Dropped events are picked up again by the next sweep
+                logger.error("Referral processing failed: %s", e)
+
+
+def start_referral_engine(app, sweep: bool = False) -> ReferralEngine:
+    """Start this process's referral worker; only one process should sweep."""
+    global _engine
+    if _engine is None:
+        _engine = ReferralEngine(app, sweep_interval=REFERRAL_SWEEP_INTERVAL if sweep else 0)
+        _engine.start()
+    return _engine
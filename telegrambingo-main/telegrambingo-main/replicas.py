@@ -0,0 +1,136 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Hashable, Optional
+
+from sqlalchemy import insert, select, update
+
+import metrics
+from config import REPLICA_CHECK_INTERVAL, REPLICA_MAX_LAG, REPLICA_STICKY_USERS
+from database import REPLICA, db
+from models import ReplicaHeartbeat
+
+logger = logging.getLogger(__name__)
+
+REPLICA_LAG = metrics.gauge("bingo_db_replica_lag_seconds", "How far the read replica is behind the primary")
+REPLICA_READS = metrics.counter(
+    "bingo_db_replica_reads", "Read-only scopes by the database that served them", ["target"])
+
+# Reads of a user who wrote within this window stay on the primary: a replica that
+# passed its last lag check is at most this far behind
+STICKY_SECONDS = REPLICA_MAX_LAG + REPLICA_CHECK_INTERVAL
+
+_lag: Optional[float] = None  # seconds; None until measured and while the replica is unreachable
+_written: "OrderedDict[Hashable, float]" = OrderedDict()  # user key -> monotonic time of their last write
+_lock = threading.Lock()
+_checker: Optional[threading.Thread] = None
+
+
+def mark_written(key: Hashable):
+    """Note that a user just wrote, so their reads stay on the primary until the replica has it.
+
+    Process-local: writes made by another process are seen through
+    User.last_write_at instead; see user_reads().
+    """
+    with _lock:
+        _written[key] = time.monotonic()
+        _written.move_to_end(key)
+        if len(_written) > REPLICA_STICKY_USERS:
+            _written.popitem(last=False)
+
+
+def replica_ok(key: Optional[Hashable] = None, wrote_at: Optional[float] = None) -> bool:
+    """Whether the replica may serve a read for `key`, or for a client that last wrote at `wrote_at` (epoch)."""
+    if REPLICA not in db.engines or _lag is None or _lag > REPLICA_MAX_LAG:
+        return False
+    if wrote_at is not None and time.time() - wrote_at < STICKY_SECONDS:
+        return False
+    if key is not None:
+        with _lock:
+            written = _written.get(key)
+        if written is not None and time.monotonic() - written < STICKY_SECONDS:
+            return False
+    return True
+
+
+@contextmanager
+def replica_reads(key: Optional[Hashable] = None, wrote_at: Optional[float] = None):
+    """Send the current session's reads to the replica when it is fresh enough for this user.
+
+    Use inside an app context around read-only work; anything flushed still
+    goes to the primary.
+    """
+    use = replica_ok(key, wrote_at)
+    REPLICA_READS.inc(target=REPLICA if use else "primary")
+    session = db.session()
+    previous = session.info.get(REPLICA)
+    session.info[REPLICA] = use
+    try:
+        yield use
+    finally:
+        session.info[REPLICA] = previous
+
+
+def user_reads(user):
+    """replica_reads() for reads about `user`, a row just loaded from the primary.
+
+    Its last_write_at is stamped by whichever process wrote, so a deposit the
+    web process confirmed keeps the bot's reads on the primary too.
+    """
+    wrote_at = user.last_write_at
+    return replica_reads(user.telegram_id, wrote_at.replace(tzinfo=timezone.utc).timestamp() if wrote_at else None)
+
+
+def check_lag() -> Optional[float]:
+    """Stamp the heartbeat on the primary and return the age of the replica's copy. Call inside an app context."""
+    global _lag
+    now = datetime.utcnow()
+    with db.engine.begin() as conn:
+        if not conn.execute(update(ReplicaHeartbeat).where(ReplicaHeartbeat.id == 1)
+                            .values(beat_at=now)).rowcount:
+            conn.execute(insert(ReplicaHeartbeat).values(id=1, beat_at=now))
+    try:
+        with db.engines[REPLICA].connect() as conn:
+            beat = conn.execute(select(ReplicaHeartbeat.beat_at).where(ReplicaHeartbeat.id == 1)).scalar()
+    except Exception as e:
+        logger.debug("Replica unreachable: %s", e)
+        beat = None
+    # A replica without the heartbeat row hasn't replicated it yet
+    _lag = max(0.0, (now - beat).total_seconds()) if beat is not None else None
+    if _lag is not None:
+        REPLICA_LAG.set(_lag)
+    return _lag
+
+
+def start_lag_checks(app, interval: float = REPLICA_CHECK_INTERVAL):
+    """Check replica lag every `interval` seconds in a daemon thread; does nothing without a replica."""
+    global _checker
+    with app.app_context():
+        if REPLICA not in db.engines or _checker is not None:
+            return None
+
+    def run():
+        global _lag
+        was_lagging = True
+        while True:
+            try:
+                with app.app_context():
+                    lag = check_lag()
+            except Exception as e:
+                logger.error("Replica lag check failed: %s", e)
+                _lag = lag = None
+            lagging = lag is None or lag > REPLICA_MAX_LAG
+            if lagging != was_lagging:
+                if lagging:
+                    logger.warning("Replica lag %s exceeds %ss, reading from the primary", lag, REPLICA_MAX_LAG)
+                else:
+                    logger.info("Reading from the replica (%.2fs behind)", lag)
+                was_lagging = lagging
+            time.sleep(interval)
+
+    _checker = threading.Thread(target=run, name="replica-lag", daemon=True)
+    _checker.start()
+    return _checker
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import math
+import statistics
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+import metrics
+from config import CALL_INTERVAL_SECONDS, ROOM_TICK_SECONDS, ROOM_WHEEL_SLOTS
+from game_logic import BingoGame
+
+logger = logging.getLogger(__name__)
+
+CALL_LAG_SECONDS = metrics.histogram(
+    "bingo_room_call_lag_seconds", "Delay between a room's scheduled automatic call and the call",
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+ROOMS_SCHEDULED = metrics.gauge("bingo_rooms_scheduled", "Rooms with a pending automatic call")
+
+GOLDEN_FRACTION = 0.6180339887498949  # successive room ids land far apart within the interval
+
+
+class TimerWheel:
+    """Hashed timing wheel of one timer per key.
+
+    Scheduling and cancelling are O(1), and advancing visits only the slots
+    of the ticks that passed. A deadline more than one revolution out stays in
+    its slot until its tick comes round.
+    """
+
+    def __init__(self, tick: float, slots: int, now: float):
+        self.tick = tick
+        self.slots = slots
+        self._slots: List[Dict[int, Tuple[int, float]]] = [{} for _ in range(slots)]
+        self._slot_of: Dict[int, int] = {}
+        self._current = int(now / tick)  # last tick processed
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._slot_of
+
+    def schedule(self, key: int, deadline: float):
+        """Set the key's timer, replacing any pending one; deadlines in the past fire next tick."""
+        self.cancel(key)
+        tick = max(math.ceil(deadline / self.tick), self._current + 1)
+        index = tick % self.slots
+        self._slots[index][key] = (tick, deadline)
+        self._slot_of[key] = index
+
+    def cancel(self, key: int):
+        index = self._slot_of.pop(key, None)
+        if index is not None:
+            del self._slots[index][key]
+
+    def advance(self, now: float) -> List[Tuple[int, float]]:
+        """Remove and return (key, deadline) for every timer due by `now`."""
+        target = int(now / self.tick)
+        due = []
+        for step in range(1, min(target - self._current, self.slots) + 1):
+            slot = self._slots[(self._current + step) % self.slots]
+            if not slot:
+                continue
+            for key in [key for key, (tick, _) in slot.items() if tick <= target]:
+                due.append((key, slot.pop(key)[1]))
+                del self._slot_of[key]
+        self._current = max(self._current, target)
+        return due
+
+
+class RoomScheduler:
+    """Automatic number calls for every room of a store, from one timer wheel.
+
+    Each room is one wheel entry, so a tick costs a visit to one slot rather
+    than a scan of every game, and 10k rooms need one task. Calls run at a
+    fixed rate from their scheduled time, so lag does not accumulate. Rooms
+    without a recent call (waiting, new, or recovered after a restart) get a
+    phase within the interval derived from their id. That spreads calls, and
+    the broadcasts that follow them, across ticks instead of firing every
+    room at once.
+    """
+
+    def __init__(self, games: Mapping[int, BingoGame], interval: float = CALL_INTERVAL_SECONDS,
+                 lock=None, tick: float = ROOM_TICK_SECONDS, slots: int = ROOM_WHEEL_SLOTS,
+                 on_call: Optional[Callable[[BingoGame, str], None]] = None):
+        self.games = games
+        self.interval = interval
+        self.lock = lock if lock is not None else threading.RLock()
+        self.on_call = on_call
+        self.wheel = TimerWheel(tick, slots, time.monotonic())
+        self.calls = 0
+        self._wheel_lock = threading.Lock()
+        self._lags = deque(maxlen=10000)  # recent call lags in seconds, for stats()
+        self._thread: Optional[threading.Thread] = None
+
+    def _phase(self, game_id: int) -> float:
+        return (game_id * GOLDEN_FRACTION) % 1.0 * self.interval
+
+    def _first_deadline(self, game: BingoGame, now: float) -> float:
+        if game.status == "active" and game.last_call_time is not None:
+            wait = self.interval - (datetime.utcnow() - game.last_call_time).total_seconds()
+            if wait > -self.interval:
+                return now + max(wait, 0.0)
+        return now + self._phase(game.game_id)
+
+    def add(self, game_id: int):
+        """Start scheduling a room's automatic calls."""
+        game = self.games.get(game_id)
+        if game is None:
+            return
+        deadline = self._first_deadline(game, time.monotonic())
+        with self._wheel_lock:
+            self.wheel.schedule(game_id, deadline)
+
+    def remove(self, game_id: int):
+        with self._wheel_lock:
+            self.wheel.cancel(game_id)
+
+    def _fire(self, game_id: int, deadline: float, now: float) -> Optional[float]:
+        """Call the room's next number if it is due; returns its next deadline, or None to drop it."""
+        game = self.games.get(game_id)
+        if game is None or game.status == "finished":
+            return None
+        if game.status != "active":
+            return now + self.interval
+        if game.last_call_time is not None:
+            since = (datetime.utcnow() - game.last_call_time).total_seconds()
+            if since < self.interval - self.wheel.tick:
+                return now + self.interval - since  # called by hand in the meantime
+        number = game.call_number()
+        lag = max(0.0, now - deadline)
+        CALL_LAG_SECONDS.observe(lag)
+        self._lags.append(lag)
+        self.calls += 1
+        if number is not None and self.on_call is not None:
+            self.on_call(game, number)
+        if game.status == "finished":
+            return None
+        return max(deadline + self.interval, now + self.wheel.tick)
+
+    def run_due(self, now: Optional[float] = None) -> int:
+        """Fire every room due by `now` and return how many were due."""
+        now = time.monotonic() if now is None else now
+        with self._wheel_lock:
+            due = self.wheel.advance(now)
+        if not due:
+            return 0
+        rescheduled = []
+        with self.lock:
+            for game_id, deadline in due:
+                next_deadline = self._fire(game_id, deadline, now)
+                if next_deadline is not None:
+                    rescheduled.append((game_id, next_deadline))
+        with self._wheel_lock:
+            for game_id, next_deadline in rescheduled:
+                if game_id not in self.wheel:  # add() may have rescheduled it meanwhile
+                    self.wheel.schedule(game_id, next_deadline)
+            ROOMS_SCHEDULED.set(len(self.wheel))
+        return len(due)
+
+    def next_tick_in(self) -> float:
+        """Seconds until the next wheel tick boundary."""
+        tick = self.wheel.tick
+        return tick - time.monotonic() % tick
+
+    async def run(self):
+        """Fire due rooms on every wheel tick until cancelled."""
+        while True:
+            await asyncio.sleep(self.next_tick_in())
+            try:
+                self.run_due()
+            except Exception:
+                logger.exception("Room scheduler tick failed")
+
+    def start(self):
+        """Run the scheduler on its own event loop in a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=asyncio.run, args=(self.run(),),
+                                            name="room-scheduler", daemon=True)
+            self._thread.start()
+
+    def stats(self) -> dict:
+        """Rooms scheduled, calls made and recent call lag percentiles in milliseconds."""
+        lags = sorted(self._lags)
+        stats = {'rooms': len(self.wheel), 'calls': self.calls}
+        if len(lags) > 1:
+            stats.update(lag_p50_ms=round(statistics.median(lags) * 1000, 2),
+                         lag_p99_ms=round(lags[int(len(lags) * 0.99) - 1] * 1000, 2),
+                         lag_max_ms=round(lags[-1] * 1000, 2))
+        return stats
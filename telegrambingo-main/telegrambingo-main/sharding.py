@@ -0,0 +1,519 @@
+import atexit
+import bisect
+import copy
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from config import (
+    CALL_INTERVAL_SECONDS, DEFAULT_PRIZE_TABLE, FINISHED_GAME_TTL, GAME_EVICT_INTERVAL, GAME_SHARDS,
+    SHARD_HEALTH_MAX_AGE, SHARD_REQUEST_TIMEOUT, SHARD_VNODES, SNAPSHOT_INTERVAL,
+)
+from game_logic import BingoGame
+from journal import attach_journal, detach_journal
+from recovery import encode_snapshot, recover_games, write_snapshot
+from rooms import RoomScheduler
+
+logger = logging.getLogger(__name__)
+
+
+def _game_counts(games) -> dict:
+    """Count games, active games and players in active games."""
+    games = list(games)
+    active = [game for game in games if game.status == "active"]
+    return {'games': len(games), 'active': len(active),
+            'players': sum(len(game.players) for game in active)}
+
+
+def _open_games(games) -> List[dict]:
+    """Summaries of the games still waiting or active."""
+    return [{'id': game.game_id, 'entry_price': game.entry_price, 'players': len(game.players),
+             'pool': game.pool, 'status': game.status}
+            for game in games if game.status != "finished"]
+
+
+def _evict_finished(games: Dict[int, BingoGame], scheduler: Optional[RoomScheduler],
+                    ttl: float = FINISHED_GAME_TTL) -> List[int]:
+    """Drop games that finished more than `ttl` seconds ago; returns their ids."""
+    cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+    evicted = [game_id for game_id, game in games.items()
+               if game.status == "finished" and (game.finished_at or game.created_at) < cutoff]
+    for game_id in evicted:
+        del games[game_id]
+        if scheduler is not None:
+            scheduler.remove(game_id)
+    return evicted
+
+
+class LocalGameStore(dict):
+    """In-process game storage; game_id -> BingoGame."""
+
+    def __init__(self, call_interval: float = CALL_INTERVAL_SECONDS,
+                 snapshot_interval: float = SNAPSHOT_INTERVAL):
+        super().__init__()
+        self.call_interval = call_interval
+        self.snapshot_interval = snapshot_interval
+        self._lock = threading.RLock()
+        self._caller: Optional[RoomScheduler] = None
+
+        # Warm restart: bring back every in-flight game
+        games, self._next_id = recover_games("local")
+        self.update(games)
+        for game_id in games:
+            self._schedule(game_id)
+        threading.Thread(target=self._run_housekeeping, name="game-housekeeping", daemon=True).start()
+        if snapshot_interval > 0:
+            atexit.register(self.snapshot)
+
+    def create(self, entry_price: int, prize_table: str = DEFAULT_PRIZE_TABLE) -> int:
+        """Create a new game and return its id."""
+        with self._lock:
+            game_id = self._next_id
+            self._next_id += 1
+            self[game_id] = BingoGame(game_id, entry_price, prize_table=prize_table)
+            attach_journal(self[game_id])
+        self._schedule(game_id)
+        return game_id
+
+    def snapshot(self):
+        """Write a snapshot of all live games."""
+        with self._lock:
+            snapshot = encode_snapshot(self.values(), self._next_id)
+        write_snapshot("local", snapshot)
+
+    def evict_finished(self, ttl: float = FINISHED_GAME_TTL) -> int:
+        """Drop games that finished more than `ttl` seconds ago and return how many."""
+        with self._lock:
+            return len(_evict_finished(self, self._caller, ttl))
+
+    def _run_housekeeping(self):
+        """Snapshot every snapshot_interval and evict finished games every GAME_EVICT_INTERVAL."""
+        last_evict = time.monotonic()
+        while True:
+            time.sleep(self.snapshot_interval if self.snapshot_interval > 0 else GAME_EVICT_INTERVAL)
+            if time.monotonic() - last_evict >= GAME_EVICT_INTERVAL:
+                self.evict_finished()
+                last_evict = time.monotonic()
+            if self.snapshot_interval > 0:
+                try:
+                    self.snapshot()
+                except OSError as e:
+                    logger.error("Snapshot failed: %s", e)
+
+    def apply(self, game_id: int, method: str, *args):
+        """Run a BingoGame method on the stored game."""
+        with self._lock:
+            return getattr(self[game_id], method)(*args)
+
+    def read(self, game_id: int, attr: str):
+        """Read a single attribute of the stored game; lists and dicts come back as copies."""
+        with self._lock:
+            value = getattr(self[game_id], attr)
+            return copy.copy(value) if isinstance(value, (list, dict)) else value
+
+    def has_player(self, game_id: int, user_id: int) -> bool:
+        """Whether the user has joined the game."""
+        with self._lock:
+            return user_id in self[game_id].players
+
+    def open_games(self) -> List[dict]:
+        """Summaries of the waiting and active games."""
+        with self._lock:
+            return _open_games(self.values())
+
+    def health(self) -> List[dict]:
+        """Report the state of the in-process store."""
+        with self._lock:
+            entry = dict(shard=0, alive=True, pid=os.getpid(), **_game_counts(self.values()))
+        if self._caller is not None:
+            entry['scheduler'] = self._caller.stats()
+        return [entry]
+
+    def _schedule(self, game_id: int):
+        """Hand a game to the room scheduler, starting it on first use."""
+        if self.call_interval <= 0:
+            return
+        if self._caller is None:
+            self._caller = RoomScheduler(self, self.call_interval, lock=self._lock)
+            self._caller.start()
+        self._caller.add(game_id)
+
+
+class HashRing:
+    """Consistent hash ring mapping game ids to shard ids."""
+
+    def __init__(self, vnodes: int = SHARD_VNODES):
+        self.vnodes = vnodes
+        self._hashes: List[int] = []
+        self._owners: List[int] = []
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def add(self, shard_id: int):
+        """Add a shard with its virtual nodes to the ring."""
+        for i in range(self.vnodes):
+            h = self._hash(f"shard-{shard_id}-{i}")
+            pos = bisect.bisect(self._hashes, h)
+            self._hashes.insert(pos, h)
+            self._owners.insert(pos, shard_id)
+
+    def lookup(self, game_id: int) -> int:
+        """Return the shard id owning a game."""
+        pos = bisect.bisect(self._hashes, self._hash(f"game-{game_id}")) % len(self._hashes)
+        return self._owners[pos]
+
+
+def _shard_worker(conn, shard_id: int, num_shards: int, call_interval: float,
+                  snapshot_interval: float, recover: bool):
+    """Shard process main loop: owns its games, their caller timers and snapshots."""
+    snapshot_name = f"shard-{shard_id}"
+    games: Dict[int, BingoGame] = {}
+    if recover:
+        ring = HashRing()
+        for i in range(num_shards):
+            ring.add(i)
+        games, _ = recover_games(snapshot_name, owns=lambda game_id: ring.lookup(game_id) == shard_id)
+    started = time.time()
+    last_snapshot = started
+    scheduler = RoomScheduler(games, call_interval) if call_interval > 0 else None
+    if scheduler is not None:
+        for game_id in games:
+            scheduler.add(game_id)
+    tick = min(snapshot_interval, 0.5) if snapshot_interval > 0 else None
+
+    while True:
+        if conn.poll(scheduler.next_tick_in() if scheduler else tick):
+            try:
+                seq, op, args = conn.recv()
+            except EOFError:
+                return
+            try:
+                if op == 'create':
+                    game_id, entry_price, prize_table = args
+                    games[game_id] = BingoGame(game_id, entry_price, prize_table=prize_table)
+                    attach_journal(games[game_id])
+                    if scheduler is not None:
+                        scheduler.add(game_id)
+                    result = game_id
+                elif op == 'apply':
+                    game_id, method, method_args = args
+                    result = getattr(games[game_id], method)(*method_args)
+                elif op == 'get':
+                    result = games.get(args[0])
+                elif op == 'read':
+                    result = getattr(games[args[0]], args[1])
+                elif op == 'has_player':
+                    result = args[1] in games[args[0]].players
+                elif op == 'ids':
+                    result = list(games)
+                elif op == 'open':
+                    result = _open_games(games.values())
+                elif op == 'evict':
+                    result = _evict_finished(games, scheduler, args[0])
+                elif op == 'export':
+                    # Each game travels with its journal record count, so numbering carries on
+                    result = []
+                    for game_id in args[0]:
+                        if game_id in games:
+                            game = games.pop(game_id)
+                            result.append((game, detach_journal(game)))
+                            if scheduler is not None:
+                                scheduler.remove(game_id)
+                elif op == 'import':
+                    for game, count in args[0]:
+                        games[game.game_id] = game
+                        attach_journal(game, resume=True, count=count)
+                        if scheduler is not None:
+                            scheduler.add(game.game_id)
+                    result = len(args[0])
+                elif op == 'ping':
+                    result = dict(shard=shard_id, pid=os.getpid(),
+                                  uptime=round(time.time() - started, 1), **_game_counts(games.values()))
+                    if scheduler is not None:
+                        result['scheduler'] = scheduler.stats()
+                elif op == 'stop':
+                    if snapshot_interval > 0:
+                        write_snapshot(snapshot_name, encode_snapshot(games.values(), 0))
+                    conn.send((seq, 'ok', None))
+                    return
+                else:
+                    raise ValueError(f"Unknown shard operation: {op}")
+                conn.send((seq, 'ok', result))
+            except Exception as e:
+                conn.send((seq, 'error', f"{type(e).__name__}: {e}"))
+
+        if scheduler is not None:
+            scheduler.run_due()
+
+        if snapshot_interval > 0 and time.time() - last_snapshot >= snapshot_interval:
+            try:
+                write_snapshot(snapshot_name, encode_snapshot(games.values(), 0))
+            except OSError as e:
+                logger.error("Snapshot of shard %s failed: %s", shard_id, e)
+            last_snapshot = time.time()
+
+
+class ShardError(RuntimeError):
+    pass
+
+
+class _Shard:
+    def __init__(self, ctx, shard_id: int, num_shards: int, call_interval: float, recover: bool):
+        self.shard_id = shard_id
+        self.num_shards = num_shards  # ring size the shard recovers its games against; see ShardRouter
+        self.call_interval = call_interval
+        self.restarts = 0
+        self._ctx = ctx
+        self.lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._start_process(recover)
+
+    def _start_process(self, recover: bool):
+        self.conn, child_conn = self._ctx.Pipe()
+        self.process = self._ctx.Process(
+            target=_shard_worker,
+            args=(child_conn, self.shard_id, self.num_shards, self.call_interval, SNAPSHOT_INTERVAL, recover),
+            name=f"game-shard-{self.shard_id}",
+            daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+
+    def _respawn(self):
+        """Replace a dead shard process with one recovered from its snapshot and journal."""
+        logger.error("Shard %s (pid %s) died with exit code %s; restarting it",
+                     self.shard_id, self.process.pid, self.process.exitcode)
+        self.conn.close()
+        self.process.join(timeout=1.0)
+        self.restarts += 1
+        self._start_process(recover=True)
+
+    def request(self, op: str, *args, timeout: float = SHARD_REQUEST_TIMEOUT):
+        """Send an operation and wait for its reply.
+
+        Requests carry a sequence number, so a reply that arrives after its request
+        timed out is discarded instead of being taken for the next request's. A dead
+        shard is restarted before the request is sent; if it dies while handling the
+        request, it is restarted and the request fails, since it may have been applied.
+        """
+        with self.lock:
+            if not self.process.is_alive():
+                self._respawn()
+            seq = next(self._seq)
+            try:
+                self.conn.send((seq, op, args))
+                deadline = time.monotonic() + timeout
+                while True:
+                    if not self.conn.poll(max(deadline - time.monotonic(), 0)):
+                        raise ShardError(f"Shard {self.shard_id} timed out on {op}")
+                    reply_seq, status, result = self.conn.recv()
+                    if reply_seq == seq:
+                        break
+                    logger.warning("Discarded late reply to request %s from shard %s", reply_seq, self.shard_id)
+            except (OSError, EOFError) as e:
+                self.process.join(timeout=1.0)
+                if not self.process.is_alive():
+                    self._respawn()
+                raise ShardError(f"Shard {self.shard_id} died during {op}: {e!r}") from e
+        if status != 'ok':
+            raise ShardError(result)
+        return result
+
+
+class ShardRouter:
+    """Routes game operations to worker processes by consistent hashing of game_id."""
+
+    def __init__(self, num_shards: int, call_interval: float = CALL_INTERVAL_SECONDS):
+        self.call_interval = call_interval
+        self._ctx = multiprocessing.get_context("spawn")
+        self._ring = HashRing()
+        self._shards: Dict[int, _Shard] = {}
+        self._game_ids = set()
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._initial_shards = num_shards
+        self._health_lock = threading.Lock()
+        self._health = (0.0, [])  # (monotonic time, report) of the last pings
+
+    def _start(self):
+        # Shards are spawned lazily so that forking servers start them per worker
+        if not self._shards:
+            for _ in range(self._initial_shards):
+                self._spawn_shard(recover=True)
+            self._recover()
+            threading.Thread(target=self._run_housekeeping, name="shard-housekeeping", daemon=True).start()
+
+    def evict_finished(self, ttl: float = FINISHED_GAME_TTL) -> int:
+        """Drop games that finished more than `ttl` seconds ago from every shard; returns how many."""
+        with self._lock:
+            shards = list(self._shards.values())
+        evicted = 0
+        for shard in shards:
+            try:
+                game_ids = shard.request('evict', ttl)
+            except ShardError as e:
+                logger.error("Evicting finished games on shard %s failed: %s", shard.shard_id, e)
+                continue
+            with self._lock:
+                self._game_ids.difference_update(game_ids)
+            evicted += len(game_ids)
+        return evicted
+
+    def _run_housekeeping(self):
+        """Evict finished games, which also restarts any shard found dead."""
+        while True:
+            time.sleep(GAME_EVICT_INTERVAL)
+            self.evict_finished()
+
+    def _recover(self):
+        """Adopt the games shards restored on startup and place them on their owners."""
+        for shard in self._shards.values():
+            self._game_ids.update(shard.request('ids'))
+        if self._game_ids:
+            self._ids = itertools.count(max(self._game_ids) + 1)
+            self._rebalance()
+
+    def _rebalance(self) -> int:
+        """Move every game that sits on a shard other than its ring owner."""
+        moved = 0
+        for shard in list(self._shards.values()):
+            misplaced = {}
+            for game_id in shard.request('ids'):
+                owner = self._ring.lookup(game_id)
+                if owner != shard.shard_id:
+                    misplaced.setdefault(owner, []).append(game_id)
+            for owner, game_ids in misplaced.items():
+                games = shard.request('export', game_ids)
+                self._shards[owner].request('import', games)
+                moved += len(games)
+        return moved
+
+    def _spawn_shard(self, recover: bool = False) -> _Shard:
+        shard_id = len(self._shards)
+        shard = _Shard(self._ctx, shard_id, max(self._initial_shards, shard_id + 1), self.call_interval,
+                       recover)
+        for other in self._shards.values():
+            other.num_shards = shard.num_shards  # a shard restarted later recovers against the grown ring
+        self._shards[shard_id] = shard
+        self._ring.add(shard_id)
+        logger.info("Started game shard %s (pid %s)", shard_id, shard.process.pid)
+        return shard
+
+    def _shard_for(self, game_id: int) -> _Shard:
+        with self._lock:
+            self._start()
+            return self._shards[self._ring.lookup(game_id)]
+
+    def create(self, entry_price: int, prize_table: str = DEFAULT_PRIZE_TABLE) -> int:
+        """Create a new game on its owning shard and return its id."""
+        with self._lock:
+            self._start()
+            game_id = next(self._ids)
+            self._game_ids.add(game_id)
+        self._shard_for(game_id).request('create', game_id, entry_price, prize_table)
+        return game_id
+
+    def apply(self, game_id: int, method: str, *args):
+        """Run a BingoGame method on the shard that owns the game."""
+        return self._shard_for(game_id).request('apply', game_id, method, args)
+
+    def read(self, game_id: int, attr: str):
+        """Read a single attribute of a game from its shard."""
+        return self._shard_for(game_id).request('read', game_id, attr)
+
+    def has_player(self, game_id: int, user_id: int) -> bool:
+        """Whether the user has joined the game, without copying its players out of the shard."""
+        return self._shard_for(game_id).request('has_player', game_id, user_id)
+
+    def __contains__(self, game_id) -> bool:
+        with self._lock:
+            self._start()
+        return game_id in self._game_ids
+
+    def __getitem__(self, game_id: int) -> BingoGame:
+        """Return a snapshot copy of the game for rendering."""
+        if game_id not in self._game_ids:
+            raise KeyError(game_id)
+        return self._shard_for(game_id).request('get', game_id)
+
+    def get(self, game_id: int, default=None) -> Optional[BingoGame]:
+        return self[game_id] if game_id in self else default
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._start()
+        return len(self._game_ids)
+
+    def add_shard(self) -> int:
+        """Add a shard and move the games it now owns onto it."""
+        with self._lock:
+            self._start()
+            new_shard = self._spawn_shard()
+            moved = self._rebalance()
+            logger.info("Rebalanced %s games onto shard %s", moved, new_shard.shard_id)
+            return new_shard.shard_id
+
+    def open_games(self) -> List[dict]:
+        """Summaries of the waiting and active games on every live shard."""
+        with self._lock:
+            self._start()
+            shards = list(self._shards.values())
+        games = []
+        for shard in shards:
+            try:
+                games.extend(shard.request('open'))
+            except ShardError as e:
+                logger.error("Listing games on shard %s failed: %s", shard.shard_id, e)
+        return games
+
+    def health(self, max_age: float = SHARD_HEALTH_MAX_AGE) -> List[dict]:
+        """Ping every shard and report its status, reusing a report up to `max_age` seconds old."""
+        with self._health_lock:
+            checked_at, report = self._health
+            if time.monotonic() - checked_at >= max_age:
+                report = self._ping_shards()
+                self._health = (time.monotonic(), report)
+            return copy.deepcopy(report)
+
+    def _ping_shards(self) -> List[dict]:
+        with self._lock:
+            self._start()
+            shards = list(self._shards.values())
+        report = []
+        for shard in shards:
+            entry = {'shard': shard.shard_id}
+            try:
+                entry.update(shard.request('ping', timeout=1.0))
+                entry['alive'] = True
+            except ShardError as e:
+                entry.update(alive=False, error=str(e))
+            # After the ping, which respawns a dead process
+            entry.update(pid=shard.process.pid, restarts=shard.restarts)
+            report.append(entry)
+        return report
+
+    def close(self):
+        """Stop all shard processes."""
+        with self._lock:
+            for shard in self._shards.values():
+                try:
+                    shard.request('stop', timeout=1.0)
+                except ShardError:
+                    pass
+                shard.process.join(timeout=1.0)
+            self._shards.clear()
+
+
+def create_game_store():
+    """Create the game store configured for this process."""
+    if GAME_SHARDS > 0:
+        return ShardRouter(GAME_SHARDS)
+    return LocalGameStore()
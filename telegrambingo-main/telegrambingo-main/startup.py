@@ -0,0 +1,34 @@
+import logging
+import time
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+STARTUP_SECONDS = metrics.gauge(
+    "bingo_startup_seconds", "Time spent in each startup phase", ["process", "phase"])
+
+
+class StartupTimer:
+    """Record how long each startup phase took; phases are timed back to back."""
+
+    def __init__(self, process: str):
+        self.process = process
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []
+
+    def mark(self, phase: str):
+        """End the current phase, naming it `phase`."""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        STARTUP_SECONDS.set(now - self._last, process=self.process, phase=phase)
+        self._last = now
+
+    def report(self) -> float:
+        """Log the total and per-phase startup time and return the total in seconds."""
+        total = self._last - self.started
+        STARTUP_SECONDS.set(total, process=self.process, phase="total")
+        logger.info("%s started in %.0fms (%s)", self.process, total * 1000,
+                    ", ".join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in self.phases))
+        return total
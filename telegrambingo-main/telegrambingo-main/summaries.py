@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Tuple
+
+from sqlalchemy import func
+
+from config import SUMMARY_LAG_SECONDS, SUMMARY_REFRESH_INTERVAL
+from database import db
+from models import DepositorTotal, Game, SummaryWatermark, TierRevenue, Transaction
+
+logger = logging.getLogger(__name__)
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _advance(name: str, upto: datetime) -> datetime:
+    """Move a watermark to `upto` (applied on commit) and return its previous value."""
+    mark = db.session.get(SummaryWatermark, name, with_for_update=True)
+    if mark is None:
+        mark = SummaryWatermark(name=name, value=EPOCH)
+        db.session.add(mark)
+    since = mark.value
+    mark.value = max(since, upto)
+    return since
+
+
+def _fold(model, key: str, deltas: Dict, columns: Tuple[str, ...]):
+    """Add per-key deltas onto summary rows, creating missing rows."""
+    if not deltas:
+        return
+    existing = {getattr(row, key): row for row in
+                model.query.filter(getattr(model, key).in_(deltas)).with_for_update()}
+    for value, delta in deltas.items():
+        row = existing.get(value)
+        if row is None:
+            row = model(**{key: value}, **{column: 0 for column in columns})
+            db.session.add(row)
+        for column, amount in zip(columns, delta):
+            setattr(row, column, getattr(row, column) + amount)
+
+
+def refresh_summaries() -> Dict[str, int]:
+    """Fold rows finished since the last refresh into the summary tables.
+
+    Each summary keeps a watermark on the finishing timestamp, so a refresh only
+    aggregates the new window. Rows younger than SUMMARY_LAG_SECONDS wait for the
+    next run to give in-flight transactions time to commit.
+    """
+    upto = datetime.utcnow() - timedelta(seconds=SUMMARY_LAG_SECONDS)
+    try:
+        since = _advance('tier_revenue', upto)
+        tiers = db.session.query(
+            Game.entry_price, func.count(Game.id), func.coalesce(func.sum(Game.pool), 0.0)
+        ).filter(
+            Game.status == 'finished', Game.finished_at > since, Game.finished_at <= upto
+        ).group_by(Game.entry_price).all()
+        _fold(TierRevenue, 'entry_price', {price: (games, revenue) for price, games, revenue in tiers},
+              ('games', 'revenue'))
+
+        since = _advance('depositors', upto)
+        deposits = db.session.query(
+            Transaction.user_id, func.count(Transaction.id), func.sum(Transaction.amount)
+        ).filter(
+            Transaction.type == 'deposit', Transaction.status == 'completed',
+            Transaction.completed_at > since, Transaction.completed_at <= upto
+        ).group_by(Transaction.user_id).all()
+        _fold(DepositorTotal, 'user_id', {user_id: (count, total) for user_id, count, total in deposits},
+              ('deposits', 'total'))
+
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return {'tiers': len(tiers), 'depositors': len(deposits)}
+
+
+def rebuild_summaries():
+    """Drop the summary tables' contents so the next refresh recomputes them from scratch.
+
+    Months already moved out by archive.py are not in the tables any more and drop out of the rollups.
+    """
+    TierRevenue.query.delete()
+    DepositorTotal.query.delete()
+    SummaryWatermark.query.delete()
+    db.session.commit()
+
+
+def start_summary_refresher(app, interval: float = SUMMARY_REFRESH_INTERVAL):
+    """Refresh the summary tables every `interval` seconds in a daemon thread."""
+    if interval <= 0:
+        return None
+
+    def run():
+        while True:
+            started = time.perf_counter()
+            try:
+                with app.app_context():
+                    changed = refresh_summaries()
+                logger.debug("Refreshed summaries in %.3fs: %s", time.perf_counter() - started, changed)
+            except Exception as e:
+                logger.error("Summary refresh failed: %s", e)
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, name="summary-refresh", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,68 @@
+import logging
+import os
+import sys
+import tempfile
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Set before the app is imported, so the test also runs under a plain pytest
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="bingo-mark-")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(TMP, 'bingo.db')}")
+os.environ.setdefault("JOURNAL_DIR", os.path.join(TMP, "journals"))
+os.environ.setdefault("SNAPSHOT_DIR", os.path.join(TMP, "snapshots"))
+
+BAD_NUMBERS = [-3, 0, 76, 10 ** 6, "12", 0.5, 12.0, [1], {"n": 1}, True, False]
+
+
+def test_mark_validation():
+    """Malformed mark requests are rejected with 400 instead of failing inside the game."""
+    from app import active_games, app
+    from migrate import upgrade
+
+    with app.app_context():
+        upgrade()
+    client = app.test_client()
+    game_id = client.post('/game/create', json={'entry_price': 10}).json['game_id']
+    assert client.get(f'/game/{game_id}').status_code == 200
+    with client.session_transaction() as session:
+        user_id = session['user_id']
+
+    for number in BAD_NUMBERS:
+        response = client.post(f'/game/{game_id}/mark', json={'number': number})
+        assert response.status_code == 400, (number, response.status_code, response.data)
+    for body in (b'[1]', b'"12"', b'null', b'not json'):
+        response = client.post(f'/game/{game_id}/mark', data=body, content_type='application/json')
+        assert response.status_code == 400, (body, response.status_code, response.data)
+    response = client.post(f'/game/{game_id}/mark', json={})
+    assert response.status_code == 400 and response.json['error'] == 'Number required', response.json
+    logger.info("✅ %d malformed payloads rejected with 400", len(BAD_NUMBERS) + 5)
+
+    # The game itself refuses them too, for callers that skip the route
+    for number in BAD_NUMBERS:
+        assert active_games.apply(game_id, 'mark_number', user_id, number) is False, number
+    logger.info("✅ BingoGame.mark_number refuses numbers outside 1-75")
+
+    # Call numbers until one lands on the board
+    board = active_games.read(game_id, 'players')[user_id]['board']
+    hit = None
+    for _ in range(75):
+        called = active_games.read(game_id, 'called_numbers')
+        hit = next((number for number in board if number in called), None)
+        if hit is not None:
+            break
+        assert client.post(f'/game/{game_id}/call').status_code == 200
+    assert hit is not None, (board, called)
+    response = client.post(f'/game/{game_id}/mark', json={'number': hit})
+    assert response.status_code == 200 and hit in response.json['marked'], response.json
+    logger.info("✅ A called number on the board is still marked")
+
+
+if __name__ == "__main__":
+    test_mark_validation()
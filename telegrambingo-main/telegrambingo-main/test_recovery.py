@@ -0,0 +1,124 @@
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+import logging
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+GAMES = int(os.getenv("RECOVERY_TEST_GAMES", "2000"))
+
+
+def dump_state(store, path):
+    """Write the in-flight games of a store as comparable JSON."""
+    state = {}
+    for game_id, game in store.items():
+        if game.status == "finished":
+            continue
+        state[str(game_id)] = {
+            "status": game.status,
+            "pool": game.pool,
+            "called": game.called_numbers,
+            "last_call_time": game.last_call_time.isoformat() if game.last_call_time else None,
+            "players": {str(uid): [p['cartela_number'], p['marked']] for uid, p in game.players.items()},
+        }
+    with open(path, "w") as f:
+        json.dump(state, f, sort_keys=True)
+
+
+def play_round(store, rng):
+    """Call a number in every active game and mark it for players holding it."""
+    for game_id, game in list(store.items()):
+        if game.status != "active":
+            continue
+        store.apply(game_id, 'call_number')
+        number = game.called_numbers[-1] if game.called_numbers else None
+        for user_id, player in game.players.items():
+            if number in player['board'] and rng.random() < 0.9:
+                store.apply(game_id, 'mark_number', user_id, number)
+                if store.apply(game_id, 'claim', user_id)[0]:
+                    store.apply(game_id, 'end_game', user_id)
+                    break
+
+
+def crash_child(state_path):
+    """Play, snapshot, keep playing, then die with SIGKILL mid-game."""
+    from sharding import LocalGameStore
+    from journal import get_writer
+
+    rng = random.Random(7)
+    store = LocalGameStore(call_interval=0, snapshot_interval=0)
+    for _ in range(GAMES):
+        game_id = store.create(rng.choice([10, 20, 50, 100]))
+        store[game_id].min_players = 3
+        for user_id in range(1, rng.randint(3, 12)):
+            store.apply(game_id, 'add_player', user_id)
+    for _ in range(10):
+        play_round(store, rng)
+
+    store.snapshot()
+
+    # State after the snapshot only survives through the journal tail
+    for _ in range(10):
+        play_round(store, rng)
+    for _ in range(GAMES // 10):
+        game_id = store.create(10)
+        store.apply(game_id, 'add_player', 1)
+
+    get_writer().flush()
+    dump_state(store, state_path)
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def restore_child(state_path):
+    """Start a fresh store, which restores from snapshot plus journal."""
+    from sharding import LocalGameStore
+
+    started = time.perf_counter()
+    store = LocalGameStore(call_interval=0, snapshot_interval=0)
+    logger.info("Restored %d games in %.3fs", len(store), time.perf_counter() - started)
+    dump_state(store, state_path)
+
+
+def test_recovery():
+    """Kill a process mid-game and check that a restart restores identical state."""
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, JOURNAL_DIR=os.path.join(tmp, "journals"),
+                   SNAPSHOT_DIR=os.path.join(tmp, "snapshots"))
+        before = os.path.join(tmp, "before.json")
+        after = os.path.join(tmp, "after.json")
+
+        crashed = subprocess.run([sys.executable, __file__, "--crash", before], env=env)
+        assert crashed.returncode == -signal.SIGKILL, f"child exited with {crashed.returncode}"
+
+        restored = subprocess.run([sys.executable, __file__, "--restore", after], env=env)
+        assert restored.returncode == 0
+
+        with open(before) as f:
+            expected = json.load(f)
+        with open(after) as f:
+            actual = json.load(f)
+
+        assert expected.keys() == actual.keys(), "restored a different set of games"
+        mismatched = [game_id for game_id in expected if expected[game_id] != actual[game_id]]
+        assert not mismatched, f"games restored with different state: {mismatched[:10]}"
+        logger.info("✅ %d in-flight games restored identically", len(expected))
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    if len(sys.argv) == 3 and sys.argv[1] == "--crash":
+        crash_child(sys.argv[2])
+    elif len(sys.argv) == 3 and sys.argv[1] == "--restore":
+        restore_child(sys.argv[2])
+    else:
+        test_recovery()
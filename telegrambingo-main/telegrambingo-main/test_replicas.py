@@ -0,0 +1,128 @@
+import logging
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import func
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def replicate(primary, replica, metadata):
+    """Copy every table from the primary to the replica, standing in for replication."""
+    with primary.connect() as source, replica.begin() as target:
+        for table in reversed(metadata.sorted_tables):
+            target.execute(table.delete())
+        for table in metadata.sorted_tables:
+            rows = [dict(row._mapping) for row in source.execute(table.select())]
+            if rows:
+                target.execute(table.insert(), rows)
+
+
+def test_replicas():
+    """Route reads to a replica, keep a user's reads on the primary after their write, and fall back on lag."""
+    from database import REPLICA, create_db_app, db
+    from migrate import upgrade
+    from models import Transaction, User
+    import replicas
+
+    app = create_db_app(__name__, "bot")
+    with app.app_context():
+        upgrade()
+        primary, replica = db.engine, db.engines[REPLICA]
+        with replica.begin() as conn:
+            db.metadata.create_all(conn)
+
+        def telegram_ids(key=None):
+            with replicas.replica_reads(key) as used:
+                ids = {user.telegram_id for user in User.query.all()}
+            db.session.remove()
+            return used, ids
+
+        # No heartbeat on the replica yet: everything reads from the primary
+        assert replicas.check_lag() is None
+        assert not replicas.replica_ok()
+
+        db.session.add(User(telegram_id=1001, username="existing"))
+        db.session.commit()
+        replicate(primary, replica, db.metadata)
+        lag = replicas.check_lag()
+        assert lag is not None and lag <= replicas.REPLICA_MAX_LAG, lag
+        logger.info("Replica %.3fs behind after replicating", lag)
+
+        # A write the replica hasn't seen: other users' reads miss it, so they were served by the replica
+        db.session.add(User(telegram_id=1002, username="new"))
+        db.session.commit()
+        used, ids = telegram_ids(key=1001)
+        assert used and ids == {1001}, (used, ids)
+        logger.info("✅ Reads inside replica_reads() go to the replica")
+
+        # The writer reads their own write from the primary
+        replicas.mark_written(1002)
+        used, ids = telegram_ids(key=1002)
+        assert not used and ids == {1001, 1002}, (used, ids)
+        logger.info("✅ A user's reads stay on the primary after their own write")
+
+        # Writes inside a replica scope still go to the primary
+        with replicas.replica_reads(1001):
+            user = User.query.filter_by(telegram_id=1001).first()
+            db.session.add(Transaction(user_id=user.id, type='deposit', amount=50, status='pending'))
+            db.session.commit()
+        with primary.connect() as conn:
+            assert conn.execute(Transaction.__table__.select()).first() is not None
+        with replica.connect() as conn:
+            assert conn.execute(Transaction.__table__.select()).first() is None
+        db.session.remove()
+        logger.info("✅ Writes inside a replica scope go to the primary")
+
+        # Replication stops: once the lag exceeds REPLICA_MAX_LAG, reads fall back to the primary
+        time.sleep(replicas.REPLICA_MAX_LAG + 0.1)
+        lag = replicas.check_lag()
+        used, ids = telegram_ids(key=1001)
+        assert lag > replicas.REPLICA_MAX_LAG and not used and ids == {1001, 1002}, (lag, used, ids)
+        logger.info("✅ Reads fall back to the primary at %.2fs lag", lag)
+
+        replicate(primary, replica, db.metadata)
+        replicas.check_lag()
+        used, ids = telegram_ids(key=1001)
+        assert used and ids == {1001, 1002}, (used, ids)
+        logger.info("✅ Reads return to the replica once it catches up")
+
+        # Another process (the web app's deposit webhook) confirms the deposit; this one never marked the user
+        replicas._written.clear()
+        with primary.begin() as conn:
+            conn.execute(User.__table__.update().values(last_write_at=None))
+        replicate(primary, replica, db.metadata)
+        replicas.check_lag()
+        tx = Transaction.query.filter_by(status='pending').one()
+        tx.status = 'completed'
+        user = db.session.get(User, tx.user_id)
+        user.balance = (user.balance or 0) + tx.amount
+        db.session.commit()
+        db.session.remove()
+        for telegram_id, sticky in ((1001, True), (1002, False)):
+            user = User.query.filter_by(telegram_id=telegram_id).one()
+            with replicas.user_reads(user) as used:
+                deposited = db.session.query(func.sum(Transaction.amount)) \
+                    .filter(Transaction.user_id == user.id, Transaction.status == 'completed').scalar()
+            db.session.remove()
+            assert used is not sticky, (telegram_id, used)
+            assert deposited == (50 if sticky else None), (telegram_id, deposited)
+        logger.info("✅ A write from another process keeps that user's reads on the primary")
+
+
+if __name__ == "__main__":
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+    os.environ.setdefault("REPLICA_MAX_LAG", "0.5")
+    with tempfile.TemporaryDirectory() as tmp:
+        # Two SQLite files unless both URLs are given, e.g. two scratch PostgreSQL databases
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp, 'primary.db')}")
+        os.environ.setdefault("DATABASE_REPLICA_URL", f"sqlite:///{os.path.join(tmp, 'replica.db')}")
+        test_replicas()
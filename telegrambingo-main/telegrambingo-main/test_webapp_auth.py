@@ -0,0 +1,74 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Set before the app is imported, so the test also runs under a plain pytest
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+TMP = tempfile.mkdtemp(prefix="bingo-auth-")
+os.environ.setdefault("TELEGRAM_BOT_TOKEN", "123:test")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(TMP, 'bingo.db')}")
+os.environ.setdefault("JOURNAL_DIR", os.path.join(TMP, "journals"))
+os.environ.setdefault("SNAPSHOT_DIR", os.path.join(TMP, "snapshots"))
+
+
+def sign(fields: dict, token: str) -> str:
+    """initData as Telegram would sign it for the bot with this token."""
+    check = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    secret = hmac.digest(b"WebAppData", token.encode(), "sha256")
+    return urlencode({**fields, "hash": hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()})
+
+
+def test_webapp_auth():
+    """Only Telegram-signed WebApp data links a web session to a registered user."""
+    from app import app, linked_users
+    from database import db
+    from migrate import upgrade
+    from models import User
+
+    token = os.environ["TELEGRAM_BOT_TOKEN"]
+    with app.app_context():
+        upgrade()
+        user = User(telegram_id=4242, username="player")
+        db.session.add(user)
+        db.session.commit()
+        user_id = user.id
+
+    client = app.test_client()
+    client.post('/game/create', json={'entry_price': 10, 'user_id': user_id})
+    with client.session_transaction() as session:
+        assert session['user_id'] < 0, session['user_id']
+    logger.info("✅ A user_id in the request body is ignored")
+
+    fields = {"auth_date": str(int(time.time())), "user": json.dumps({"id": 4242, "first_name": "P"})}
+    forged = {**fields, "user": json.dumps({"id": 4243, "first_name": "P"})}
+    stale = {**fields, "auth_date": str(int(time.time()) - 10 ** 6)}
+    for init_data in (sign(fields, "999:other"), sign(stale, token),
+                      sign(fields, token).replace("4242", "4243"), urlencode(forged), None):
+        response = client.post('/auth/telegram', json={'init_data': init_data})
+        assert response.status_code == 403, (init_data, response.status_code)
+    logger.info("✅ Forged, stale and foreign-bot initData is refused")
+
+    response = client.post('/auth/telegram', json={'init_data': sign(fields, token)})
+    assert response.status_code == 200 and response.json['registered'], response.json
+    with client.session_transaction() as session:
+        assert session['user_id'] == user_id
+    with app.app_context():
+        assert linked_users([user_id, -5]) == {user_id}
+    logger.info("✅ Signed initData signs the registered user in")
+
+
+if __name__ == "__main__":
+    test_webapp_auth()
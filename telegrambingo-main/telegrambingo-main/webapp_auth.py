@@ -0,0 +1,34 @@
+import hashlib
+import hmac
+import json
+import time
+from typing import Optional
+from urllib.parse import parse_qsl
+
+from config import TELEGRAM_BOT_TOKEN, WEBAPP_AUTH_MAX_AGE
+
+
+def verify_init_data(init_data: str, max_age: float = WEBAPP_AUTH_MAX_AGE,
+                     token: Optional[str] = TELEGRAM_BOT_TOKEN) -> Optional[dict]:
+    """The Telegram user a WebApp initData string was signed for, or None if it does not verify.
+
+    Telegram signs initData with a key derived from the bot token, so only the
+    bot's own WebApp buttons can produce it; see
+    https://core.telegram.org/bots/webapps#validating-data-received-via-the-mini-app
+    """
+    if not token or not isinstance(init_data, str):
+        return None
+    fields = dict(parse_qsl(init_data, keep_blank_values=True))
+    received = fields.pop("hash", "")
+    check = "\n".join(f"{key}={value}" for key, value in sorted(fields.items()))
+    secret = hmac.digest(b"WebAppData", token.encode(), "sha256")
+    expected = hmac.new(secret, check.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, received):
+        return None
+    try:
+        if time.time() - int(fields.get("auth_date", 0)) > max_age:
+            return None
+        user = json.loads(fields.get("user", ""))
+    except ValueError:
+        return None
+    return user if isinstance(user, dict) and isinstance(user.get("id"), int) else None
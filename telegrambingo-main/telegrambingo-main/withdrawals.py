@@ -0,0 +1,139 @@
+import html
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import and_, func, select, update
+
+from config import MIN_GAMES_FOR_WITHDRAWAL, MIN_WINS_FOR_WITHDRAWAL, WITHDRAWAL_BATCH_LIMIT
+from database import db
+from models import Transaction, User
+from notifications import notify
+
+logger = logging.getLogger(__name__)
+
+
+def _pending(ids: List[int]):
+    return and_(Transaction.id.in_(ids), Transaction.type == 'withdraw', Transaction.status == 'pending')
+
+
+def _lock_pending(ids: Iterable[int]) -> List[int]:
+    """Lock the still-pending withdrawals among `ids` and return their ids."""
+    ids = list(dict.fromkeys(int(i) for i in ids))
+    if len(ids) > WITHDRAWAL_BATCH_LIMIT:
+        raise ValueError(f"At most {WITHDRAWAL_BATCH_LIMIT} withdrawals can be processed at once")
+    if not ids:
+        return []
+    return db.session.execute(
+        select(Transaction.id).where(_pending(ids)).order_by(Transaction.id).with_for_update()
+    ).scalars().all()
+
+
+def approve_withdrawals(ids: Iterable[int]) -> Dict[str, List[int]]:
+    """Approve a batch of pending withdrawals in one transaction.
+
+    Each user's requested withdrawals in the batch are approved together or not
+    at all: the balance is debited by a single UPDATE that also checks the
+    balance covers the total and the user meets the games/wins minimums.
+    Returns the approved and skipped transaction ids.
+    """
+    ids = list(ids)
+    try:
+        locked = _lock_pending(ids)
+        approved = []
+        totals = defaultdict(float)
+        messages = []
+        if locked:
+            requested = select(func.sum(-Transaction.amount)).where(
+                Transaction.user_id == User.id, Transaction.id.in_(locked)
+            ).scalar_subquery()
+            debited = db.session.execute(
+                update(User)
+                .where(
+                    User.id.in_(select(Transaction.user_id).where(Transaction.id.in_(locked))),
+                    User.balance >= requested,
+                    func.coalesce(User.games_played, 0) >= MIN_GAMES_FOR_WITHDRAWAL,
+                    func.coalesce(User.games_won, 0) >= MIN_WINS_FOR_WITHDRAWAL,
+                )
+                .values(balance=User.balance - requested, total_withdrawn=User.total_withdrawn + requested,
+                        last_write_at=datetime.utcnow())
+                .returning(User.id, User.telegram_id, User.balance)
+                .execution_options(synchronize_session=False)
+            ).all()
+            users = {row.id: row for row in debited}
+            if users:
+                approved = db.session.execute(
+                    update(Transaction)
+                    .where(Transaction.id.in_(locked), Transaction.user_id.in_(users))
+                    .values(status='completed', withdrawal_status='approved',
+                            completed_at=datetime.utcnow())
+                    .returning(Transaction.id, Transaction.user_id, Transaction.amount)
+                    .execution_options(synchronize_session=False)
+                ).all()
+            # One message per user, however many of their withdrawals were approved
+            for row in approved:
+                totals[row.user_id] -= row.amount
+            messages = [
+                (users[user_id].telegram_id,
+                 f"✅ <b>Withdrawal Approved!</b>\n\n"
+                 f"Amount: {total:.2f} birr\n"
+                 f"New Balance: {users[user_id].balance:.2f} birr")
+                for user_id, total in totals.items()
+            ]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    notify(messages)
+
+    approved_ids = sorted(row.id for row in approved)
+    logger.info("Approved %d of %d withdrawals for %d users", len(approved_ids), len(ids), len(totals))
+    return {'approved': approved_ids, 'skipped': sorted(set(map(int, ids)) - set(approved_ids))}
+
+
+def reject_withdrawals(ids: Iterable[int], note: Optional[str] = None) -> Dict[str, List[int]]:
+    """Reject a batch of pending withdrawals; balances are left untouched."""
+    ids = list(ids)
+    reason = f"\nReason: {html.escape(note)}" if note else ""
+    try:
+        locked = _lock_pending(ids)
+        rejected = []
+        messages = []
+        if locked:
+            rejected = db.session.execute(
+                update(Transaction)
+                .where(Transaction.id.in_(locked))
+                .values(status='failed', withdrawal_status='rejected', admin_note=note,
+                        completed_at=datetime.utcnow())
+                .returning(Transaction.id, Transaction.user_id)
+                .execution_options(synchronize_session=False)
+            ).all()
+            chats = dict(db.session.execute(
+                update(User)
+                .where(User.id.in_({row.user_id for row in rejected}))
+                .values(last_write_at=datetime.utcnow())
+                .returning(User.id, User.telegram_id)
+                .execution_options(synchronize_session=False)
+            ).all())
+            counts = defaultdict(int)
+            for row in rejected:
+                counts[row.user_id] += 1
+            # Built before the commit, so nothing can fail between rejecting and notifying
+            messages = [
+                (chats[user_id],
+                 f"❌ <b>Withdrawal Rejected</b>\n\n"
+                 f"{count} withdrawal request{'s' if count > 1 else ''} rejected.{reason}")
+                for user_id, count in counts.items()
+            ]
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    notify(messages)
+
+    rejected_ids = sorted(row.id for row in rejected)
+    logger.info("Rejected %d of %d withdrawals", len(rejected_ids), len(ids))
+    return {'rejected': rejected_ids, 'skipped': sorted(set(map(int, ids)) - set(rejected_ids))}